@@ -0,0 +1,82 @@
+import numpy as np
+import pybullet as p
+
+
+class ContactCache(object):
+    """
+    Snapshot of all the contact points of a physics client, read with a single p.getContactPoints() call.
+
+    The body and link indices of the contacts are kept as NumPy arrays, so any number of predicates (e.g. "the
+    fingers touch the cube", "the robot touches the table") are answered with masks over the same snapshot
+    instead of one p.getContactPoints() query each. The snapshot must be taken again with `update` whenever the
+    simulation advances, typically once per environment step, after the arm has settled.
+    """
+
+    def __init__(self, physicsClient):
+        """
+        Arguments:
+            physicsClient: Int, the PyBullet physics client
+
+        Attributes:
+            body_a, body_b: Array, the IDs of the two bodies of each contact point
+            link_a, link_b: Array, the link indices of the two bodies of each contact point, -1 for the base
+            normal_force: Array, the normal force of each contact point
+        """
+        self.physicsClient = physicsClient
+        self.clear()
+
+    def clear(self):
+        self.body_a = self.body_b = self.link_a = self.link_b = np.empty(0, dtype=np.int64)
+        self.normal_force = np.empty(0)
+
+    def update(self):
+        """
+        Takes a new snapshot of the contact points of the last simulation step.
+        """
+        points = p.getContactPoints(physicsClientId=self.physicsClient)
+        if not points:
+            self.clear()
+            return
+        indices = np.array([point[1:5] for point in points], dtype=np.int64)
+        self.body_a, self.body_b, self.link_a, self.link_b = indices.T
+        self.normal_force = np.array([point[9] for point in points])
+
+    def __len__(self):
+        return len(self.body_a)
+
+    def contact_links(self, body, other=None):
+        """
+        Returns the link indices of `body` and of `other` for each contact point between them, as two arrays.
+        Each contact point is stored once with either body first, both orders are considered.
+
+        Parameters:
+        - body: The ID of the body
+        - other: The ID of the other body, None for any body
+        """
+        forward = self.body_a == body
+        backward = self.body_b == body
+        if other is not None:
+            forward &= self.body_b == other
+            backward &= self.body_a == other
+        links = np.concatenate([self.link_a[forward], self.link_b[backward]])
+        other_links = np.concatenate([self.link_b[forward], self.link_a[backward]])
+        return links, other_links
+
+    def touching(self, body, other=None, links=None, other_links=None):
+        """
+        Returns True if `body` touches `other` (any body if None), optionally only through the given `links` of
+        `body` and the given `other_links` of `other`.
+        """
+        contact_links, contact_other_links = self.contact_links(body, other)
+        mask = np.ones(len(contact_links), dtype=bool)
+        if links is not None:
+            mask &= np.isin(contact_links, links)
+        if other_links is not None:
+            mask &= np.isin(contact_other_links, other_links)
+        return bool(mask.any())
+
+    def touching_links(self, body, other=None):
+        """
+        Returns the sorted unique link indices of `body` that touch `other` (any body if None).
+        """
+        return np.unique(self.contact_links(body, other)[0])
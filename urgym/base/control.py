@@ -0,0 +1,35 @@
+import math
+import numpy as np
+
+
+def move_ee_at_constant_speed(robot, settle_detector, displacement, orientation, ticks, tick_substeps):
+    """
+    Moves the end effector of a robot by `displacement` with the 'cartesian_velocity' control, during `ticks`
+    velocity commands of `tick_substeps` substeps each, rotating it towards `orientation`, and then stops it.
+
+    Each tick runs a whole number of p.stepSimulation() calls, so it lasts more than `tick_substeps` substeps
+    when they are not a multiple of the substeps per call (see `configure_substeps`). The velocities are computed
+    from the duration actually simulated, and the substeps of the whole motion are recorded in `settle_detector`.
+
+    Parameters:
+    - robot: The robot, whose `step_simulation` is hooked by the environment
+    - settle_detector: The `SettleDetector` of the robot, which gives the substeps per call and their duration
+    - displacement: The displacement (dx, dy, dz) of the end effector, in meters
+    - orientation: The target orientation (qx, qy, qz, qw) of the end effector
+    - ticks: The number of velocity commands
+    - tick_substeps: The minimum number of substeps of each command
+
+    Returns:
+    None
+    """
+    calls = math.ceil(tick_substeps / settle_detector.substeps_per_call)
+    substeps = ticks * calls * settle_detector.substeps_per_call
+    duration = substeps * settle_detector.time_step
+    linear_velocity = np.asarray(displacement, dtype=np.float64) / duration
+    for _ in range(ticks):
+        angular_velocity = robot.get_orientation_error(orientation) / duration
+        robot.move_ee(np.concatenate([linear_velocity, angular_velocity]), 'cartesian_velocity')
+        for _ in range(calls):
+            robot.step_simulation()
+    robot.move_ee(np.zeros(6), 'cartesian_velocity')
+    settle_detector.record(substeps)
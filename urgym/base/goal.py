@@ -0,0 +1,73 @@
+import numpy as np
+from gymnasium.spaces import Box, Dict
+
+
+def info_array(info, key, dtype=None):
+    """
+    Returns the values of `key` of the info of one or many transitions as an array.
+
+    Parameters:
+    - info: A single info dict, a dict of arrays (vector environments) or a sequence/array of info dicts
+            (e.g. the infos passed by hindsight replay buffers)
+    - key: The key to read
+    - dtype: The dtype of the array, None to infer it
+    """
+    if isinstance(info, dict):
+        return np.asarray(info[key], dtype=dtype)
+    return np.array([item[key] for item in info], dtype=dtype)
+
+
+class GoalConditionedMixin(object):
+    """
+    Turns an environment with flat observations into a goal-conditioned one, following the Gymnasium-Robotics
+    GoalEnv interface used by hindsight experience replay.
+
+    The observations become dicts with the original flat `observation`, the `achieved_goal` and the `desired_goal`,
+    and the rewards can be recomputed for any goals with the vectorized `compute_reward(achieved_goal, desired_goal,
+    info)`. The parts of the reward that do not depend on the goals (contacts, state of the robot) are added to the
+    info of each step by `get_goal_info`, so relabeled transitions keep them.
+
+    It must come before the environment class in the bases, which must call `setup_goal_spaces` at the end of
+    its __init__ and build its observations with `get_observation`.
+    """
+
+    GOAL_SIZE = 3
+
+    def setup_goal_spaces(self):
+        goal_space = Box(low=-np.inf, high=np.inf, shape=(self.GOAL_SIZE,), dtype=np.float64)
+        self.observation_space = Dict(observation=self.observation_space, achieved_goal=goal_space, desired_goal=goal_space)
+
+    def get_observation(self):
+        return {'observation': super().get_observation(),
+                'achieved_goal': np.array(self.get_achieved_goal(), dtype=np.float64),
+                'desired_goal': np.array(self.get_desired_goal(), dtype=np.float64)}
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = super().step(action)
+        info.update(self.get_goal_info())
+        return observation, reward, terminated, truncated, info
+
+    def get_achieved_goal(self):
+        raise NotImplementedError
+
+    def get_desired_goal(self):
+        raise NotImplementedError
+
+    def get_goal_info(self):
+        """
+        Returns the dict of the terms of the reward of the last step that do not depend on the goals.
+        """
+        raise NotImplementedError
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        """
+        Returns the rewards of transitions for the given goals, as an array of shape (...) for goals of
+        shape (..., GOAL_SIZE). The rewards of `step` are recovered with the goals of its observation.
+        """
+        raise NotImplementedError
+
+    def compute_terminated(self, achieved_goal, desired_goal, info):
+        raise NotImplementedError
+
+    def compute_truncated(self, achieved_goal, desired_goal, info):
+        return np.zeros(np.shape(achieved_goal)[:-1], dtype=bool) # Managed by the environment automatically
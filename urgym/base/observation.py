@@ -0,0 +1,60 @@
+import numpy as np
+from gymnasium.spaces import Box
+
+
+class ObservationBuffer(object):
+    """
+    Flat observation vector with a fixed layout, written in place.
+
+    The layout is a list of named fields and their sizes, e.g. [('ee_position', 3), ('cube_position', 3)].
+    Each field is a view over the same array, so the parts of an observation are written directly into it
+    without building temporary arrays. The array can be replaced by a slice of a larger buffer with `bind`,
+    e.g. the row of a vector environment buffer, so the observations end up where they are consumed.
+
+    The same array is handed back on every observation, it must be copied if it has to be kept.
+    """
+
+    def __init__(self, layout, dtype=np.float32, out=None):
+        """
+        Arguments:
+            layout: List of (name, size) tuples, the fields of the observation in order
+            dtype: The dtype of the observation
+            out: Array of shape (size,) to write into, a new one is allocated if None
+
+        Attributes:
+            size: Int, the total number of items of the observation
+            slices: Dict, the slice of each field
+            array: Array, the observation
+            fields: Dict, the view of each field over `array`
+        """
+        self.layout = list(layout)
+        self.dtype = np.dtype(dtype)
+        self.slices = {}
+        start = 0
+        for name, size in self.layout:
+            self.slices[name] = slice(start, start + size)
+            start += size
+        self.size = start
+        self.bind(np.zeros(self.size, dtype=self.dtype) if out is None else out)
+
+    def bind(self, out):
+        """
+        Makes the observation be written into `out`, an array of shape (size,) and of the same dtype.
+        """
+        assert out.shape == (self.size,) and out.dtype == self.dtype, \
+            f"Expected an array of shape ({self.size},) and dtype {self.dtype}, got {out.shape} and {out.dtype}"
+        self.array = out
+        self.fields = {name: out[field_slice] for name, field_slice in self.slices.items()}
+
+    def __setitem__(self, name, value):
+        self.fields[name][:] = value
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def space(self, space):
+        """
+        Returns a copy of a Box space with the dtype of the buffer, checking that it matches the layout.
+        """
+        assert space.shape == (self.size,), f"The space {space} does not match the layout of {self.size} items"
+        return Box(low=space.low.astype(self.dtype), high=space.high.astype(self.dtype), dtype=self.dtype)
@@ -0,0 +1,70 @@
+from urgym.base.snapshot import reset_body
+
+
+class BodyPool(object):
+    """
+    Keeps the bodies of a scene alive between episodes, so they are placed again instead of being removed
+    and created (or loaded from an URDF file) on every reset.
+
+    Bodies are grouped by kind (e.g. 'cube', 'ball'). `release` gives back all the bodies of some kinds and
+    moves them to a parking area away from the scene, and `acquire` places a released body of the requested
+    kind at the given pose, at rest, only creating a new one when none is available. Released bodies are
+    handed back in the same order, so the same body plays the same role episode after episode.
+    """
+
+    PARKING_ORIGIN = (-20.0, -20.0, 0.5)
+    PARKING_SPACING = 1.0
+
+    def __init__(self, physicsClient):
+        """
+        Arguments:
+            physicsClient: Int, the PyBullet physics client the bodies live in
+
+        Attributes:
+            used: Dict, the ids of the bodies in use, by kind
+            free: Dict, the ids of the released bodies, by kind
+        """
+        self.physicsClient = physicsClient
+        self.used = {}
+        self.free = {}
+
+    def acquire(self, kind, position, orientation, create):
+        """
+        Returns a body of the given kind at the given pose.
+
+        Parameters:
+        - kind: The kind of the body
+        - position: The position (x, y, z)
+        - orientation: The orientation quaternion (x, y, z, w)
+        - create: Function without arguments that creates a new body at the given pose and returns its id,
+          only called when there is no released body of that kind
+
+        Returns:
+        The ID of the body
+        """
+        free = self.free.get(kind)
+        if free:
+            body_id = free.pop(0)
+            reset_body(body_id, position, orientation, self.physicsClient)
+        else:
+            body_id = create()
+        self.used.setdefault(kind, []).append(body_id)
+        return body_id
+
+    def release(self, *kinds):
+        """
+        Releases all the bodies of the given kinds, or of every kind if none is given, and parks them.
+        """
+        for kind in (kinds or list(self.used)):
+            released = self.used.pop(kind, [])
+            self.free[kind] = self.free.get(kind, []) + released
+        self._park()
+
+    def _park(self):
+        # Released bodies are left at rest in a row away from the scene
+        index = 0
+        for free in self.free.values():
+            for body_id in free:
+                position = [self.PARKING_ORIGIN[0] - index * self.PARKING_SPACING, self.PARKING_ORIGIN[1], self.PARKING_ORIGIN[2]]
+                reset_body(body_id, position, [0, 0, 0, 1], self.physicsClient)
+                index += 1
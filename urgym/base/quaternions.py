@@ -0,0 +1,143 @@
+"""
+Vectorized quaternion and rotation operations in NumPy.
+
+Quaternions are stored as (x, y, z, w), like in PyBullet, in arrays of shape (..., 4). Every function works on a
+single quaternion of shape (4,) or on any batch of them, broadcasting the batch dimensions, without any call to
+PyBullet. Euler angles are (roll, pitch, yaw) with the conventions of `p.getQuaternionFromEuler` and
+`p.getEulerFromQuaternion`, i.e. the rotation Rz(yaw) @ Ry(pitch) @ Rx(roll).
+"""
+import numpy as np
+
+
+def normalize(quaternions):
+    """
+    Returns the unit quaternions of `quaternions`. Null quaternions become the identity (0, 0, 0, 1).
+    """
+    quaternions = np.asarray(quaternions, dtype=np.float64)
+    norms = np.linalg.norm(quaternions, axis=-1, keepdims=True)
+    identity = np.array([0.0, 0.0, 0.0, 1.0])
+    return np.where(norms > 0, quaternions / np.where(norms > 0, norms, 1.0), identity)
+
+
+def conjugate(quaternions):
+    """
+    Returns the conjugates of `quaternions`, the inverse rotations of unit quaternions.
+    """
+    return np.asarray(quaternions, dtype=np.float64) * np.array([-1.0, -1.0, -1.0, 1.0])
+
+
+def multiply(quaternions1, quaternions2):
+    """
+    Returns the Hamilton products quaternions1 * quaternions2, the rotation quaternions2 followed by quaternions1.
+    """
+    x1, y1, z1, w1 = np.moveaxis(np.asarray(quaternions1, dtype=np.float64), -1, 0)
+    x2, y2, z2, w2 = np.moveaxis(np.asarray(quaternions2, dtype=np.float64), -1, 0)
+    return np.stack([w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2,
+                     w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2,
+                     w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2], axis=-1)
+
+
+def rotate(quaternions, vectors):
+    """
+    Rotates the 3D `vectors` of shape (..., 3) by the unit `quaternions`.
+    """
+    quaternions = np.asarray(quaternions, dtype=np.float64)
+    vectors = np.asarray(vectors, dtype=np.float64)
+    xyz, w = quaternions[..., :3], quaternions[..., 3:]
+    # v' = v + 2w (q x v) + 2 q x (q x v), with q the vector part
+    t = 2 * np.cross(xyz, vectors)
+    return vectors + w * t + np.cross(xyz, t)
+
+
+def to_matrix(quaternions):
+    """
+    Returns the rotation matrices of shape (..., 3, 3) of the unit `quaternions`.
+    """
+    x, y, z, w = np.moveaxis(np.asarray(quaternions, dtype=np.float64), -1, 0)
+    return np.stack([np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+                     np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+                     np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1)], axis=-2)
+
+
+def from_euler(eulers):
+    """
+    Returns the quaternions of the Euler angles (roll, pitch, yaw) of shape (..., 3), like `p.getQuaternionFromEuler`.
+    """
+    half = np.asarray(eulers, dtype=np.float64) / 2
+    cr, cp, cy = np.moveaxis(np.cos(half), -1, 0)
+    sr, sp, sy = np.moveaxis(np.sin(half), -1, 0)
+    return np.stack([sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy,
+                     cr * cp * cy + sr * sp * sy], axis=-1)
+
+
+def to_euler(quaternions):
+    """
+    Returns the Euler angles (roll, pitch, yaw) of shape (..., 3) of the unit `quaternions`, like
+    `p.getEulerFromQuaternion`, including its handling of the gimbal lock at pitch = +-pi/2.
+    """
+    x, y, z, w = np.moveaxis(np.asarray(quaternions, dtype=np.float64), -1, 0)
+    sin_pitch = -2 * (x * z - w * y)
+    roll = np.arctan2(2 * (y * z + w * x), w * w - x * x - y * y + z * z)
+    pitch = np.arcsin(np.clip(sin_pitch, -1.0, 1.0))
+    yaw = np.arctan2(2 * (x * y + w * z), w * w + x * x - y * y - z * z)
+
+    # Gimbal lock: the roll is set to zero and the whole rotation around z goes to the yaw
+    lock_down, lock_up = sin_pitch <= -0.99999, sin_pitch >= 0.99999
+    locked = lock_down | lock_up
+    roll = np.where(locked, 0.0, roll)
+    pitch = np.where(lock_down, -np.pi / 2, np.where(lock_up, np.pi / 2, pitch))
+    yaw = np.where(lock_down, 2 * np.arctan2(x, -y), np.where(lock_up, 2 * np.arctan2(-x, y), yaw))
+    return np.stack([roll, pitch, yaw], axis=-1)
+
+
+def from_axis_angle(axes, angles):
+    """
+    Returns the quaternions of the rotations of `angles` (shape (...)) around `axes` (shape (..., 3)), which do not
+    need to be unit vectors. Null axes are replaced by the x axis, like `p.getQuaternionFromAxisAngle`.
+    """
+    axes = np.asarray(axes, dtype=np.float64)
+    half = np.asarray(angles, dtype=np.float64)[..., None] / 2
+    norms = np.linalg.norm(axes, axis=-1, keepdims=True)
+    axes = np.where(norms > 0, axes / np.where(norms > 0, norms, 1.0), np.array([1.0, 0.0, 0.0]))
+    xyz = axes * np.sin(half)
+    return np.concatenate([xyz, np.broadcast_to(np.cos(half), xyz.shape[:-1] + (1,))], axis=-1)
+
+
+def to_axis_angle(quaternions):
+    """
+    Returns the unit axes of shape (..., 3) and the angles in [0, 2 pi] of shape (...) of the unit `quaternions`,
+    like `p.getAxisAngleFromQuaternion`. The axis of null rotations is the x axis.
+    """
+    quaternions = np.asarray(quaternions, dtype=np.float64)
+    w = np.clip(quaternions[..., 3], -1.0, 1.0)
+    angles = 2 * np.arccos(w)
+    sin_half = np.sqrt(1 - w * w)[..., None]
+    valid = sin_half > 1e-7
+    axes = np.where(valid, quaternions[..., :3] / np.where(valid, sin_half, 1.0), np.array([1.0, 0.0, 0.0]))
+    return axes, angles
+
+
+def slerp(quaternions1, quaternions2, fractions):
+    """
+    Spherical linear interpolation between the unit quaternions `quaternions1` (fraction 0) and `quaternions2`
+    (fraction 1) along the shortest path. `fractions` has shape (...) and broadcasts with the quaternions.
+    """
+    q1 = np.asarray(quaternions1, dtype=np.float64)
+    q2 = np.asarray(quaternions2, dtype=np.float64)
+    fractions = np.asarray(fractions, dtype=np.float64)[..., None]
+    dot = np.sum(q1 * q2, axis=-1, keepdims=True)
+    # q and -q are the same rotation, take the closest one
+    q2 = np.where(dot < 0, -q2, q2)
+    dot = np.minimum(np.abs(dot), 1.0)
+
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    # Nearly identical rotations are interpolated linearly to avoid dividing by sin(theta) ~ 0
+    linear = sin_theta < 1e-6
+    safe_sin_theta = np.where(linear, 1.0, sin_theta)
+    weights1 = np.where(linear, 1 - fractions, np.sin((1 - fractions) * theta) / safe_sin_theta)
+    weights2 = np.where(linear, fractions, np.sin(fractions * theta) / safe_sin_theta)
+    return normalize(weights1 * q1 + weights2 * q2)
@@ -1,18 +1,24 @@
 import pybullet as p
+import numpy as np
 import math
 from collections import namedtuple
 import os
+from urgym.base import ur5_kinematics
 
 class RobotBase(object):
     """
     The base class for robots
     """
 
-    def __init__(self, pos, ori):
+    # Damping of the Jacobian inverse of the 'cartesian_velocity' control, keeps the joint velocities bounded near singularities
+    CARTESIAN_VELOCITY_DAMPING = 0.05
+
+    def __init__(self, pos, ori, physicsClient=0):
         """
         Arguments:
             pos: [x y z]
             ori: [r p y]
+            physicsClient: Int, the PyBullet physics client the robot lives in
 
         Attributes:
             id: Int, the ID of the robot
@@ -26,15 +32,36 @@ class RobotBase(object):
             ---
             For null-space IK
             ---
-            arm_lower_limits: List, the lower limits for all controllable joints on the arm
-            arm_upper_limits: List
-            arm_joint_ranges: List
+            arm_lower_limits: Array, the lower limits for all controllable joints on the arm
+            arm_upper_limits: Array
+            arm_joint_ranges: Array
             arm_rest_poses: List, the rest position for all controllable joints on the arm
 
+            arm_max_forces: Array, the maximum force of each controllable joint on the arm
+            arm_max_velocities: Array, the maximum velocity of each controllable joint on the arm
+
             gripper_range: List[Min, Max]
+            arm_target_positions: List, the joint positions last commanded to the arm, None before the first command
+            gripper_target_length: Float, the opening length last commanded to the gripper, None before the first command
+            sim_substeps: Int, the number of simulation substeps advanced by each `step_simulation` call
+            ik_solver: Str, the IK solver of the 'end' control method, 'pybullet' (iterative, p.calculateInverseKinematics)
+                or 'analytic' (closed-form, for the robots that implement `calculate_analytic_ik`)
+            ik_solves: Int, the number of `calculate_ik` calls with the analytic solver
+            ik_fallbacks: Int, the number of those calls that fell back to PyBullet, without a closed-form solution
+            ik_unreachable: Int, the number of analytic solutions of poses out of reach, the arm stretched towards them
+            ik_clipped: Int, the number of analytic solutions with joints clipped to the limits
         """
         self.base_pos = pos
         self.base_ori = p.getQuaternionFromEuler(ori)
+        self.physicsClient = physicsClient
+        self.arm_target_positions = None
+        self.gripper_target_length = None
+        self.sim_substeps = 1
+        self.ik_solver = 'pybullet'
+        self.ik_solves = 0
+        self.ik_fallbacks = 0
+        self.ik_unreachable = 0
+        self.ik_clipped = 0
 
     def load(self):
         self.__init_robot__()
@@ -45,13 +72,13 @@ class RobotBase(object):
         raise RuntimeError('`step_simulation` method of RobotBase Class should be hooked by the environment.')
 
     def __parse_joint_info__(self):
-        numJoints = p.getNumJoints(self.id)
+        numJoints = p.getNumJoints(self.id, physicsClientId=self.physicsClient)
         jointInfo = namedtuple('jointInfo', 
             ['id','name','type','damping','friction','lowerLimit','upperLimit','maxForce','maxVelocity','controllable'])
         self.joints = []
         self.controllable_joints = []
         for i in range(numJoints):
-            info = p.getJointInfo(self.id, i)
+            info = p.getJointInfo(self.id, i, physicsClientId=self.physicsClient)
             jointID = info[0]
             jointName = info[1].decode("utf-8")
             jointType = info[2]  # JOINT_REVOLUTE, JOINT_PRISMATIC, JOINT_SPHERICAL, JOINT_PLANAR, JOINT_FIXED
@@ -64,17 +91,24 @@ class RobotBase(object):
             controllable = (jointType != p.JOINT_FIXED)
             if controllable:
                 self.controllable_joints.append(jointID)
-                p.setJointMotorControl2(self.id, jointID, p.VELOCITY_CONTROL, targetVelocity=0, force=0)
             info = jointInfo(jointID,jointName,jointType,jointDamping,jointFriction,jointLowerLimit,
                             jointUpperLimit,jointMaxForce,jointMaxVelocity,controllable)
             self.joints.append(info)
 
+        # Release the default velocity motors of all the controllable joints at once
+        p.setJointMotorControlArray(self.id, self.controllable_joints, p.VELOCITY_CONTROL,
+                                    targetVelocities=[0] * len(self.controllable_joints), forces=[0] * len(self.controllable_joints),
+                                    physicsClientId=self.physicsClient)
+
         assert len(self.controllable_joints) >= self.arm_num_dofs
         self.arm_controllable_joints = self.controllable_joints[:self.arm_num_dofs]
 
-        self.arm_lower_limits = [info.lowerLimit for info in self.joints if info.controllable][:self.arm_num_dofs]
-        self.arm_upper_limits = [info.upperLimit for info in self.joints if info.controllable][:self.arm_num_dofs]
-        self.arm_joint_ranges = [info.upperLimit - info.lowerLimit for info in self.joints if info.controllable][:self.arm_num_dofs]
+        arm_joints = [self.joints[joint_id] for joint_id in self.arm_controllable_joints]
+        self.arm_lower_limits = np.array([info.lowerLimit for info in arm_joints])
+        self.arm_upper_limits = np.array([info.upperLimit for info in arm_joints])
+        self.arm_joint_ranges = self.arm_upper_limits - self.arm_lower_limits
+        self.arm_max_forces = np.array([info.maxForce for info in arm_joints])
+        self.arm_max_velocities = np.array([info.maxVelocity for info in arm_joints])
 
     def __init_robot__(self):
         raise NotImplementedError
@@ -91,10 +125,10 @@ class RobotBase(object):
         reset to rest poses
         """
         for rest_pose, joint_id in zip(self.arm_rest_poses, self.arm_controllable_joints):
-            p.resetJointState(self.id, joint_id, rest_pose)
+            p.resetJointState(self.id, joint_id, rest_pose, physicsClientId=self.physicsClient)
 
         # Wait for a few steps
-        for _ in range(10):
+        for _ in range(math.ceil(10 / self.sim_substeps)):
             self.step_simulation()
 
     def reset_gripper(self):
@@ -111,38 +145,128 @@ class RobotBase(object):
         self.move_gripper(close_length)
 
     def move_ee(self, action, control_method):
-        assert control_method in ('joint', 'end')
+        """
+        Commands the arm with one of the control methods:
+        - 'end': action is the End-Effector world pose (x, y, z, qx, qy, qz, qw), reached through IK
+        - 'joint': action is the position of each arm joint
+        - 'cartesian_velocity': action is the End-Effector world twist (vx, vy, vz, wx, wy, wz), followed with joint
+          velocities until the next command
+        """
+        assert control_method in ('joint', 'end', 'cartesian_velocity')
+        if control_method == 'cartesian_velocity':
+            self.move_ee_velocity(action)
+            return
         if control_method == 'end':
-            x, y, z, qx, qy, qz, qw = action
-            pos = (x, y, z)
-            orn = (qx, qy, qz, qw)
-            joint_poses = p.calculateInverseKinematics(self.id, self.eef_id, pos, orn,
-                                                       self.arm_lower_limits, self.arm_upper_limits, self.arm_joint_ranges, self.arm_rest_poses,
-                                                       maxNumIterations=20)
+            joint_poses = self.calculate_ik(action)
         elif control_method == 'joint':
             assert len(action) == self.arm_num_dofs
             joint_poses = action
+        self.arm_target_positions = joint_poses[:self.arm_num_dofs]
         # arm
-        for i, joint_id in enumerate(self.arm_controllable_joints):
-            p.setJointMotorControl2(self.id, joint_id, p.POSITION_CONTROL, joint_poses[i],
-                                    force=self.joints[joint_id].maxForce, maxVelocity=self.joints[joint_id].maxVelocity)
+        # p.setJointMotorControlArray() cannot limit the velocity of the joints, which changes the motion of the arm,
+        # so the commands are sent joint by joint with the precomputed limits
+        for joint_id, target, force, max_velocity in zip(self.arm_controllable_joints, joint_poses,
+                                                         self.arm_max_forces, self.arm_max_velocities):
+            p.setJointMotorControl2(self.id, joint_id, p.POSITION_CONTROL, target,
+                                    force=force, maxVelocity=max_velocity, physicsClientId=self.physicsClient)
+
+    def move_ee_velocity(self, twist):
+        """
+        Maps an End-Effector world twist (vx, vy, vz, wx, wy, wz) to arm joint velocities through the damped
+        least-squares inverse of the Jacobian, scaled down as a whole if any joint would exceed its velocity limit
+        """
+        jacobian = self.calculate_arm_jacobian()
+        damping = self.CARTESIAN_VELOCITY_DAMPING ** 2 * np.eye(6)
+        joint_velocities = jacobian.T @ np.linalg.solve(jacobian @ jacobian.T + damping, np.asarray(twist, dtype=np.float64))
+        joint_velocities /= max(1.0, np.max(np.abs(joint_velocities) / self.arm_max_velocities))
+        p.setJointMotorControlArray(self.id, self.arm_controllable_joints, p.VELOCITY_CONTROL,
+                                    targetVelocities=joint_velocities.tolist(), forces=self.arm_max_forces.tolist(),
+                                    physicsClientId=self.physicsClient)
+
+    def calculate_arm_jacobian(self):
+        """
+        Returns the 6 x `arm_num_dofs` geometric Jacobian (linear rows first) of the End-Effector at the current joints
+        """
+        joint_states = p.getJointStates(self.id, self.controllable_joints, physicsClientId=self.physicsClient)
+        positions = [joint_state[0] for joint_state in joint_states]
+        zeros = [0.0] * len(positions)
+        linear, angular = p.calculateJacobian(self.id, self.eef_id, [0, 0, 0], positions, zeros, zeros,
+                                              physicsClientId=self.physicsClient)
+        return np.vstack([linear, angular])[:, :self.arm_num_dofs]
+
+    def get_orientation_error(self, orientation):
+        """
+        Returns the rotation vector (axis * angle, in the world frame) that takes the End-Effector to the given orientation
+        """
+        current = self.get_ee_pose()[3:]
+        _, difference = p.multiplyTransforms([0, 0, 0], orientation, [0, 0, 0], p.invertTransform([0, 0, 0], current)[1])
+        axis, angle = p.getAxisAngleFromQuaternion(difference)
+        if angle > math.pi:
+            angle -= 2 * math.pi
+        return np.array(axis) * angle
+
+    def calculate_ik(self, pose):
+        """
+        Returns the arm joint positions that place the End-Effector at the given world pose (x, y, z, qx, qy, qz, qw),
+        with the solver selected by `ik_solver`. The analytic solver stretches the arm towards the poses out of reach
+        (counted in `ik_unreachable`) and clips the joints to the limits (counted in `ik_clipped`), and falls back to
+        PyBullet (counted in `ik_fallbacks`) only when `calculate_analytic_ik` returns None.
+        """
+        assert self.ik_solver in ('pybullet', 'analytic')
+        if self.ik_solver == 'analytic':
+            self.ik_solves += 1
+            joint_poses = self.calculate_analytic_ik(pose)
+            if joint_poses is not None:
+                return joint_poses
+            self.ik_fallbacks += 1
+        x, y, z, qx, qy, qz, qw = pose
+        return p.calculateInverseKinematics(self.id, self.eef_id, (x, y, z), (qx, qy, qz, qw),
+                                            self.arm_lower_limits.tolist(), self.arm_upper_limits.tolist(), self.arm_joint_ranges.tolist(), self.arm_rest_poses,
+                                            maxNumIterations=20, physicsClientId=self.physicsClient)
+
+    def calculate_analytic_ik(self, pose):
+        """
+        Closed-form IK, returns the arm joint positions within the limits, or None if it has no solution. The poses
+        out of reach are approached with the arm stretched towards them and the joints beyond the limits are clipped
+        to them, so None only comes from the robots without a closed-form solver, which always use PyBullet, or when
+        even the stretched arm has no solution. Implementations count these cases in `ik_unreachable` and `ik_clipped`.
+        """
+        return None
 
     def move_gripper(self, open_length):
         raise NotImplementedError
 
+    def resend_commands(self, arm_target_positions, gripper_target_length):
+        """
+        Sends again the given arm and gripper commands, e.g. after restoring a saved state, which does not keep them
+        """
+        if arm_target_positions is not None:
+            self.move_ee(arm_target_positions, 'joint')
+        if gripper_target_length is not None:
+            self.move_gripper(gripper_target_length)
+
+    def teleport_arm(self, joint_positions):
+        """
+        Sets the arm joints to the given positions, at rest, without simulating the motion
+        """
+        for position, joint_id in zip(joint_positions, self.arm_controllable_joints):
+            p.resetJointState(self.id, joint_id, position, targetVelocity=0, physicsClientId=self.physicsClient)
+
     def get_joint_obs(self):
-        positions = []
-        velocities = []
-        for joint_id in self.controllable_joints:
-            pos, vel, _, _ = p.getJointState(self.id, joint_id)
-            positions.append(pos)
-            velocities.append(vel)
+        joint_states = p.getJointStates(self.id, self.controllable_joints, physicsClientId=self.physicsClient)
+        positions = np.array([joint_state[0] for joint_state in joint_states])
+        velocities = np.array([joint_state[1] for joint_state in joint_states])
         return dict(positions=positions, velocities=velocities, ee_pos=self.get_ee_pose())
 
+    def get_link_poses(self, link_ids):
+        """
+        Returns the world poses (x, y, z, qx, qy, qz, qw) of the given links as an array with one row per link
+        """
+        link_states = p.getLinkStates(self.id, link_ids, physicsClientId=self.physicsClient)
+        return np.array([link_state[0] + link_state[1] for link_state in link_states])
+
     def get_ee_pose(self):
-        ee_pose = p.getLinkState(self.id, self.eef_id)
-        ee_pose = ee_pose[0] + ee_pose[1]
-        return ee_pose
+        return self.get_link_poses([self.eef_id])[0]
 
     def get_joint_states(self):
         return self.get_joint_obs()['positions'][0:6]
@@ -156,7 +280,7 @@ class Panda(RobotBase):
         self.arm_rest_poses = [0.98, 0.458, 0.31, -2.24, -0.30, 2.66, 2.32]
         current_dir = os.path.dirname(__file__)
         self.id = p.loadURDF(os.path.join(current_dir,'../urdf/panda.urdf'), self.base_pos, self.base_ori,
-                             useFixedBase=True, flags=p.URDF_ENABLE_CACHED_GRAPHICS_SHAPES)
+                             useFixedBase=True, flags=p.URDF_ENABLE_CACHED_GRAPHICS_SHAPES, physicsClientId=self.physicsClient)
         self.gripper_range = [0, 0.04]
         # create a constraint to keep the fingers centered
         c = p.createConstraint(self.id,
@@ -166,13 +290,15 @@ class Panda(RobotBase):
                                jointType=p.JOINT_GEAR,
                                jointAxis=[1, 0, 0],
                                parentFramePosition=[0, 0, 0],
-                               childFramePosition=[0, 0, 0])
-        p.changeConstraint(c, gearRatio=-1, erp=0.1, maxForce=50)
+                               childFramePosition=[0, 0, 0],
+                               physicsClientId=self.physicsClient)
+        p.changeConstraint(c, gearRatio=-1, erp=0.1, maxForce=50, physicsClientId=self.physicsClient)
 
     def move_gripper(self, open_length):
         assert self.gripper_range[0] <= open_length <= self.gripper_range[1]
-        for i in [9, 10]:
-            p.setJointMotorControl2(self.id, i, p.POSITION_CONTROL, open_length, force=20)
+        self.gripper_target_length = open_length
+        p.setJointMotorControlArray(self.id, [9, 10], p.POSITION_CONTROL, targetPositions=[open_length] * 2, forces=[20] * 2,
+                                    physicsClientId=self.physicsClient)
 
 
 class UR5Robotiq85(RobotBase):
@@ -184,7 +310,7 @@ class UR5Robotiq85(RobotBase):
         current_dir = os.path.dirname(__file__)
         print(current_dir)
         self.id = p.loadURDF(os.path.join(current_dir, '../urdf/ur5_robotiq_85.urdf'), self.base_pos, self.base_ori,
-                             useFixedBase=True, flags=p.URDF_ENABLE_CACHED_GRAPHICS_SHAPES)
+                             useFixedBase=True, flags=p.URDF_ENABLE_CACHED_GRAPHICS_SHAPES, physicsClientId=self.physicsClient)
         self.gripper_range = [0, 0.085]
     
     def __post_load__(self):
@@ -207,15 +333,46 @@ class UR5Robotiq85(RobotBase):
                                    jointType=p.JOINT_GEAR,
                                    jointAxis=[0, 1, 0],
                                    parentFramePosition=[0, 0, 0],
-                                   childFramePosition=[0, 0, 0])
-            p.changeConstraint(c, gearRatio=-multiplier, maxForce=100, erp=1)  # Note: the mysterious `erp` is of EXTREME importance
+                                   childFramePosition=[0, 0, 0],
+                                   physicsClientId=self.physicsClient)
+            p.changeConstraint(c, gearRatio=-multiplier, maxForce=100, erp=1, physicsClientId=self.physicsClient)  # Note: the mysterious `erp` is of EXTREME importance
+
+    def calculate_analytic_ik(self, pose):
+        # The solution closest to the last commanded joints, or to the current ones before the first command,
+        # whatever the limits (+-pi for the wrists): wrapping it by 2*pi into the limits would swing a wrist by a
+        # whole turn or flip the elbow. Like with PyBullet IK, the joints are then clipped to the limits
+        reference = self.arm_target_positions if self.arm_target_positions is not None else self.get_joint_states()
+        base_pos, base_ori = p.invertTransform(self.base_pos, self.base_ori, physicsClientId=self.physicsClient)
+        position, orientation = p.multiplyTransforms(base_pos, base_ori, pose[:3], pose[3:], physicsClientId=self.physicsClient)
+        pose = position + orientation
+        reference, lower_limits, upper_limits = reference[:self.arm_num_dofs], [-math.inf] * self.arm_num_dofs, [math.inf] * self.arm_num_dofs
+        joint_poses = ur5_kinematics.inverse_kinematics_single(pose, reference, lower_limits, upper_limits)
+        if joint_poses is None:
+            # Out of reach, the arm is stretched towards the pose
+            self.ik_unreachable += 1
+            joint_poses = ur5_kinematics.inverse_kinematics_single(pose, reference, lower_limits, upper_limits, stretch=True)
+            if joint_poses is None:
+                return None
+        clipped = ur5_kinematics.clip_to_limits(pose, joint_poses, self.arm_lower_limits, self.arm_upper_limits)
+        if clipped != joint_poses:
+            self.ik_clipped += 1
+        return clipped
+
+    def forward_kinematics(self, joints):
+        """
+        Returns the world poses (x, y, z, qx, qy, qz, qw) of the End-Effector, of shape (N, 7), for arm joints of shape (N, 6),
+        computed in NumPy without touching the simulation
+        """
+        base = ur5_kinematics.pose_to_matrix(list(self.base_pos) + list(self.base_ori))
+        return ur5_kinematics.matrix_to_pose(base @ ur5_kinematics.forward_kinematics_matrices(joints))
 
     def move_gripper(self, open_length):
         # open_length = np.clip(open_length, *self.gripper_range)
+        self.gripper_target_length = open_length
         open_angle = 0.715 - math.asin((open_length - 0.010) / 0.1143)  # angle calculation
         # Control the mimic gripper joint(s)
         p.setJointMotorControl2(self.id, self.mimic_parent_id, p.POSITION_CONTROL, targetPosition=open_angle,
-                                force=self.joints[self.mimic_parent_id].maxForce, maxVelocity=self.joints[self.mimic_parent_id].maxVelocity)
+                                force=self.joints[self.mimic_parent_id].maxForce, maxVelocity=self.joints[self.mimic_parent_id].maxVelocity, physicsClientId=self.physicsClient)
 
 
 class UR5Robotiq140(UR5Robotiq85):
@@ -226,7 +383,7 @@ class UR5Robotiq140(UR5Robotiq85):
                                -1.5707970583733368, 0.0009377758247187636]
         current_dir = os.path.dirname(__file__)
         self.id = p.loadURDF(os.path.join(current_dir, '../urdf/ur5_robotiq_140.urdf'), self.base_pos, self.base_ori,
-                             useFixedBase=True, flags=p.URDF_ENABLE_CACHED_GRAPHICS_SHAPES)
+                             useFixedBase=True, flags=p.URDF_ENABLE_CACHED_GRAPHICS_SHAPES, physicsClientId=self.physicsClient)
         self.gripper_range = [0, 0.085]
         # TODO: It's weird to use the same range and the same formula to calculate open_angle as Robotiq85.
 
@@ -0,0 +1,106 @@
+import math
+import pybullet as p
+import numpy as np
+
+
+def configure_substeps(physicsClient, substeps, time_step=1/240.):
+    """
+    Makes every p.stepSimulation() call advance `substeps` internal steps of `time_step` seconds inside the
+    physics engine, instead of a single one.
+
+    Parameters:
+    - physicsClient: The ID of the physics client
+    - substeps: The number of internal steps per p.stepSimulation() call
+    - time_step: The duration of each internal step
+
+    Returns:
+    None
+    """
+    assert substeps >= 1
+    p.setPhysicsEngineParameter(fixedTimeStep=time_step * substeps, numSubSteps=substeps, physicsClientId=physicsClient)
+
+
+class SettleDetector(object):
+    """
+    Steps the simulation until a robot stops moving.
+
+    The joint states of all the controllable joints are read with a single p.getJointStates() call into a
+    preallocated array. The robot is considered stable when the sum of the absolute joint velocities, scaled by
+    the simulation time step, is below `threshold`. As PyBullet integrates positions with the updated velocities,
+    this is the same criterion as comparing the joint positions of two consecutive substeps.
+
+    If the engine runs several internal substeps per p.stepSimulation() call (see `configure_substeps`), the
+    joint states are only checked once per call, and the substep counts include the internal substeps.
+    """
+
+    def __init__(self, robot, threshold=5e-3, check_every=1, target_threshold=None):
+        """
+        Arguments:
+            robot: RobotBase, a loaded robot whose `step_simulation` is hooked by the environment
+            threshold: Float, maximum joint displacement per substep (sum over joints) to consider the robot stable
+            check_every: Int, the joint states are only checked every `check_every` p.stepSimulation() calls
+            target_threshold: Float, if given, the arm joints must also be within this distance (sum over joints)
+                of the last target sent with `move_ee`
+
+        Attributes:
+            last_substeps: Int, the number of substeps used by the last call to `wait` or `record`
+            total_substeps: Int, the number of substeps used by all the calls to `wait` and `record`
+        """
+        assert check_every >= 1
+        self.robot = robot
+        self.threshold = threshold
+        self.check_every = check_every
+        self.target_threshold = target_threshold
+
+        engine_parameters = p.getPhysicsEngineParameters(physicsClientId=robot.physicsClient)
+        self.substeps_per_call = max(engine_parameters['numSubSteps'], 1)
+        self.time_step = engine_parameters['fixedTimeStep'] / self.substeps_per_call
+        self.joint_states = np.zeros((len(robot.controllable_joints), 2))
+        self.last_substeps = 0
+        self.total_substeps = 0
+
+    def read_joint_states(self):
+        """
+        Reads the positions and velocities of all the controllable joints with a single call.
+
+        Returns:
+        An array of shape (num_controllable_joints, 2) with the positions in the first column and the velocities
+        in the second one. The array is reused between calls.
+        """
+        states = p.getJointStates(self.robot.id, self.robot.controllable_joints, physicsClientId=self.robot.physicsClient)
+        self.joint_states[:] = [state[:2] for state in states]
+        return self.joint_states
+
+    def is_stable(self):
+        joint_states = self.read_joint_states()
+        if np.sum(np.abs(joint_states[:, 1])) * self.time_step >= self.threshold:
+            return False
+        if self.target_threshold is not None and self.robot.arm_target_positions is not None:
+            target_error = np.sum(np.abs(joint_states[:self.robot.arm_num_dofs, 0] - self.robot.arm_target_positions))
+            return target_error < self.target_threshold
+        return True
+
+    def wait(self, sim_steps=480):
+        """
+        Steps the simulation until the robot is stable.
+
+        Returns:
+        True if the robot stabilized within `sim_steps` substeps, False otherwise.
+        """
+        calls = math.ceil(sim_steps / self.substeps_per_call)
+        for call in range(1, calls + 1):
+            self.robot.step_simulation()
+            if call % self.check_every == 0 and self.is_stable():
+                self.record(call * self.substeps_per_call)
+                return True
+        self.record(calls * self.substeps_per_call)
+        print("Warning: The robot configuration did not stabilize")
+        return False
+
+    def record(self, substeps):
+        """
+        Records substeps run for the robot to move, by `wait` or by the environment (e.g. the fixed-duration
+        motions of `urgym.base.control.move_ee_at_constant_speed`), as the substeps of the current step.
+        """
+        self.last_substeps = substeps
+        self.total_substeps += substeps
@@ -0,0 +1,72 @@
+import numpy as np
+import pybullet as p
+
+
+def _freeze(value):
+    # Lists (e.g. half extents or colors) are turned into tuples so they can be part of a dictionary key
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class ShapeCache(object):
+    """
+    Registry of the collision shapes, visual shapes and textures of a physics client.
+
+    Each geometry or texture is created once, the first time it is requested, and the same id is handed back
+    afterwards. Shapes can be shared by any number of bodies, and they are not freed by p.removeBody(), so
+    creating them once avoids parsing meshes again and the growth of the shape tables over many resets.
+
+    There is a single cache per physics client, obtained with `ShapeCache.for_client`. It must be released
+    with `ShapeCache.release` when the client is disconnected, as PyBullet reuses the client ids.
+    """
+
+    _registry = {}
+
+    def __init__(self, physicsClient):
+        """
+        Arguments:
+            physicsClient: Int, the PyBullet physics client the shapes live in
+
+        Attributes:
+            shapes: Dict, the ids of the created shapes and textures, by their creation arguments
+        """
+        self.physicsClient = physicsClient
+        self.shapes = {}
+
+    @classmethod
+    def for_client(cls, physicsClient):
+        if physicsClient not in cls._registry:
+            cls._registry[physicsClient] = cls(physicsClient)
+        return cls._registry[physicsClient]
+
+    @classmethod
+    def release(cls, physicsClient):
+        cls._registry.pop(physicsClient, None)
+
+    def collision_shape(self, shapeType, **kwargs):
+        """
+        Returns the id of a collision shape, the arguments are the same as in p.createCollisionShape().
+        """
+        key = ('collision', shapeType) + _freeze(sorted(kwargs.items()))
+        if key not in self.shapes:
+            self.shapes[key] = p.createCollisionShape(shapeType, physicsClientId=self.physicsClient, **kwargs)
+        return self.shapes[key]
+
+    def visual_shape(self, shapeType, **kwargs):
+        """
+        Returns the id of a visual shape, the arguments are the same as in p.createVisualShape().
+        """
+        key = ('visual', shapeType) + _freeze(sorted(kwargs.items()))
+        if key not in self.shapes:
+            self.shapes[key] = p.createVisualShape(shapeType, physicsClientId=self.physicsClient, **kwargs)
+        return self.shapes[key]
+
+    def texture(self, fileName):
+        """
+        Returns the id of a texture loaded with p.loadTexture().
+        """
+        key = ('texture', fileName)
+        if key not in self.shapes:
+            self.shapes[key] = p.loadTexture(fileName, physicsClientId=self.physicsClient)
+        return self.shapes[key]
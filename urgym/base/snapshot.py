@@ -0,0 +1,65 @@
+import pybullet as p
+
+
+class SceneSnapshot(object):
+    """
+    In-memory snapshot of a scene, taken with p.saveState() and brought back with p.restoreState().
+
+    PyBullet does not keep the motor commands in a saved state, so the last arm and gripper commands of the
+    given robots are stored along with it and sent again on restore. The scene must contain exactly the same
+    bodies when the snapshot is taken and when it is restored.
+    """
+
+    def __init__(self, physicsClient, robots=()):
+        """
+        Arguments:
+            physicsClient: Int, the PyBullet physics client of the scene
+            robots: List of RobotBase, the robots whose commands are restored with the scene
+
+        Attributes:
+            state_id: Int, the ID of the saved state, None before the first capture
+        """
+        self.physicsClient = physicsClient
+        self.robots = list(robots)
+        self.state_id = None
+        self.robot_commands = []
+
+    @property
+    def captured(self):
+        return self.state_id is not None
+
+    def capture(self):
+        """
+        Saves the current state of the scene, replacing the previous snapshot.
+        """
+        self.clear()
+        self.state_id = p.saveState(physicsClientId=self.physicsClient)
+        self.robot_commands = [(robot.arm_target_positions, robot.gripper_target_length) for robot in self.robots]
+
+    def restore(self):
+        assert self.captured, "No snapshot has been captured"
+        p.restoreState(stateId=self.state_id, physicsClientId=self.physicsClient)
+        for robot, commands in zip(self.robots, self.robot_commands):
+            robot.resend_commands(*commands)
+
+    def clear(self):
+        if self.state_id is not None:
+            p.removeState(self.state_id, physicsClientId=self.physicsClient)
+            self.state_id = None
+
+
+def reset_body(body_id, position, orientation, physicsClient=0):
+    """
+    Places a body at the given pose, at rest.
+
+    Parameters:
+    - body_id: The ID of the body
+    - position: The position (x, y, z)
+    - orientation: The orientation quaternion (x, y, z, w)
+    - physicsClient: The ID of the physics client
+
+    Returns:
+    None
+    """
+    p.resetBasePositionAndOrientation(body_id, position, orientation, physicsClientId=physicsClient)
+    p.resetBaseVelocity(body_id, [0, 0, 0], [0, 0, 0], physicsClientId=physicsClient)
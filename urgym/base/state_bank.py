@@ -0,0 +1,98 @@
+import numpy as np
+import pybullet as p
+
+
+def scene_state_dtype(num_joints, num_arm_dofs, num_bodies):
+    """
+    Returns the NumPy structured dtype of a scene state.
+
+    Parameters:
+    - num_joints: The number of controllable joints of the robot
+    - num_arm_dofs: The number of DoFs of the arm
+    - num_bodies: The number of bodies of the scene
+
+    Returns:
+    A structured dtype with the joint positions and velocities, the last arm and gripper commands and the pose
+    (x, y, z, qx, qy, qz, qw) and velocity (vx, vy, vz, wx, wy, wz) of each body
+    """
+    return np.dtype([('joint_states', np.float64, (num_joints, 2)),
+                     ('arm_targets', np.float64, (num_arm_dofs,)),
+                     ('gripper_target', np.float64),
+                     ('body_states', np.float64, (num_bodies, 13))])
+
+
+def read_scene_state(robot, body_ids):
+    """
+    Reads the state of a robot and of the given bodies.
+
+    Parameters:
+    - robot: The robot
+    - body_ids: The IDs of the bodies of the scene, always in the same order
+
+    Returns:
+    A structured scalar of `scene_state_dtype`
+    """
+    state = np.zeros((), dtype=scene_state_dtype(len(robot.controllable_joints), robot.arm_num_dofs, len(body_ids)))
+    joint_states = p.getJointStates(robot.id, robot.controllable_joints, physicsClientId=robot.physicsClient)
+    state['joint_states'] = [joint_state[:2] for joint_state in joint_states]
+    state['arm_targets'] = robot.arm_target_positions
+    state['gripper_target'] = robot.gripper_target_length
+    for i, body_id in enumerate(body_ids):
+        position, orientation = p.getBasePositionAndOrientation(body_id, physicsClientId=robot.physicsClient)
+        linear_velocity, angular_velocity = p.getBaseVelocity(body_id, physicsClientId=robot.physicsClient)
+        state['body_states'][i] = position + orientation + linear_velocity + angular_velocity
+    return state
+
+
+def write_scene_state(robot, body_ids, state):
+    """
+    Teleports a robot and the given bodies into a state read with `read_scene_state`, and sends again the
+    arm and gripper commands of that state.
+    """
+    for joint_id, (position, velocity) in zip(robot.controllable_joints, state['joint_states']):
+        p.resetJointState(robot.id, joint_id, position, velocity, physicsClientId=robot.physicsClient)
+    robot.resend_commands(state['arm_targets'], float(state['gripper_target']))
+    for body_id, body_state in zip(body_ids, state['body_states']):
+        p.resetBasePositionAndOrientation(body_id, body_state[:3], body_state[3:7], physicsClientId=robot.physicsClient)
+        p.resetBaseVelocity(body_id, body_state[7:10], body_state[10:13], physicsClientId=robot.physicsClient)
+
+
+class StateBank(object):
+    """
+    Bank of precomputed initial states of an environment, stored as a structured array in a `.npy` file.
+
+    The file is memory-mapped, so loading is immediate and the workers that use the same bank share its pages.
+    Banks are generated with `python -m urgym.generate_state_bank`.
+    """
+
+    def __init__(self, states):
+        """
+        Arguments:
+            states: Structured array of `scene_state_dtype`, one item per initial state
+        """
+        assert len(states) > 0, "The state bank is empty"
+        self.states = states
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path, mmap_mode='r'))
+
+    def save(self, path):
+        np.save(path, np.asarray(self.states))
+
+    def __len__(self):
+        return len(self.states)
+
+    def sample(self, rng):
+        """
+        Returns a random state, drawn with the given `np.random.Generator`.
+        """
+        return self.states[rng.integers(len(self.states))]
+
+    def restore(self, state, robot, body_ids):
+        """
+        Teleports a robot and the bodies of its scene into a state of the bank, e.g. drawn with `sample`.
+        """
+        assert state['joint_states'].shape[0] == len(robot.controllable_joints) and state['body_states'].shape[0] == len(body_ids), \
+            "The state bank does not match the environment"
+        write_scene_state(robot, body_ids, state)
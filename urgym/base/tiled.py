@@ -0,0 +1,318 @@
+import time
+import math
+import random
+import os
+from typing import Optional
+
+import numpy as np
+from gymnasium.vector import VectorEnv
+
+import pybullet as p
+import pybullet_data
+from urgym.base.robot import UR5Robotiq85
+from urgym.base.settle import SettleDetector, configure_substeps
+from urgym.base.shapes import ShapeCache
+from urgym.base.pool import BodyPool
+from urgym.base.contacts import ContactCache
+
+
+class Tile(object):
+    """
+    One independent scene of a tiled world: a robot and the bodies of its task, placed around `origin`.
+    Task specific body ids (cubes, ball, stick...) are stored as attributes by the environment.
+    """
+
+    def __init__(self, index, origin, robot):
+        self.index = index
+        self.origin = origin
+        self.robot = robot
+        self.settle_detector = SettleDetector(robot)
+        self.body_pool = BodyPool(robot.physicsClient)
+        self.episode_steps = 0
+
+    def to_world(self, position):
+        """
+        Converts a position relative to the tile origin into world coordinates.
+        """
+        return list(np.array(position) + self.origin)
+
+    def to_tile(self, position):
+        """
+        Converts a world position into a position relative to the tile origin.
+        """
+        return np.array(position) - self.origin
+
+
+class TiledEnv(VectorEnv):
+    """
+    Base class for batched environments that place N UR5 robots, each one with its own scene, on a grid
+    inside a single PyBullet world. All the scenes advance with a single p.stepSimulation() per substep.
+
+    Bodies of different tiles never collide: each tile has its own collision group, and only the shared
+    ground plane collides with every tile.
+
+    Sub-environments are reset automatically when their episode ends, the final observation and info are then
+    available in `infos['final_observation']` and `infos['final_info']`. The scenes that are not being reset keep
+    being simulated while the others settle.
+
+    Subclasses implement the task through `create_tile_scene`, `reset_tiles`, `apply_action`, `evaluate_tile`
+    and `get_tile_observation`.
+    """
+
+    SIMULATION_STEP_DELAY = 1 / 240.
+    TILE_SPACING = 3.0
+    PLANE_COLLISION_GROUP = 1 << 30
+
+    def __init__(self, num_envs, observation_space, action_space, max_episode_steps=None, render_mode=None, sim_substeps=1) -> None:
+        """
+        Initialize the tiled world.
+
+        Parameters:
+        - num_envs (int): The number of robots/scenes in the world.
+        - observation_space: The observation space of a single scene.
+        - action_space: The action space of a single scene.
+        - max_episode_steps (int): Steps after which a scene episode is truncated. Default is None (never).
+        - render_mode (str): The rendering mode. Options are 'human' and 'non-human'. Default is None.
+        - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+        """
+        super().__init__(num_envs, observation_space, action_space)
+
+        self.max_episode_steps = max_episode_steps
+        self.visualize = render_mode == 'human'
+        self.random = random.Random()
+        self.last_substeps = 0
+        self._actions = None
+
+        # Define environment
+        self.physicsClient = p.connect(p.GUI if self.visualize else p.DIRECT)
+        self.shape_cache = ShapeCache.for_client(self.physicsClient)
+        self.contacts = ContactCache(self.physicsClient)
+        self.sim_substeps = sim_substeps
+        if sim_substeps > 1:
+            configure_substeps(self.physicsClient, sim_substeps)
+        p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physicsClient)
+        p.setGravity(0, 0, -9.8, physicsClientId=self.physicsClient)
+
+        # Hide right and left menus
+        p.configureDebugVisualizer(p.COV_ENABLE_GUI, 0, physicsClientId=self.physicsClient)
+
+        # Robots will be centered at the tile origins, the plane and the tables will be below z=0
+        table_dimensions = [1.0, 2.0, 0.5]
+        self.planeID = p.loadURDF("plane.urdf", [0, 0, -table_dimensions[2]], physicsClientId=self.physicsClient)
+        p.setCollisionFilterGroupMask(self.planeID, -1, self.PLANE_COLLISION_GROUP, -1, physicsClientId=self.physicsClient)
+
+        self.tiles = []
+        grid_size = math.ceil(math.sqrt(num_envs))
+        for index in range(num_envs):
+            row, col = divmod(index, grid_size)
+            origin = np.array([col * self.TILE_SPACING, row * self.TILE_SPACING, 0.0])
+            robot = UR5Robotiq85(tuple(origin), (0, 0, 0), self.physicsClient)
+            robot.load()
+            robot.step_simulation = self.step_simulation # type: ignore
+            robot.sim_substeps = sim_substeps
+            tile = Tile(index, origin, robot)
+            self.add_to_tile(tile, robot.id)
+            tile.table_id = self.create_table_block(table_dimensions, tile.to_world([0, 0, -table_dimensions[2]/2]), color=[0.5, 0.5, 0.5, 1])
+            self.add_to_tile(tile, tile.table_id)
+            self.create_tile_scene(tile)
+            self.tiles.append(tile)
+
+        # Reorient the debug camera to look at the whole grid
+        grid_center = (grid_size - 1) * self.TILE_SPACING / 2
+        p.resetDebugVisualizerCamera(cameraDistance=1.8 * grid_size, cameraYaw=50, cameraPitch=-35,
+                                     cameraTargetPosition=[grid_center, grid_center, 0], physicsClientId=self.physicsClient)
+
+    def step_simulation(self):
+        """
+        Hook p.stepSimulation(), which advances all the tiles at once
+        """
+        p.stepSimulation(physicsClientId=self.physicsClient)
+        if self.visualize:
+            time.sleep(self.SIMULATION_STEP_DELAY * self.sim_substeps)
+
+    def wait_simulation_steps(self, sim_steps):
+        for _ in range(math.ceil(sim_steps / self.sim_substeps)):
+            self.step_simulation()
+
+    def wait_until_stable(self, tiles=None, sim_steps=480):
+        """
+        Steps the world until the robots of all the given tiles are stable.
+
+        Returns:
+        True if all the robots stabilized within `sim_steps` substeps, False otherwise.
+        """
+        pending = list(tiles if tiles is not None else self.tiles)
+        calls = math.ceil(sim_steps / self.sim_substeps)
+        for call in range(1, calls + 1):
+            self.step_simulation()
+            pending = [tile for tile in pending if not tile.settle_detector.is_stable()]
+            if not pending:
+                self.last_substeps = call * self.sim_substeps
+                return True
+        self.last_substeps = calls * self.sim_substeps
+        print(f"Warning: The robot configuration did not stabilize in tiles {[tile.index for tile in pending]}")
+        return False
+
+    def add_to_tile(self, tile, body_id):
+        """
+        Puts all the links of a body in the collision group of the tile, so it only collides with
+        bodies of the same tile and with the ground plane.
+
+        Returns:
+        The ID of the body.
+        """
+        group = 1 << (tile.index % 30)
+        mask = group | self.PLANE_COLLISION_GROUP
+        for link_index in range(-1, p.getNumJoints(body_id, physicsClientId=self.physicsClient)):
+            p.setCollisionFilterGroupMask(body_id, link_index, group, mask, physicsClientId=self.physicsClient)
+        return body_id
+
+    def reset_async(self, seed=None, options=None):
+        pass
+
+    def reset_wait(self, seed: Optional[int] = None, options: Optional[dict] = None):
+        if seed is not None:
+            self.random.seed(seed)
+        self.reset_tiles(self.tiles)
+        for tile in self.tiles:
+            tile.episode_steps = 0
+        observations = np.stack([self.get_tile_observation(tile) for tile in self.tiles])
+        return observations, {}
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions)
+
+    def step_wait(self):
+        self.apply_actions(self._actions)
+
+        self.wait_until_stable()
+
+        # A single contact snapshot of the whole world for the predicates of all the tiles
+        self.contacts.update()
+
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        terminateds = np.zeros(self.num_envs, dtype=np.bool_)
+        truncateds = np.zeros(self.num_envs, dtype=np.bool_)
+        tile_infos = []
+        for tile in self.tiles:
+            tile.episode_steps += 1
+            rewards[tile.index], terminateds[tile.index], info = self.evaluate_tile(tile)
+            truncateds[tile.index] = self.max_episode_steps is not None and tile.episode_steps >= self.max_episode_steps
+            tile_infos.append(info)
+
+        observations = np.stack([self.get_tile_observation(tile) for tile in self.tiles])
+
+        # Reset the finished tiles all at once
+        done_tiles = [tile for tile in self.tiles if terminateds[tile.index] or truncateds[tile.index]]
+        if done_tiles:
+            self.reset_tiles(done_tiles)
+            for tile in done_tiles:
+                tile.episode_steps = 0
+                tile_infos[tile.index] = {'final_observation': observations[tile.index].copy(), 'final_info': tile_infos[tile.index]}
+                observations[tile.index] = self.get_tile_observation(tile)
+
+        infos = {}
+        for index, info in enumerate(tile_infos):
+            infos = self._add_info(infos, info, index)
+
+        return observations, rewards, terminateds, truncateds, infos
+
+    def close_extras(self, **kwargs):
+        ShapeCache.release(self.physicsClient)
+        p.disconnect(self.physicsClient)
+
+    def create_tile_scene(self, tile):
+        """
+        Creates the static bodies of a tile, called once per tile when the world is built.
+        """
+        pass
+
+    def reset_tiles(self, tiles):
+        """
+        Resets the scenes of the given tiles, settling them all together.
+        """
+        raise NotImplementedError
+
+    def apply_actions(self, actions):
+        """
+        Sends the motor commands for the actions of all the tiles, one `apply_action` per tile. Subclasses can
+        override it to process the actions of all the tiles at once.
+        """
+        for tile in self.tiles:
+            self.apply_action(tile, actions[tile.index])
+
+    def apply_action(self, tile, action):
+        """
+        Sends the motor commands for the action of one tile, the world is stepped afterwards for all the tiles.
+        """
+        raise NotImplementedError
+
+    def evaluate_tile(self, tile) -> tuple[float, bool, dict]:
+        """
+        Returns the reward, the termination flag and the info of one tile after the world has settled.
+        """
+        raise NotImplementedError
+
+    def get_tile_observation(self, tile):
+        raise NotImplementedError
+
+    def touched_with_fingers(self, tile, object_id):
+        fingers_indices = np.arange(9, 19)
+        return self.contacts.touching(tile.robot.id, object_id, links=fingers_indices)
+
+    def get_gripper_geometrical_center(self, tile):
+        """
+        Returns the geometrical center (x, y, z), in world coordinates, of the gripper of the robot of a tile.
+        """
+        # Initialize min and max coordinates to extreme values
+        overall_aabb_min = [float('inf'), float('inf'), float('inf')]
+        overall_aabb_max = [float('-inf'), float('-inf'), float('-inf')]
+
+        gripper_link_indices = [11,16]
+
+        # Iterate through each link index in the gripper
+        for link_index in gripper_link_indices:
+            aabb_min, aabb_max = p.getAABB(tile.robot.id, link_index, physicsClientId=self.physicsClient)
+
+            # Update the overall AABB
+            for i in range(3):
+                overall_aabb_min[i] = min(overall_aabb_min[i], aabb_min[i])
+                overall_aabb_max[i] = max(overall_aabb_max[i], aabb_max[i])
+
+        # Calculate the geometrical center
+        geometrical_center = [(overall_aabb_max[i] + overall_aabb_min[i]) / 2 for i in range(3)]
+
+        return geometrical_center
+
+    def create_table_block(self, size, position, color=[1, 0, 0, 1]):
+        """
+        Create a block in the PyBullet simulation.
+
+        Args:
+        - size: A list of three floats representing the half extents of the block [x, y, z].
+        - position: A list of three floats representing the position of the block [x, y, z].
+        - color: A list of four floats representing the RGBA color of the block.
+
+        Returns:
+        - block_body_id: The ID of the created block.
+        """
+        block_visual_shape_id = self.shape_cache.visual_shape(shapeType=p.GEOM_BOX,
+                                                    rgbaColor=color,
+                                                    halfExtents=[size[0]/2, size[1]/2, size[2]/2])
+        block_collision_shape_id = self.shape_cache.collision_shape(shapeType=p.GEOM_BOX,
+                                                        halfExtents=[size[0]/2, size[1]/2, size[2]/2])
+        block_body_id = p.createMultiBody(baseMass=0,
+                                        baseCollisionShapeIndex=block_collision_shape_id,
+                                        baseVisualShapeIndex=block_visual_shape_id,
+                                        basePosition=position, physicsClientId=self.physicsClient)
+
+        # Load the texture
+        script_dir = os.path.dirname(__file__)
+        texture_path = os.path.join(script_dir, "../meshes/textures/steel.jpg")
+
+        texture_id = self.shape_cache.texture(texture_path)
+
+        # Apply the texture to the block
+        p.changeVisualShape(block_body_id, -1, textureUniqueId=texture_id, physicsClientId=self.physicsClient)
+
+        return block_body_id
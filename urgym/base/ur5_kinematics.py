@@ -0,0 +1,428 @@
+"""
+Closed-form kinematics of the UR5 arm, in NumPy and batched over any number of poses or joint configurations.
+
+The arm follows the standard UR5 Denavit-Hartenberg parameters. The `base_link` frame of the URDF files
+(ur5_robotiq_85.urdf, ur5_robotiq_140.urdf) is the DH base frame rotated by pi around z, and the `ee_link`
+frame (the end-effector link `eef_id`) is a fixed rotation of the DH flange frame. Poses are
+(x, y, z, qx, qy, qz, qw) in the `base_link` frame, joints are the 6 arm joints in URDF order.
+"""
+import math
+
+import numpy as np
+
+# Standard UR5 DH parameters
+D1, A2, A3, D4, D5, D6 = 0.089159, -0.425, -0.39225, 0.10915, 0.09465, 0.0823
+DH_A = np.array([0.0, A2, A3, 0.0, 0.0, 0.0])
+DH_D = np.array([D1, 0.0, 0.0, D4, D5, D6])
+DH_ALPHA = np.array([np.pi / 2, 0.0, 0.0, np.pi / 2, -np.pi / 2, 0.0])
+# Exact cosines and sines of DH_ALPHA, as Python floats for the scalar functions
+DH_COS_ALPHA = (0.0, 1.0, 1.0, 0.0, 0.0, 1.0)
+DH_SIN_ALPHA = (1.0, 0.0, 0.0, 1.0, -1.0, 0.0)
+
+# base_link -> DH base, and DH flange -> ee_link
+BASE_TO_DH = np.array([[-1.0, 0.0, 0.0, 0.0],
+                       [0.0, -1.0, 0.0, 0.0],
+                       [0.0, 0.0, 1.0, 0.0],
+                       [0.0, 0.0, 0.0, 1.0]])
+FLANGE_TO_EE = np.array([[0.0, -1.0, 0.0, 0.0],
+                         [0.0, 0.0, -1.0, 0.0],
+                         [1.0, 0.0, 0.0, 0.0],
+                         [0.0, 0.0, 0.0, 1.0]])
+
+NUM_BRANCHES = 8
+
+
+def dh_transform(i, theta):
+    """
+    Returns the DH transforms of joint `i` for the angles `theta`, of shape theta.shape + (4, 4).
+    """
+    theta = np.asarray(theta, dtype=np.float64)
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(DH_ALPHA[i]), np.sin(DH_ALPHA[i])
+    T = np.zeros(theta.shape + (4, 4))
+    T[..., 0, 0], T[..., 0, 1], T[..., 0, 2], T[..., 0, 3] = ct, -st * ca, st * sa, DH_A[i] * ct
+    T[..., 1, 0], T[..., 1, 1], T[..., 1, 2], T[..., 1, 3] = st, ct * ca, -ct * sa, DH_A[i] * st
+    T[..., 2, 1], T[..., 2, 2], T[..., 2, 3] = sa, ca, DH_D[i]
+    T[..., 3, 3] = 1.0
+    return T
+
+
+def invert_transform(T):
+    """
+    Inverts rigid transforms of shape (..., 4, 4).
+    """
+    R = np.swapaxes(T[..., :3, :3], -1, -2)
+    inverse = np.zeros_like(T)
+    inverse[..., :3, :3] = R
+    inverse[..., :3, 3] = -np.einsum('...ij,...j->...i', R, T[..., :3, 3])
+    inverse[..., 3, 3] = 1.0
+    return inverse
+
+
+def pose_to_matrix(poses):
+    """
+    Converts poses (x, y, z, qx, qy, qz, qw) of shape (N, 7) into homogeneous transforms of shape (N, 4, 4).
+    """
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 7)
+    x, y, z, w = (poses[:, 3:] / np.linalg.norm(poses[:, 3:], axis=1, keepdims=True)).T
+    T = np.zeros((len(poses), 4, 4))
+    T[:, 0, 0], T[:, 0, 1], T[:, 0, 2] = 1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)
+    T[:, 1, 0], T[:, 1, 1], T[:, 1, 2] = 2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)
+    T[:, 2, 0], T[:, 2, 1], T[:, 2, 2] = 2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)
+    T[:, :3, 3] = poses[:, :3]
+    T[:, 3, 3] = 1.0
+    return T
+
+
+def matrix_to_pose(T):
+    """
+    Converts homogeneous transforms of shape (N, 4, 4) into poses (x, y, z, qx, qy, qz, qw) of shape (N, 7),
+    with qw >= 0.
+    """
+    R = T[:, :3, :3]
+    trace = R[:, 0, 0] + R[:, 1, 1] + R[:, 2, 2]
+    # Each row uses the largest of the four quaternion components as divisor, for numerical stability
+    candidates = np.stack([1 + 2 * R[:, 0, 0] - trace, 1 + 2 * R[:, 1, 1] - trace, 1 + 2 * R[:, 2, 2] - trace, 1 + trace], axis=1)
+    largest = np.argmax(candidates, axis=1)
+    q = np.empty((len(T), 4))
+    for k, (i, j, l) in enumerate([(0, 1, 2), (1, 2, 0), (2, 0, 1)]):
+        rows = largest == k
+        d = np.sqrt(candidates[rows, k]) * 2
+        q[rows, i] = d / 4
+        q[rows, j] = (R[rows, j, i] + R[rows, i, j]) / d
+        q[rows, l] = (R[rows, l, i] + R[rows, i, l]) / d
+        q[rows, 3] = (R[rows, l, j] - R[rows, j, l]) / d
+    rows = largest == 3
+    d = np.sqrt(candidates[rows, 3]) * 2
+    q[rows, 0] = (R[rows, 2, 1] - R[rows, 1, 2]) / d
+    q[rows, 1] = (R[rows, 0, 2] - R[rows, 2, 0]) / d
+    q[rows, 2] = (R[rows, 1, 0] - R[rows, 0, 1]) / d
+    q[rows, 3] = d / 4
+    q *= np.where(q[:, 3:] < 0, -1.0, 1.0)
+    return np.concatenate([T[:, :3, 3], q], axis=1)
+
+
+def forward_kinematics_matrices(joints):
+    """
+    Returns the transforms of the `ee_link` frame in the `base_link` frame, of shape (N, 4, 4), for the arm joints
+    of shape (N, 6).
+    """
+    joints = np.asarray(joints, dtype=np.float64).reshape(-1, 6)
+    T = BASE_TO_DH @ dh_transform(0, joints[:, 0])
+    for i in range(1, 6):
+        T = T @ dh_transform(i, joints[:, i])
+    return T @ FLANGE_TO_EE
+
+
+def forward_kinematics(joints):
+    """
+    Computes the end-effector poses of the UR5 for a batch of joint configurations, without PyBullet.
+
+    Parameters:
+    - joints: The arm joints, of shape (N, 6)
+
+    Returns:
+    The poses (x, y, z, qx, qy, qz, qw) of the `ee_link` frame in the `base_link` frame, of shape (N, 7), the same
+    as p.getLinkState() for a robot at the origin
+    """
+    return matrix_to_pose(forward_kinematics_matrices(joints))
+
+
+def inverse_kinematics_branches(poses, wrist_3=0.0):
+    """
+    Solves the 8 closed-form IK branches (shoulder left/right, wrist up/down, elbow up/down) of the UR5.
+
+    Parameters:
+    - poses: The end-effector poses (x, y, z, qx, qy, qz, qw) in the `base_link` frame, of shape (N, 7)
+    - wrist_3: The angle of the last joint when the wrist is singular and it is free, of shape (N,) or scalar
+
+    Returns:
+    The joint angles in (-pi, pi] of shape (N, 8, 6), NaN for the branches that cannot reach the pose.
+    """
+    T06 = np.einsum('ij,njk,kl->nil', invert_transform(BASE_TO_DH), pose_to_matrix(poses), invert_transform(FLANGE_TO_EE))
+    n = len(T06)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Shoulder pan, from the position of the wrist center: (n, 2)
+        p05 = T06[:, :3, 3] - D6 * T06[:, :3, 2]
+        phi = np.arccos(D4 / np.hypot(p05[:, 0], p05[:, 1]))
+        theta1 = np.arctan2(p05[:, 1], p05[:, 0])[:, None] + np.stack([phi, -phi], axis=1) + np.pi / 2
+        s1, c1 = np.sin(theta1), np.cos(theta1)
+
+        # Wrist 2: (n, 2, 2)
+        p06 = T06[:, :3, 3]
+        wrist = np.arccos((p06[:, None, 0] * s1 - p06[:, None, 1] * c1 - D4) / D6)
+        theta5 = np.stack([wrist, -wrist], axis=2)
+        s5 = np.sin(theta5)
+
+        # Wrist 3: (n, 2, 2)
+        T60 = invert_transform(T06)
+        x60, y60 = T60[:, :3, 0], T60[:, :3, 1]
+        s1_, c1_ = s1[:, :, None], c1[:, :, None]
+        theta6 = np.arctan2((-x60[:, None, None, 1] * s1_ + y60[:, None, None, 1] * c1_) / s5,
+                            (x60[:, None, None, 0] * s1_ - y60[:, None, None, 0] * c1_) / s5)
+        theta6 = np.where(np.abs(s5) < 1e-9, np.reshape(wrist_3, (-1, 1, 1)), theta6)
+
+        # Shoulder lift, elbow and wrist 1, from the planar 3R chain: (n, 2, 2, 2)
+        T14 = invert_transform(dh_transform(0, theta1))[:, :, None] @ T06[:, None, None] \
+              @ invert_transform(dh_transform(4, theta5) @ dh_transform(5, theta6))
+        p13 = T14[..., :3, 3] - D4 * T14[..., :3, 1]
+        p13_norm = np.linalg.norm(p13, axis=-1)
+        elbow = np.arccos((p13_norm ** 2 - A2 ** 2 - A3 ** 2) / (2 * A2 * A3))
+        theta3 = np.stack([elbow, -elbow], axis=3)
+        theta2 = (-np.arctan2(p13[..., 1], -p13[..., 0]))[..., None] + np.arcsin(A3 * np.sin(theta3) / p13_norm[..., None])
+        T34 = invert_transform(dh_transform(2, theta3)) @ invert_transform(dh_transform(1, theta2)) @ T14[:, :, :, None]
+        theta4 = np.arctan2(T34[..., 1, 0], T34[..., 0, 0])
+
+    shape = (n, 2, 2, 2)
+    solutions = np.stack([np.broadcast_to(theta1[:, :, None, None], shape), theta2, theta3, theta4,
+                          np.broadcast_to(theta5[:, :, :, None], shape), np.broadcast_to(theta6[:, :, :, None], shape)], axis=-1)
+    # Wrap to (-pi, pi]
+    solutions = np.pi - np.mod(np.pi - solutions, 2 * np.pi)
+    return solutions.reshape(n, NUM_BRANCHES, 6)
+
+
+def inverse_kinematics(poses, reference, lower_limits, upper_limits, max_joint_step=np.inf):
+    """
+    Solves the UR5 IK and picks, for each pose, the branch closest to the reference joints within the limits.
+
+    Each joint angle is first moved by multiples of 2*pi as close as possible to the reference, so wrist
+    joints do not spin a whole turn when crossing +-pi.
+
+    Parameters:
+    - poses: The end-effector poses (x, y, z, qx, qy, qz, qw) in the `base_link` frame, of shape (N, 7)
+    - reference: The reference joints, e.g. the current or last commanded ones, of shape (N, 6)
+    - lower_limits: The lower limits of the joints, of shape (6,)
+    - upper_limits: The upper limits of the joints, of shape (6,)
+    - max_joint_step: The largest displacement of any joint from the reference, the branches that need more are
+      discarded, e.g. to avoid flipping the elbow when the closest branch is just outside the limits
+
+    Returns:
+    The joints of shape (N, 6), NaN for the poses without any solution within the limits, and the mask of
+    the solved poses of shape (N,)
+    """
+    reference = np.asarray(reference, dtype=np.float64).reshape(-1, 1, 6)
+    lower_limits, upper_limits = np.asarray(lower_limits), np.asarray(upper_limits)
+    # The wrist singularity leaves the last joint free, it is kept where it is
+    solutions = inverse_kinematics_branches(poses, reference[:, 0, 5])
+    solutions = reference + np.mod(solutions - reference + np.pi, 2 * np.pi) - np.pi
+    solutions = np.where(solutions > upper_limits, solutions - 2 * np.pi, solutions)
+    solutions = np.where(solutions < lower_limits, solutions + 2 * np.pi, solutions)
+    with np.errstate(invalid='ignore'):
+        valid = np.all((solutions >= lower_limits) & (solutions <= upper_limits), axis=-1)
+        valid &= np.max(np.abs(solutions - reference), axis=-1) <= max_joint_step
+
+    distances = np.where(valid, np.sum((solutions - reference) ** 2, axis=-1), np.inf)
+    best = np.argmin(distances, axis=1)
+    joints = solutions[np.arange(len(solutions)), best]
+    solved = valid.any(axis=1)
+    joints[~solved] = np.nan
+    return joints, solved
+
+
+def _acos(x):
+    # NaN outside [-1, 1] like np.arccos, the branch cannot reach the pose
+    return math.acos(x) if -1.0 <= x <= 1.0 else math.nan
+
+
+def _asin(x):
+    return math.asin(x) if -1.0 <= x <= 1.0 else math.nan
+
+
+def _clamped_acos(x):
+    # The closest angle for the poses out of reach, which stretches the arm towards them
+    return math.acos(min(max(x, -1.0), 1.0))
+
+
+def _clamped_asin(x):
+    return math.asin(min(max(x, -1.0), 1.0))
+
+
+def _rotation_columns(quaternion):
+    """
+    Returns the columns of the rotation matrix of a quaternion (qx, qy, qz, qw), as tuples of Python floats.
+    """
+    qx, qy, qz, qw = (float(value) for value in quaternion)
+    norm = math.sqrt(qx * qx + qy * qy + qz * qz + qw * qw)
+    qx, qy, qz, qw = qx / norm, qy / norm, qz / norm, qw / norm
+    return ((1 - 2 * (qy * qy + qz * qz), 2 * (qx * qy + qz * qw), 2 * (qx * qz - qy * qw)),
+            (2 * (qx * qy - qz * qw), 1 - 2 * (qx * qx + qz * qz), 2 * (qy * qz + qx * qw)),
+            (2 * (qx * qz + qy * qw), 2 * (qy * qz - qx * qw), 1 - 2 * (qx * qx + qy * qy)))
+
+
+def inverse_kinematics_branches_single(pose, wrist_3=0.0, stretch=False):
+    """
+    Same as `inverse_kinematics_branches` for a single pose, with scalar operations only, which is several times
+    faster than the batched version for one pose. With `stretch`, the branches that cannot reach the pose are
+    stretched as close to it as they can instead of being NaN, e.g. with a straight elbow for the poses too far
+    from the shoulder.
+
+    Returns:
+    A list of the 8 branches, each one a list of 6 joint angles in (-pi, pi], NaN for the branches that cannot
+    reach the pose, in the order of `inverse_kinematics_branches`
+    """
+    px, py, pz = (float(value) for value in pose[:3])
+    P0, P1, P2 = _rotation_columns(pose[3:])
+    # T06 = BASE_TO_DH^-1 @ pose @ FLANGE_TO_EE^-1: its columns are (-P1, -P2, P0) with the x and y rows negated
+    x6 = (P1[0], P1[1], -P1[2])
+    y6 = (P2[0], P2[1], -P2[2])
+    z6 = (-P0[0], -P0[1], P0[2])
+    p6 = (-px, -py, pz)
+
+    acos, asin = (_clamped_acos, _clamped_asin) if stretch else (_acos, _asin)
+    solutions = []
+    p05x, p05y = p6[0] - D6 * z6[0], p6[1] - D6 * z6[1]
+    # The wrist on the axis of the shoulder has no solution
+    phi = acos(D4 / max(math.hypot(p05x, p05y), 1e-12))
+    for shoulder in (phi, -phi):
+        theta1 = math.atan2(p05y, p05x) + shoulder + math.pi / 2
+        s1, c1 = math.sin(theta1), math.cos(theta1)
+        wrist = acos((p6[0] * s1 - p6[1] * c1 - D4) / D6)
+        # Rotation and position of T16 = T01^-1 @ T06
+        R0 = (c1 * x6[0] + s1 * x6[1], x6[2], s1 * x6[0] - c1 * x6[1])
+        R1 = (c1 * y6[0] + s1 * y6[1], y6[2], s1 * y6[0] - c1 * y6[1])
+        R2 = (c1 * z6[0] + s1 * z6[1], z6[2], s1 * z6[0] - c1 * z6[1])
+        p16 = (c1 * p6[0] + s1 * p6[1], p6[2] - D1, s1 * p6[0] - c1 * p6[1])
+        for theta5 in (wrist, -wrist):
+            s5, c5 = math.sin(theta5), math.cos(theta5)
+            if abs(s5) < 1e-9:
+                theta6 = wrist_3
+            else:
+                theta6 = math.atan2((-y6[0] * s1 + y6[1] * c1) / s5, (x6[0] * s1 - x6[1] * c1) / s5)
+            s6, c6 = math.sin(theta6), math.cos(theta6)
+            # T14 = T16 @ (T45 @ T56)^-1, the columns of its rotation are R16 @ (rows a, b, c of R46)
+            a0, a1, a2 = c5 * c6, -c5 * s6, -s5
+            b0, b1, b2 = s5 * c6, -s5 * s6, c5
+            x14 = (a0 * R0[0] + a1 * R1[0] + a2 * R2[0], a0 * R0[1] + a1 * R1[1] + a2 * R2[1])
+            y14 = (b0 * R0[0] + b1 * R1[0] + b2 * R2[0], b0 * R0[1] + b1 * R1[1] + b2 * R2[1], b0 * R0[2] + b1 * R1[2] + b2 * R2[2])
+            z14 = (-s6 * R0[0] - c6 * R1[0], -s6 * R0[1] - c6 * R1[1], -s6 * R0[2] - c6 * R1[2])
+            x14_z = a0 * R0[2] + a1 * R1[2] + a2 * R2[2]
+            # Position of T14 = p16 - R14 @ p46, minus D4 along its y axis
+            px46, py46 = -s5 * D6, c5 * D6 + D4
+            p13x = p16[0] - x14[0] * px46 - y14[0] * py46 - z14[0] * D5
+            p13y = p16[1] - x14[1] * px46 - y14[1] * py46 - z14[1] * D5
+            p13z = p16[2] - x14_z * px46 - y14[2] * py46 - z14[2] * D5
+            p13_norm = math.sqrt(p13x * p13x + p13y * p13y + p13z * p13z)
+            elbow = acos((p13_norm ** 2 - A2 ** 2 - A3 ** 2) / (2 * A2 * A3))
+            for theta3 in (elbow, -elbow):
+                theta2 = -math.atan2(p13y, -p13x) + asin(A3 * math.sin(theta3) / p13_norm)
+                # The rotation of T14 is Rz(theta2 + theta3 + theta4) @ Rx(pi / 2)
+                theta4 = math.atan2(x14[1], x14[0]) - theta2 - theta3
+                # Wrapped to (-pi, pi]
+                solutions.append([math.pi - (math.pi - angle) % (2 * math.pi) for angle in (theta1, theta2, theta3, theta4, theta5, theta6)])
+    return solutions
+
+
+def inverse_kinematics_single(pose, reference, lower_limits, upper_limits, max_joint_step=math.inf, stretch=False):
+    """
+    Same as `inverse_kinematics` for a single pose of shape (7,) and reference of shape (6,), with scalar operations.
+    With infinite limits, the branch closest to the reference is returned whatever the actual limits, like with
+    PyBullet IK, and with `stretch` the poses out of reach are approached as in `inverse_kinematics_branches_single`.
+
+    Returns:
+    The joints as a list of 6 floats, or None if the pose has no solution
+    """
+    # Python floats, NumPy scalars are much slower in scalar arithmetic
+    reference = [float(value) for value in reference]
+    limits = list(zip([float(value) for value in lower_limits], [float(value) for value in upper_limits]))
+    best, best_distance = None, math.inf
+    for solution in inverse_kinematics_branches_single(pose, reference[5], stretch):
+        joints, distance = [], 0.0
+        for angle, ref, (lower, upper) in zip(solution, reference, limits):
+            # Moved by multiples of 2*pi as close as possible to the reference, then into the limits
+            angle = ref + (angle - ref + math.pi) % (2 * math.pi) - math.pi
+            if angle > upper:
+                angle -= 2 * math.pi
+            if angle < lower:
+                angle += 2 * math.pi
+            # Also False for NaN
+            if not (lower <= angle <= upper and abs(angle - ref) <= max_joint_step):
+                break
+            joints.append(angle)
+            distance += (angle - ref) ** 2
+        else:
+            if distance < best_distance:
+                best, best_distance = joints, distance
+    return best
+
+
+def jacobian(joints):
+    """
+    Returns the geometric Jacobian of the `ee_link` frame in the `base_link` frame, of shape (6, 6) (linear
+    then angular velocity, per joint), and the transform of the `ee_link` frame, of shape (4, 4), for the arm
+    joints of shape (6,). Computed with scalar operations, for a single configuration.
+    """
+    # Columns and origin of the frame of each joint, starting from BASE_TO_DH
+    x, y, z, origin = (-1.0, 0.0, 0.0), (0.0, -1.0, 0.0), (0.0, 0.0, 1.0), (0.0, 0.0, 0.0)
+    axes, origins = [], []
+    for i, theta in enumerate(joints):
+        axes.append(z)
+        origins.append(origin)
+        ct, st = math.cos(theta), math.sin(theta)
+        ca, sa, a, d = DH_COS_ALPHA[i], DH_SIN_ALPHA[i], DH_A[i], DH_D[i]
+        # The columns of T @ dh_transform(i, theta)
+        rotated = (ct * x[0] + st * y[0], ct * x[1] + st * y[1], ct * x[2] + st * y[2])
+        normal = (ct * y[0] - st * x[0], ct * y[1] - st * x[1], ct * y[2] - st * x[2])
+        origin = (origin[0] + a * rotated[0] + d * z[0], origin[1] + a * rotated[1] + d * z[1], origin[2] + a * rotated[2] + d * z[2])
+        x, y, z = rotated, (ca * normal[0] + sa * z[0], ca * normal[1] + sa * z[1], ca * normal[2] + sa * z[2]), \
+            (ca * z[0] - sa * normal[0], ca * z[1] - sa * normal[1], ca * z[2] - sa * normal[2])
+    J = np.empty((6, 6))
+    for i, (axis, joint_origin) in enumerate(zip(axes, origins)):
+        r = (origin[0] - joint_origin[0], origin[1] - joint_origin[1], origin[2] - joint_origin[2])
+        J[:3, i] = (axis[1] * r[2] - axis[2] * r[1], axis[2] * r[0] - axis[0] * r[2], axis[0] * r[1] - axis[1] * r[0])
+        J[3:, i] = axis
+    # The columns of the `ee_link` frame are (z, -x, -y) of the DH flange frame
+    T = np.array([[z[0], -x[0], -y[0], origin[0]],
+                  [z[1], -x[1], -y[1], origin[1]],
+                  [z[2], -x[2], -y[2], origin[2]],
+                  [0.0, 0.0, 0.0, 1.0]])
+    return J, T
+
+
+def clip_to_limits(pose, joints, lower_limits, upper_limits, max_refined_excess=0.1, iterations=2, position_weight=10.0,
+                   damping=0.1, tolerance=1e-4):
+    """
+    Clips IK joints to the limits. When they exceed the limits by at most `max_refined_excess` radians, the joints
+    that are not at a limit then absorb the motion of the clipped ones as far as possible, with damped least
+    squares steps (the position error in meters is weighted by `position_weight` against the orientation error
+    in radians, and the damping keeps the steps small near singularities). Larger excesses are only clipped, like
+    the joint motors do with the PyBullet IK targets, as absorbing them would move the arm far from the solution.
+
+    Parameters:
+    - pose: The end-effector pose (x, y, z, qx, qy, qz, qw) in the `base_link` frame, of shape (7,)
+    - joints: The joints of the pose, e.g. returned by `inverse_kinematics_single` with infinite limits, of shape (6,)
+    - lower_limits, upper_limits: The limits of the joints, of shape (6,)
+    - iterations: The maximum number of steps, fewer when the weighted error gets below `tolerance`
+
+    Returns:
+    The joints as a list of 6 floats, within the limits
+    """
+    clipped = np.clip(joints, lower_limits, upper_limits)
+    excess = np.max(np.abs(clipped - joints))
+    if excess == 0.0 or excess > max_refined_excess:
+        return clipped.tolist()
+    target_position = [float(value) for value in pose[:3]]
+    target_rotation = _rotation_columns(pose[3:])
+    weights = np.array([position_weight] * 3 + [1.0] * 3)
+    joints = clipped
+    free = (joints > lower_limits) & (joints < upper_limits)
+    for _ in range(iterations):
+        J, T = jacobian(joints)
+        # Rotation vector of target @ current^T: its skew-symmetric part is half the sum of the cross products
+        # of the current and target columns, and its trace the sum of their dot products
+        skew, cosine = [0.0, 0.0, 0.0], -0.5
+        for c, t in zip(T[:3, :3].T.tolist(), target_rotation):
+            skew[0] += (c[1] * t[2] - c[2] * t[1]) / 2
+            skew[1] += (c[2] * t[0] - c[0] * t[2]) / 2
+            skew[2] += (c[0] * t[1] - c[1] * t[0]) / 2
+            cosine += (c[0] * t[0] + c[1] * t[1] + c[2] * t[2]) / 2
+        sin = math.sqrt(skew[0] ** 2 + skew[1] ** 2 + skew[2] ** 2)
+        scale = math.atan2(sin, cosine) / sin if sin > 1e-12 else 1.0
+        position = T[:3, 3].tolist()
+        error = weights * [target_position[0] - position[0], target_position[1] - position[1], target_position[2] - position[2],
+                           skew[0] * scale, skew[1] * scale, skew[2] * scale]
+        if error @ error < tolerance ** 2:
+            break
+        A = weights[:, None] * J[:, free]
+        joints[free] += A.T @ np.linalg.solve(A @ A.T + damping ** 2 * np.eye(6), error)
+        joints = np.clip(joints, lower_limits, upper_limits)
+    return joints.tolist()
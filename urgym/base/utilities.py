@@ -2,11 +2,9 @@ import pybullet as p
 import glob
 from collections import namedtuple
 import functools
-import torch
-import cv2
-from scipy import ndimage
 import numpy as np
 import math
+from urgym.base import quaternions
 
 
 class Models:
@@ -28,7 +26,7 @@ class YCBModels(Models):
         self.visual_shapes = []
         self.collision_shapes = []
 
-    def load_objects(self):
+    def load_objects(self, physicsClient=0):
         shift = [0, 0, 0]
         mesh_scale = [1, 1, 1]
 
@@ -46,12 +44,14 @@ class YCBModels(Models):
                 p.createCollisionShape(shapeType=p.GEOM_MESH,
                                        fileName=filename,
                                        collisionFramePosition=shift,
-                                       meshScale=mesh_scale))
+                                       meshScale=mesh_scale,
+                                       physicsClientId=physicsClient))
             self.visual_shapes.append(
                 p.createVisualShape(shapeType=p.GEOM_MESH,
                                     fileName=filename,
                                     visualFramePosition=shift,
-                                    meshScale=mesh_scale))
+                                    meshScale=mesh_scale,
+                                    physicsClientId=physicsClient))
 
     def __len__(self):
         return len(self.collision_shapes)
@@ -84,11 +84,11 @@ class Camera:
 
         return position[:3]
 
-    def shot(self):
+    def shot(self, physicsClient=0):
         # Get depth values using the OpenGL renderer
         _w, _h, rgb, depth, seg = p.getCameraImage(self.width, self.height,
                                                    self.view_matrix, self.projection_matrix,
-                                                   )
+                                                   physicsClientId=physicsClient)
         return rgb, depth, seg
 
     def rgbd_2_world_batch(self, depth):
@@ -108,26 +108,27 @@ class Camera:
 
         return position[:, :3].reshape(*x.shape, -1)
 
-def print_links(body_id):
+def print_links(body_id, physicsClient=0):
     """
     Prints the number of links (parts) in the body and information about each joint/link.
 
     Parameters:
     - body_id: The ID of the body
+    - physicsClient: The ID of the physics client the body lives in
 
     Returns:
     None
     """
-    num_joints = p.getNumJoints(body_id)
+    num_joints = p.getNumJoints(body_id, physicsClientId=physicsClient)
     print("Number of links (parts) in the body:", num_joints)
 
     # Print base link information (base link has index -1)
-    base_link_name = p.getBodyInfo(body_id)[0].decode('utf-8')
+    base_link_name = p.getBodyInfo(body_id, physicsClientId=physicsClient)[0].decode('utf-8')
     print(f"Link ID -1: {base_link_name}")
 
     # Print information about each joint/link
     for i in range(num_joints):
-        joint_info = p.getJointInfo(body_id, i)
+        joint_info = p.getJointInfo(body_id, i, physicsClientId=physicsClient)
         link_name = joint_info[12].decode('utf-8')
         print(f"Link ID {i}: {link_name}")
 
@@ -144,7 +145,7 @@ def rotate_quaternion(quaternion, angle, axis):
     The rotated quaternion
     """
     # Create a quaternion from the axis and angle
-    rot_quaternion = p.getQuaternionFromAxisAngle(axis, angle)
+    rot_quaternion = quaternions.from_axis_angle(axis, angle)
     # Multiply the original quaternion by the rotation quaternion
     return quaternion_multiply(quaternion, rot_quaternion)
 
@@ -206,17 +207,35 @@ def geometric_distance_reward(value: float, threshold_sign: float, threshold_max
     factor2 = max(threshold_max - value, 1e-10)  # To avoid division by zero
     return -np.tanh(factor1/factor2)
 
-def print_link_names_and_indices(id):
+def geometric_distance_reward_batch(values, threshold_sign: float, threshold_max: float):
+    """
+    Vectorized `geometric_distance_reward`, for rescoring many transitions at once.
+
+    Parameters:
+    - values: Array of distances, of any shape
+    - threshold_sign: Threshold that divides positive and negative rewards
+    - threshold_max: Maximum value of distance to generate a -1 reward
+
+    Returns:
+    An array of rewards between -1 and +1 with the shape of `values`
+    """
+    values = np.maximum(np.asarray(values, dtype=np.float64), 1e-10) # To avoid division by zero
+    factor1 = (values - threshold_sign) / values
+    factor2 = np.maximum(threshold_max - values, 1e-10) # To avoid division by zero
+    return -np.tanh(factor1 / factor2)
+
+def print_link_names_and_indices(id, physicsClient=0):
     """
     Prints the link names and indices of an object.
 
     :param id: The ID of the object in the PyBullet simulation
+    :param physicsClient: The ID of the physics client the object lives in
     """
-    num_joints = p.getNumJoints(id)
+    num_joints = p.getNumJoints(id, physicsClientId=physicsClient)
     print(f"Object ID: {id} has {num_joints} joints/links.")
 
     for i in range(num_joints):
-        link_info = p.getJointInfo(id, i)
+        link_info = p.getJointInfo(id, i, physicsClientId=physicsClient)
         link_name = link_info[12].decode('utf-8')  # Link name is at index 12
         print(f"Link Index: {i}, Link Name: {link_name}")
 
@@ -283,4 +302,18 @@ def z_alignment_distance(roll, pitch, yaw):
     # Normalize the angle to the range [0, 1]
     normalized_theta = theta / np.pi
     
-    return normalized_theta
\ No newline at end of file
+    return normalized_theta
+
+def z_alignment_distance_batch(roll, pitch, yaw):
+    """
+    Vectorized `z_alignment_distance`, for arrays of Euler angles of the same shape.
+
+    The downward vector rotated by Rz @ Ry @ Rx has a z component of -cos(roll) * cos(pitch), so the cosine of
+    its angle with the downward direction is cos(roll) * cos(pitch) and the yaw does not contribute.
+
+    Returns:
+    An array of normalized angles between 0 (pointing downwards) and 1 (pointing upwards)
+    """
+    cos_theta = np.cos(np.asarray(roll, dtype=np.float64)) * np.cos(np.asarray(pitch, dtype=np.float64))
+    theta = np.arccos(np.clip(cos_theta, -1.0, 1.0))
+    return theta / np.pi
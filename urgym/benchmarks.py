@@ -0,0 +1,274 @@
+"""
+Benchmarks of the URGym environments, to check the performance changes of the simulation.
+
+For each registered URGym id and each policy (uniformly random actions, and the scripted expert of
+`urgym.experts` when the environment has one), a fresh process measures the construction time, the reset
+latency, the distribution of the step latency, the settle substeps per step (and all the simulation substeps,
+counted with the PyBullet calls), the PyBullet calls per step and the peak resident memory. The results are
+written as JSON, and compared against a previous output to flag the metrics that got worse by more than a
+tolerance:
+
+    python -m urgym.benchmarks --output baseline.json
+    python -m urgym.benchmarks --output current.json --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import collections
+import contextlib
+import functools
+import json
+import multiprocessing as mp
+import resource
+import sys
+import time
+
+import numpy as np
+import gymnasium as gym
+import pybullet
+
+import urgym.envs  # Registers the URGym ids, also in spawned workers
+from urgym.experts import EXPERTS, make_expert
+
+
+POLICIES = ('random', 'scripted')
+
+# Metrics compared against the baseline, all of them are better when lower
+COMPARED_METRICS = (
+    'construction_seconds',
+    'reset_mean_seconds',
+    'step_mean_seconds',
+    'step_p50_seconds',
+    'step_p90_seconds',
+    'substeps_per_step',
+    'simulation_substeps_per_step',
+    'pybullet_calls_per_step',
+    'peak_rss_mb',
+)
+
+
+def registered_env_ids():
+    """
+    Returns the ids of the environments registered by `urgym.envs`.
+    """
+    return [env_id for env_id in gym.registry if env_id.startswith('URGym/')]
+
+
+@contextlib.contextmanager
+def count_pybullet_calls():
+    """
+    Counts the calls to the functions of the pybullet module inside the context, by replacing them with
+    counting wrappers (the environments call them through the module, as `p.<function>`).
+
+    Returns:
+    A `collections.Counter` of the calls of each function, filled until the end of the context
+    """
+    counts = collections.Counter()
+    originals = {name: function for name, function in vars(pybullet).items() if callable(function) and not name.startswith('_')}
+
+    def counted(name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    for name, function in originals.items():
+        setattr(pybullet, name, counted(name, function))
+    try:
+        yield counts
+    finally:
+        for name, function in originals.items():
+            setattr(pybullet, name, function)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def benchmark_env(env_id, policy='random', num_steps=200, num_resets=10, count_steps=20, seed=0, env_kwargs=None):
+    """
+    Benchmarks an environment, meant to run in a fresh process for the construction time and the peak memory.
+
+    Parameters:
+    - env_id: The id of the environment
+    - policy: 'random' for uniformly random actions, or 'scripted' for the expert of `urgym.experts`
+    - num_steps: The number of timed steps, the episodes are reset when they end (the resets are not included)
+    - num_resets: The number of timed resets
+    - count_steps: The number of additional steps during which the PyBullet calls are counted, not timed
+    - seed: The seed of the first reset, the following ones use consecutive seeds
+    - env_kwargs: Additional keyword arguments for `gym.make`
+
+    Returns:
+    A dict with the results
+    """
+    assert policy in POLICIES, f"Unknown policy {policy}, available: {', '.join(POLICIES)}"
+    start = time.perf_counter()
+    env = gym.make(env_id, render_mode=None, **(env_kwargs or {}))
+    construction_seconds = time.perf_counter() - start
+    # Box-v0 runs a fixed number of substeps per step, without a settle detector
+    settle_detector = getattr(env.unwrapped, 'settle_detector', None)
+    engine_parameters = pybullet.getPhysicsEngineParameters(physicsClientId=env.unwrapped.physicsClient)
+    substeps_per_call = max(engine_parameters['numSubSteps'], 1)
+    env.action_space.seed(seed)
+    expert = make_expert(env, env_id) if policy == 'scripted' else None
+    next_seed = seed
+
+    def reset():
+        nonlocal next_seed
+        start = time.perf_counter()
+        observation, _ = env.reset(seed=next_seed)
+        seconds = time.perf_counter() - start
+        next_seed += 1
+        if expert is not None:
+            expert.reset()
+        return observation, seconds
+
+    def act(observation):
+        return expert(observation) if expert is not None else env.action_space.sample()
+
+    reset_seconds = [reset()[1] for _ in range(num_resets)]
+
+    observation, _ = reset()
+    step_seconds, substeps, episodes, successes = [], [], 0, 0
+    for _ in range(num_steps):
+        action = act(observation)
+        start = time.perf_counter()
+        observation, reward, terminated, truncated, info = env.step(action)
+        step_seconds.append(time.perf_counter() - start)
+        if settle_detector is not None:
+            substeps.append(settle_detector.last_substeps)
+        if terminated or truncated:
+            episodes += 1
+            successes += bool(info.get('is_success', False))
+            observation, _ = reset()
+
+    counted_steps = 0
+    with count_pybullet_calls() as calls:
+        while counted_steps < count_steps:
+            observation, reward, terminated, truncated, info = env.step(act(observation))
+            counted_steps += 1
+            if terminated or truncated:
+                break
+    env.close()
+
+    robot = env.unwrapped.robot
+    step_seconds = np.array(step_seconds)
+    return {
+        'env_id': env_id,
+        'policy': policy,
+        'steps': num_steps,
+        'resets': num_resets,
+        'seed': seed,
+        'construction_seconds': construction_seconds,
+        'reset_mean_seconds': float(np.mean(reset_seconds)),
+        'reset_max_seconds': float(np.max(reset_seconds)),
+        'resets_per_second': 1.0 / float(np.mean(reset_seconds)),
+        'step_mean_seconds': float(np.mean(step_seconds)),
+        'step_p50_seconds': float(np.percentile(step_seconds, 50)),
+        'step_p90_seconds': float(np.percentile(step_seconds, 90)),
+        'step_p99_seconds': float(np.percentile(step_seconds, 99)),
+        'step_max_seconds': float(np.max(step_seconds)),
+        'steps_per_second': 1.0 / float(np.mean(step_seconds)),
+        'substeps_per_step': float(np.mean(substeps)) if substeps else None,
+        'simulation_substeps_per_step': calls['stepSimulation'] * substeps_per_call / max(counted_steps, 1),
+        'pybullet_calls_per_step': sum(calls.values()) / max(counted_steps, 1),
+        'pybullet_calls': dict(calls.most_common()),
+        'completed_episodes': episodes,
+        'success_rate': successes / episodes if episodes else None,
+        # Analytic IK calls of the whole benchmark, and those without an exact solution within the limits
+        'ik_solves': robot.ik_solves,
+        'ik_fallbacks': robot.ik_fallbacks,
+        'ik_unreachable': robot.ik_unreachable,
+        'ik_clipped': robot.ik_clipped,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_benchmarks(env_ids=None, policies=POLICIES, num_steps=200, num_resets=10, count_steps=20, seed=0, env_kwargs=None):
+    """
+    Benchmarks each environment with each policy (the scripted one only for the environments with an expert),
+    each time in a new spawned process.
+
+    Returns:
+    A dict with the results of each policy of each environment id
+    """
+    results = {}
+    context = mp.get_context('spawn')
+    for env_id in (env_ids if env_ids is not None else registered_env_ids()):
+        results[env_id] = {}
+        for policy in policies:
+            if policy == 'scripted' and env_id not in EXPERTS:
+                continue
+            with context.Pool(1) as pool:
+                results[env_id][policy] = pool.apply(benchmark_env, (env_id, policy, num_steps, num_resets, count_steps, seed, env_kwargs))
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    Compares results with the ones of a baseline, for the environments and policies of both.
+
+    Parameters:
+    - results, baseline: Outputs of `run_benchmarks`
+    - tolerance: The relative increase of a metric of COMPARED_METRICS above which it is a regression
+
+    Returns:
+    A list of the regressions, dicts with the env id, the policy, the metric, the baseline and current values
+    and their ratio
+    """
+    regressions = []
+    for env_id, policies in results.items():
+        for policy, result in policies.items():
+            reference = baseline.get(env_id, {}).get(policy)
+            if reference is None:
+                continue
+            for metric in COMPARED_METRICS:
+                if reference.get(metric) and result.get(metric) is not None and result[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append({'env_id': env_id, 'policy': policy, 'metric': metric, 'baseline': reference[metric],
+                                        'current': result[metric], 'ratio': result[metric] / reference[metric]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the URGym environments and compare the results against a baseline")
+    parser.add_argument('--envs', nargs='+', help="Environment ids, all the registered URGym ids by default")
+    parser.add_argument('--policies', nargs='+', choices=POLICIES, default=list(POLICIES), help="Policies of the actions")
+    parser.add_argument('--steps', type=int, default=200, help="Number of timed steps per environment and policy")
+    parser.add_argument('--resets', type=int, default=10, help="Number of timed resets per environment and policy")
+    parser.add_argument('--count-steps', type=int, default=20, help="Number of steps during which the PyBullet calls are counted")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first reset, the following ones use consecutive seeds")
+    parser.add_argument('--sim-substeps', type=int, default=1, help="Physics substeps per p.stepSimulation() call of the environments")
+    parser.add_argument('--ik-solver', choices=('pybullet', 'analytic'), default='pybullet', help="IK solver of the end-effector control of the environments")
+    parser.add_argument('--output', help="Path of the JSON file to write")
+    parser.add_argument('--baseline', help="JSON file written by a previous run to compare the results against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Relative increase of a metric above which it is reported as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.envs, args.policies, args.steps, args.resets, args.count_steps, args.seed,
+                             dict(sim_substeps=args.sim_substeps, ik_solver=args.ik_solver))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    for env_id, policies in results.items():
+        for policy, result in policies.items():
+            print(f"{env_id} ({policy}): construction {result['construction_seconds']:.2f} s, reset {1000 * result['reset_mean_seconds']:.1f} ms, "
+                  f"step {1000 * result['step_p50_seconds']:.1f} / {1000 * result['step_p90_seconds']:.1f} / {1000 * result['step_p99_seconds']:.1f} ms (p50/p90/p99), "
+                  f"{result['simulation_substeps_per_step']:.1f} substeps/step, {result['pybullet_calls_per_step']:.0f} PyBullet calls/step, {result['peak_rss_mb']:.0f} MB")
+            if args.ik_solver == 'analytic':
+                print(f"{env_id} ({policy}): {result['ik_solves']} analytic IK solves, {result['ik_fallbacks']} PyBullet fallbacks, "
+                      f"{result['ik_unreachable']} out of reach, {result['ik_clipped']} clipped to the joint limits")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression of {regression['env_id']} ({regression['policy']}): {regression['metric']} "
+                  f"{regression['baseline']:.4g} -> {regression['current']:.4g} (x{regression['ratio']:.2f})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression above {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
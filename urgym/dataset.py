@@ -0,0 +1,259 @@
+"""
+Random-access reader of the recordings of `urgym.recording.EpisodeRecorder`.
+
+The chunks of uncompressed recordings (`compress=False`) are memory-mapped, so opening a recording of any size is
+immediate, no data is loaded into the process memory until it is read, and contiguous reads inside a chunk (e.g.
+most episodes) are views with no copy. Compressed recordings are readable too, but each column of a chunk is
+decompressed in memory when first read; `decompress_recording` converts them once into memory-mappable ones.
+
+    dataset = TrajectoryDataset('cubes_push_data')
+    batch = dataset.sample(256)                 # Random transitions, with their next observations
+    windows = dataset.sample_windows(256, 5)    # Random 5-step windows inside episodes
+    episode = dataset.episode(0)                # All the transitions of an episode
+"""
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from urgym.recording import METADATA_FILE
+
+
+class ChunkedColumn(object):
+    """
+    A column of a recorded table, indexed as a single array over all its chunks.
+    """
+
+    def __init__(self, chunks, dtype, shape):
+        """
+        Arguments:
+            chunks: List of callables returning the array of the column in each chunk
+            dtype: The dtype of the column
+            shape: Tuple, the shape of one row
+        """
+        self.chunks = chunks
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.offsets = None
+
+    def set_lengths(self, lengths):
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, index):
+        """
+        Returns the rows of an integer, a slice or an array of integers. Slices inside a single chunk are views
+        of the (memory-mapped) chunk.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                first = int(np.searchsorted(self.offsets, start, side='right')) - 1
+                if first < len(self.chunks) and stop <= self.offsets[first + 1]:
+                    return self.chunks[first]()[start - self.offsets[first]:stop - self.offsets[first]]
+            index = np.arange(start, stop, step)
+        elif np.ndim(index) == 0:
+            index = int(index) + (len(self) if index < 0 else 0)
+            chunk = int(np.searchsorted(self.offsets, index, side='right')) - 1
+            return self.chunks[chunk]()[index - self.offsets[chunk]]
+
+        index = np.asarray(index, dtype=np.int64)
+        out = np.empty(index.shape + self.shape, dtype=self.dtype)
+        chunk_ids = np.searchsorted(self.offsets, index, side='right') - 1
+        for chunk in np.unique(chunk_ids):
+            mask = chunk_ids == chunk
+            out[mask] = self.chunks[chunk]()[index[mask] - self.offsets[chunk]]
+        return out
+
+
+class RecordedTable(object):
+    """
+    A table of a recording, a dict-like collection of `ChunkedColumn`.
+    """
+
+    def __init__(self, path, metadata, compressed, cache):
+        self.path = path
+        self.lengths = [chunk['length'] for chunk in metadata['chunks']]
+        self.columns = {}
+        for column, spec in metadata['columns'].items():
+            chunks = [self.chunk_loader(chunk['file'], column, compressed, cache) for chunk in metadata['chunks']]
+            self.columns[column] = ChunkedColumn(chunks, np.dtype(spec['dtype']), spec['shape'])
+            self.columns[column].set_lengths(self.lengths)
+
+    def chunk_loader(self, file, column, compressed, cache):
+        if not compressed:
+            array = np.load(os.path.join(self.path, file, column + '.npy'), mmap_mode='r')
+            return lambda: array
+        return lambda: cache.get(os.path.join(self.path, file + '.npz'), column)
+
+    def __len__(self):
+        return int(sum(self.lengths))
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def get(self, index, columns=None):
+        """
+        Returns a dict with the rows `index` of the given columns (all of them if None).
+        """
+        return {column: self.columns[column][index] for column in (self.columns if columns is None else columns)}
+
+
+class DecompressedChunkCache(object):
+    """
+    Least recently used cache of the decompressed columns of the chunks of compressed recordings.
+    """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = OrderedDict()
+
+    def get(self, file, column):
+        key = (file, column)
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        with np.load(file) as chunk:
+            array = chunk[column]
+        self.items[key] = array
+        if len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+        return array
+
+
+class TrajectoryDataset(object):
+    """
+    A recording of `EpisodeRecorder`, with random access to its transitions and episodes.
+
+    Only the transitions of the episodes of the episodes table are sampled, i.e. the complete transitions of an
+    interrupted recording are ignored.
+    """
+
+    def __init__(self, path, cache_size: int = 64):
+        """
+        Arguments:
+            path: String, the directory of the recording
+            cache_size: Int, the number of decompressed chunk columns kept in memory, for compressed recordings
+
+        Attributes:
+            transitions, episodes: RecordedTable, the two tables of the recording
+            starts, lengths: Arrays, the first transition and the length of each episode
+        """
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        self.path = path
+        self.env_id = self.metadata['env_id']
+        self.compressed = self.metadata['compressed']
+        cache = DecompressedChunkCache(cache_size)
+        self.transitions = RecordedTable(path, self.metadata['tables']['transitions'], self.compressed, cache)
+        self.episodes = RecordedTable(path, self.metadata['tables']['episodes'], self.compressed, cache)
+        self.starts = np.asarray(self.episodes['start'][:], dtype=np.int64)
+        self.lengths = np.asarray(self.episodes['length'][:], dtype=np.int64)
+        self.observation_columns = [column for column in self.transitions.columns if column.startswith('observation')]
+
+    @property
+    def num_episodes(self):
+        return len(self.starts)
+
+    @property
+    def num_transitions(self):
+        return int(self.lengths.sum())
+
+    def __len__(self):
+        return self.num_transitions
+
+    def episode(self, index, columns=None):
+        """
+        Returns the transitions of an episode, views of the memory-mapped chunks unless the episode spans
+        several chunks, and its final observation as the `final_observation*` columns.
+        """
+        start = self.starts[index]
+        batch = self.transitions.get(slice(start, start + self.lengths[index]), columns)
+        for column in self.observation_columns:
+            batch['final_' + column] = self.episodes['final_' + column][index]
+        return batch
+
+    def episode_indices(self, indices):
+        """
+        Returns the episode of each transition index.
+        """
+        return np.searchsorted(self.starts, indices, side='right') - 1
+
+    def transition_indices(self, positions):
+        """
+        Maps positions in [0, num_transitions) to transition indices, skipping the transitions that are not part
+        of a recorded episode.
+        """
+        offsets = np.concatenate([[0], np.cumsum(self.lengths)])
+        episodes = np.searchsorted(offsets, positions, side='right') - 1
+        return self.starts[episodes] + positions - offsets[episodes]
+
+    def next_observations(self, indices):
+        """
+        Returns the observations that follow the given transitions: the observation of the next transition, or the
+        final observation of the episode for its last transition.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        episodes = self.episode_indices(indices)
+        last = indices == self.starts[episodes] + self.lengths[episodes] - 1
+        next_indices = np.where(last, self.starts[episodes], indices + 1) # Any valid row where `last`
+        batch = {}
+        for column in self.observation_columns:
+            values = self.transitions[column][next_indices]
+            values[last] = self.episodes['final_' + column][episodes[last]]
+            batch['next_' + column] = values
+        return batch
+
+    def sample(self, batch_size, rng=None, columns=None):
+        """
+        Returns a dict with the columns of `batch_size` random transitions, drawn uniformly with the given
+        `np.random.Generator`, and their `next_observation*`.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        indices = self.transition_indices(rng.integers(self.num_transitions, size=batch_size))
+        batch = self.transitions.get(indices, columns)
+        batch.update(self.next_observations(indices))
+        return batch
+
+    def sample_windows(self, batch_size, n, rng=None, columns=None):
+        """
+        Returns a dict with the columns of `batch_size` random windows of `n` consecutive transitions of the same
+        episode, with shape (batch_size, n, ...), and the `next_observation*` after the last transition of each
+        window, e.g. for n-step returns. Episodes shorter than `n` are never sampled.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        valid_lengths = np.maximum(self.lengths - n + 1, 0)
+        assert valid_lengths.sum() > 0, f"No episode has {n} transitions"
+        offsets = np.concatenate([[0], np.cumsum(valid_lengths)])
+        positions = rng.integers(offsets[-1], size=batch_size)
+        episodes = np.searchsorted(offsets, positions, side='right') - 1
+        starts = self.starts[episodes] + positions - offsets[episodes]
+        indices = starts[:, None] + np.arange(n)
+        batch = self.transitions.get(indices, columns)
+        batch.update(self.next_observations(indices[:, -1]))
+        return batch
+
+
+def decompress_recording(path, output):
+    """
+    Converts a compressed recording into an uncompressed one, whose chunks are memory-mapped when read.
+    """
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    assert metadata['compressed'], f"{path} is not compressed"
+    os.makedirs(output)
+    for table in metadata['tables'].values():
+        for chunk in table['chunks']:
+            os.makedirs(os.path.join(output, chunk['file']))
+            with np.load(os.path.join(path, chunk['file'] + '.npz')) as data:
+                for column in table['columns']:
+                    np.save(os.path.join(output, chunk['file'], column + '.npy'), data[column])
+    metadata['compressed'] = False
+    with open(os.path.join(output, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=1)
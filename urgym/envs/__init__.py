@@ -47,4 +47,28 @@ register(
     id='URGym/GolfJoints-v0',
     entry_point='urgym.envs.env_golf_joints_v0:Golf',
     max_episode_steps=100,
-)
\ No newline at end of file
+)
+
+register(
+    id='URGym/CubesPushGoal-v0',
+    entry_point='urgym.envs.env_cubes_push_goal_v0:CubesPushGoal',
+    max_episode_steps=50,
+)
+
+register(
+    id='URGym/CubesPushDiffGoal-v0',
+    entry_point='urgym.envs.env_cubes_push_goal_v0:CubesPushDiffGoal',
+    max_episode_steps=50,
+)
+
+register(
+    id='URGym/GolfGoal-v0',
+    entry_point='urgym.envs.env_golf_goal_v0:GolfGoal',
+    max_episode_steps=100,
+)
+
+register(
+    id='URGym/GolfJointsGoal-v0',
+    entry_point='urgym.envs.env_golf_goal_v0:GolfJointsGoal',
+    max_episode_steps=100,
+)
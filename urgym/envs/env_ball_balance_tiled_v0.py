@@ -0,0 +1,108 @@
+import math
+import numpy as np
+
+from gymnasium.spaces import Box
+
+import pybullet as p
+from urgym.base.tiled import TiledEnv
+from urgym.base import quaternions
+
+class BallBalanceTiled(TiledEnv):
+    """
+    Batched version of BallBalance: N robots, each one with its own table, paddle and ball, share a single PyBullet world.
+
+    `step(actions)` takes an array of shape (N, 3) and returns stacked observations of shape (N, 6),
+    with the same layout, rewards and terminations as URGym/BallBalance-v0.
+
+    Note that the balls of the scenes that are not being reset keep rolling while the finished scenes are reset.
+    """
+
+    def __init__(self, num_envs: int, max_episode_steps=500, render_mode=None, sim_substeps=1) -> None:
+        """
+        Initialize the tiled BallBalance environment.
+
+        Parameters:
+        - num_envs (int): The number of robots/scenes.
+        - max_episode_steps (int): Steps after which a scene episode is truncated. Default is 500.
+        - render_mode (str): The rendering mode. Options are 'human' and 'non-human'. Default is None.
+        - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+        """
+        # Observations: the paddle roll, pitch, yaw and the ball position relative the center of the paddle
+        observation_space = Box(low=np.array([-math.pi]*3 + [-1.0]*3), high=np.array([math.pi]*3 + [1.0]*3), dtype=np.float64)
+        # Actions: (dx, dy, dz) for end-effector euler displacement
+        action_space = Box(low=np.array([-0.1]*3), high=np.array([+0.1]*3), dtype=np.float32)
+
+        super().__init__(num_envs, observation_space, action_space, max_episode_steps, render_mode, sim_substeps)
+
+    def create_tile_scene(self, tile):
+        tile.paddle_id = None
+        tile.ball_id = None
+
+    def reset_tiles(self, tiles):
+        for tile in tiles:
+            tile.robot.reset()
+
+            tile.body_pool.release()
+
+            new_pose = tile.to_world([0.0, -0.60, 0.60]) + [0.50, -0.50, -0.50, 0.50]
+            tile.robot.move_ee(new_pose, 'end')
+            tile.robot.open_gripper(20)
+        self.wait_until_stable(tiles)
+
+        for tile in tiles:
+            pose = np.array(tile.robot.get_ee_pose()[:3])
+            gripper_center = self.get_gripper_geometrical_center(tile)
+            pose[1] -= 0.2
+            pose[2] = gripper_center[2]
+            tile.paddle_id = self.create_balance_paddle(tile, pose)
+            tile.ball_id = self.create_ball(tile)
+
+            tile.robot.close_gripper()
+        self.wait_until_stable(tiles)
+
+    def apply_actions(self, actions):
+        # The orientations of all the tiles are updated in a single batch
+        ee_poses = np.stack([tile.robot.get_ee_pose() for tile in self.tiles])
+        ee_poses[:, 3:] = quaternions.from_euler(quaternions.to_euler(ee_poses[:, 3:]) + actions)
+        for tile in self.tiles:
+            tile.robot.move_ee(ee_poses[tile.index], 'end')
+
+    def evaluate_tile(self, tile):
+        reward = 1 # Balance reward
+        terminated = self.get_ball_position(tile)[2] < self.get_paddle_pose(tile)[2]
+        return reward, terminated, {}
+
+    def get_tile_observation(self, tile):
+        paddle_pose = self.get_paddle_pose(tile)
+        euler = p.getEulerFromQuaternion(paddle_pose[3:]) # To roll, pitch, yaw
+        relative_ball_position = np.array(paddle_pose[:3]) - np.array(self.get_ball_position(tile))
+        return np.concatenate([euler, relative_ball_position])
+
+    def create_balance_paddle(self, tile, base_position):
+        collision_shape = self.shape_cache.collision_shape(shapeType=p.GEOM_BOX, halfExtents=[0.05, 0.1, 0.005])
+        visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_BOX, halfExtents=[0.05, 0.1, 0.005], rgbaColor=[1, 0.5, 0, 1])
+        base_mass = 0.1  # mass of the object
+        return tile.body_pool.acquire('paddle', base_position, [0, 0, 0, 1], lambda: self.add_to_tile(tile,
+            p.createMultiBody(base_mass, collision_shape, visual_shape, base_position, [0, 0, 0, 1], physicsClientId=self.physicsClient)))
+
+    def create_ball(self, tile, radius=0.02):
+        paddle_position, paddle_orientation = p.getBasePositionAndOrientation(tile.paddle_id, physicsClientId=self.physicsClient)
+
+        # Calculate the ball position (centered on top of the paddle)
+        ball_position = [paddle_position[0], paddle_position[1], paddle_position[2] + 0.2 + radius]
+        # Randomize the ball position a little bit
+        ball_position[0] += self.random.uniform(-0.03, 0.03)
+        ball_position[1] += self.random.uniform(-0.08, 0.02)
+
+        collision_shape = self.shape_cache.collision_shape(shapeType=p.GEOM_SPHERE, radius=radius)
+        visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[1, 1, 1, 1])
+        return tile.body_pool.acquire('ball', ball_position, paddle_orientation, lambda: self.add_to_tile(tile,
+            p.createMultiBody(0.01, collision_shape, visual_shape, ball_position, paddle_orientation, physicsClientId=self.physicsClient)))
+
+    def get_paddle_pose(self, tile):
+        position, orientation = p.getBasePositionAndOrientation(tile.paddle_id, physicsClientId=self.physicsClient)
+        return position + orientation
+
+    def get_ball_position(self, tile):
+        position, _ = p.getBasePositionAndOrientation(tile.ball_id, physicsClientId=self.physicsClient)
+        return position
@@ -12,12 +12,13 @@ import pybullet as p
 import pybullet_data
 from urgym.base.utilities import YCBModels, Models, Camera
 from urgym.base.robot import Panda, UR5Robotiq85, UR5Robotiq140
+from urgym.base.settle import configure_substeps
 
 class BoxManipulation(Env):
 
     SIMULATION_STEP_DELAY = 1 / 240.
 
-    def __init__(self, button_touch_mode:str='any', camera=None, render_mode='human') -> None:
+    def __init__(self, button_touch_mode:str='any', camera=None, render_mode='human', sim_substeps: int = 1, ik_solver: str = 'pybullet') -> None:
             """
             Initialize the environment.
 
@@ -25,6 +26,8 @@ class BoxManipulation(Env):
             - button_touch_mode (str): The mode, one of 'any', 'robot' or 'fingers', to determine the valid element that may press the button.
             - camera (optional): The camera object.
             - render_mode (str): The rendering mode of the environment, either 'human' or None.
+            - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+            - ik_solver (str): The IK solver of the end-effector control, 'pybullet' (iterative) or 'analytic' (closed-form UR5 IK, deterministic). Default is 'pybullet'.
 
             Returns:
             None
@@ -51,38 +54,42 @@ class BoxManipulation(Env):
                             (0, 0, 1),
                             0.1, 5, (320, 320), 40)"""
             self.camera = camera
-            # robot = Panda((0, 0.5, 0), (0, 0, math.pi))
-            self.robot = UR5Robotiq85((0, 0.5, 0), (0, 0, 0))
-
             # define environment        
             self.physicsClient = p.connect(p.GUI if self.vis else p.DIRECT)
-            p.setAdditionalSearchPath(pybullet_data.getDataPath())
-            p.setGravity(0, 0, -10)
+            self.sim_substeps = sim_substeps
+            if sim_substeps > 1:
+                configure_substeps(self.physicsClient, sim_substeps)
+            p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physicsClient)
+            p.setGravity(0, 0, -10, physicsClientId=self.physicsClient)
             # Hide right and left menus
-            p.configureDebugVisualizer(p.COV_ENABLE_GUI,0)
+            p.configureDebugVisualizer(p.COV_ENABLE_GUI,0, physicsClientId=self.physicsClient)
             # Reorient the debug camera
-            p.resetDebugVisualizerCamera(cameraDistance=2, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.5,0])
-            self.planeID = p.loadURDF("plane.urdf")
+            p.resetDebugVisualizerCamera(cameraDistance=2, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.5,0], physicsClientId=self.physicsClient)
+            self.planeID = p.loadURDF("plane.urdf", physicsClientId=self.physicsClient)
 
+            # robot = Panda((0, 0.5, 0), (0, 0, math.pi), self.physicsClient)
+            self.robot = UR5Robotiq85((0, 0.5, 0), (0, 0, 0), self.physicsClient)
             self.robot.load()
             self.robot.step_simulation = self.step_simulation
+            self.robot.sim_substeps = sim_substeps
+            self.robot.ik_solver = ik_solver
             self.control_method = 'end'
 
             # custom sliders to tune parameters (name of the parameter,range,initial value)
-            self.xin = p.addUserDebugParameter("x", -1, 1, 0)
-            self.yin = p.addUserDebugParameter("y", -1, 1, 0)
-            self.zin = p.addUserDebugParameter("z", 0, 1., 0.5)
-            self.rollId = p.addUserDebugParameter("roll", -3.14, 3.14, 0)
-            self.pitchId = p.addUserDebugParameter("pitch", -3.14, 3.14, np.pi/2)
-            self.yawId = p.addUserDebugParameter("yaw", -np.pi/2, np.pi/2, np.pi/2)
-            self.gripper_opening_length_control = p.addUserDebugParameter("gripper_opening_length", 0, 0.085, 0.04)
+            self.xin = p.addUserDebugParameter("x", -1, 1, 0, physicsClientId=self.physicsClient)
+            self.yin = p.addUserDebugParameter("y", -1, 1, 0, physicsClientId=self.physicsClient)
+            self.zin = p.addUserDebugParameter("z", 0, 1., 0.5, physicsClientId=self.physicsClient)
+            self.rollId = p.addUserDebugParameter("roll", -3.14, 3.14, 0, physicsClientId=self.physicsClient)
+            self.pitchId = p.addUserDebugParameter("pitch", -3.14, 3.14, np.pi/2, physicsClientId=self.physicsClient)
+            self.yawId = p.addUserDebugParameter("yaw", -np.pi/2, np.pi/2, np.pi/2, physicsClientId=self.physicsClient)
+            self.gripper_opening_length_control = p.addUserDebugParameter("gripper_opening_length", 0, 0.085, 0.04, physicsClientId=self.physicsClient)
 
             self.boxID = p.loadURDF(os.path.join(current_dir, "../urdf/skew-box-button.urdf"),
                                     [0.0, 0.0, 0.0],
                                     # p.getQuaternionFromEuler([0, 1.5706453, 0]),
                                     p.getQuaternionFromEuler([0, 0, 0]),
                                     useFixedBase=True,
-                                    flags=p.URDF_MERGE_FIXED_LINKS | p.URDF_USE_SELF_COLLISION)
+                                    flags=p.URDF_MERGE_FIXED_LINKS | p.URDF_USE_SELF_COLLISION, physicsClientId=self.physicsClient)
 
             # For calculating the reward
             self.box_opened = False
@@ -94,9 +101,9 @@ class BoxManipulation(Env):
         """
         Hook p.stepSimulation()
         """
-        p.stepSimulation()
+        p.stepSimulation(physicsClientId=self.physicsClient)
         if self.vis:
-            time.sleep(self.SIMULATION_STEP_DELAY)
+            time.sleep(self.SIMULATION_STEP_DELAY * self.sim_substeps)
 
 
     def test(self):
@@ -105,13 +112,13 @@ class BoxManipulation(Env):
 
     def read_debug_parameter(self):
         # read the value of task parameter
-        x = p.readUserDebugParameter(self.xin)
-        y = p.readUserDebugParameter(self.yin)
-        z = p.readUserDebugParameter(self.zin)
-        roll = p.readUserDebugParameter(self.rollId)
-        pitch = p.readUserDebugParameter(self.pitchId)
-        yaw = p.readUserDebugParameter(self.yawId)
-        gripper_opening_length = p.readUserDebugParameter(self.gripper_opening_length_control)
+        x = p.readUserDebugParameter(self.xin, physicsClientId=self.physicsClient)
+        y = p.readUserDebugParameter(self.yin, physicsClientId=self.physicsClient)
+        z = p.readUserDebugParameter(self.zin, physicsClientId=self.physicsClient)
+        roll = p.readUserDebugParameter(self.rollId, physicsClientId=self.physicsClient)
+        pitch = p.readUserDebugParameter(self.pitchId, physicsClientId=self.physicsClient)
+        yaw = p.readUserDebugParameter(self.yawId, physicsClientId=self.physicsClient)
+        gripper_opening_length = p.readUserDebugParameter(self.gripper_opening_length_control, physicsClientId=self.physicsClient)
 
         return x, y, z, roll, pitch, yaw, gripper_opening_length
 
@@ -125,7 +132,7 @@ class BoxManipulation(Env):
         new_pose = self.robot.get_ee_pose() + action[:-1]
         self.robot.move_ee(new_pose, self.control_method)
         self.robot.move_gripper(action[-1])
-        for _ in range(120):  # Wait for a few steps
+        for _ in range(math.ceil(120 / self.sim_substeps)):  # Wait for a few steps
             self.step_simulation()
 
         reward = self.update_reward()
@@ -141,7 +148,7 @@ class BoxManipulation(Env):
     def update_reward(self):
         reward = 0
         if not self.box_opened:
-            if p.getJointState(self.boxID, 1)[0] > 1.9:
+            if p.getJointState(self.boxID, 1, physicsClientId=self.physicsClient)[0] > 1.9:
                 self.box_opened = True
                 print('Box opened!')
                 reward = 1
@@ -152,7 +159,7 @@ class BoxManipulation(Env):
                 reward = 1
         else:
             # If it was opened previously and now closed
-            if self.box_opened and p.getJointState(self.boxID, 1)[0] < 0.1:
+            if self.box_opened and p.getJointState(self.boxID, 1, physicsClientId=self.physicsClient)[0] < 0.1:
                 print('Box closed!')
                 self.box_closed = True
                 reward = 1
@@ -161,7 +168,7 @@ class BoxManipulation(Env):
     def get_observation(self):
         obs = dict()
         if isinstance(self.camera, Camera):
-            rgb, depth, seg = self.camera.shot()
+            rgb, depth, seg = self.camera.shot(self.physicsClient)
             obs.update(dict(rgb=rgb, depth=depth, seg=seg))
         else:
             assert self.camera is None
@@ -170,10 +177,10 @@ class BoxManipulation(Env):
         return np.array(obs["ee_pos"])
 
     def reset_box(self):
-        p.resetJointState(self.boxID, 0, targetValue=0)
-        p.resetJointState(self.boxID, 1, targetValue=0)
-        p.setJointMotorControl2(self.boxID, 0, p.POSITION_CONTROL, force=1)
-        p.setJointMotorControl2(self.boxID, 1, p.VELOCITY_CONTROL, force=0)
+        p.resetJointState(self.boxID, 0, targetValue=0, physicsClientId=self.physicsClient)
+        p.resetJointState(self.boxID, 1, targetValue=0, physicsClientId=self.physicsClient)
+        p.setJointMotorControl2(self.boxID, 0, p.POSITION_CONTROL, force=1, physicsClientId=self.physicsClient)
+        p.setJointMotorControl2(self.boxID, 1, p.VELOCITY_CONTROL, force=0, physicsClientId=self.physicsClient)
         self.box_opened = self.box_closed = self.button_pressed = False
 
     def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None):
@@ -190,12 +197,12 @@ class BoxManipulation(Env):
 
     def valid_button_press(self):
         # First check if the button is down
-        if p.getJointState(self.boxID, 0)[0] < -0.02:
+        if p.getJointState(self.boxID, 0, physicsClientId=self.physicsClient)[0] < -0.02:
             if self.button_touch_mode == 'any':
                 return True  # Button down and it doesn't matter which element pressed it
             else:
                 button_index = 0
-                contact_points = p.getContactPoints()
+                contact_points = p.getContactPoints(physicsClientId=self.physicsClient)
                 if self.button_touch_mode == 'robot':
                     # Filter contact points to find those involving the button of box and any part of the robot
                     contact_with_links = any(
@@ -9,17 +9,23 @@ from gymnasium.spaces import Box
 
 import pybullet as p
 import pybullet_data
-from urgym.base.utilities import YCBModels, Camera, rotate_quaternion, geometric_distance_reward, z_alignment_distance, normalize_quaternion, print_link_names_and_indices
+from urgym.base.utilities import YCBModels, Camera, rotate_quaternion, geometric_distance_reward, geometric_distance_reward_batch, z_alignment_distance, normalize_quaternion, print_link_names_and_indices
 from urgym.base.robot import UR5Robotiq85
-import random
+from urgym.base.settle import SettleDetector, configure_substeps
+from urgym.base.snapshot import SceneSnapshot, reset_body
+from urgym.base.pool import BodyPool
+from urgym.base.state_bank import StateBank
+from urgym.base.contacts import ContactCache
+from urgym.base.observation import ObservationBuffer
 import traceback
 
 class CubesGrasp(Env):
 
     SIMULATION_STEP_DELAY = 1 / 240.
     OBJECT_RAISE_HEIGHT = 0.2
+    OBSERVATION_LAYOUT = [('subgoals_achieved', 2), ('ee_pose', 7), ('gripper_opening_length', 1), ('cube_pose', 7)]
 
-    def __init__(self, camera=None, render_mode='human') -> None:
+    def __init__(self, camera=None, render_mode='human', sim_substeps: int = 1, reset_mode: str = 'full', state_bank: Optional[str] = None, obs_buffer: bool = False, ik_solver: str = 'pybullet') -> None:
         if render_mode == 'human':
             self.vis = True
         else:
@@ -34,31 +40,44 @@ class CubesGrasp(Env):
                         (0, 0, 1),
                         0.1, 5, (320, 320), 40)"""
         self.camera = camera
-        # robot = Panda((0, 0.5, 0), (0, 0, math.pi))
-        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0))
-
         # define environment        
         self.physicsClient = p.connect(p.GUI if self.vis else p.DIRECT)
-        p.setAdditionalSearchPath(pybullet_data.getDataPath())
-        p.setGravity(0, 0, -10)
+        self.sim_substeps = sim_substeps
+        if sim_substeps > 1:
+            configure_substeps(self.physicsClient, sim_substeps)
+        p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physicsClient)
+        p.setGravity(0, 0, -10, physicsClientId=self.physicsClient)
         # Hide right and left menus
-        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0)
+        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0, physicsClientId=self.physicsClient)
         # Reorient the debug camera
-        p.resetDebugVisualizerCamera(cameraDistance=2.2, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.5,0])
-        self.planeID = p.loadURDF("plane.urdf")
+        p.resetDebugVisualizerCamera(cameraDistance=2.2, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.5,0], physicsClientId=self.physicsClient)
+        self.planeID = p.loadURDF("plane.urdf", physicsClientId=self.physicsClient)
 
+        # robot = Panda((0, 0.5, 0), (0, 0, math.pi), self.physicsClient)
+        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0), self.physicsClient)
         self.robot.load()
         self.robot.step_simulation = self.step_simulation
+        self.robot.sim_substeps = sim_substeps
+        self.robot.ik_solver = ik_solver
+        self.settle_detector = SettleDetector(self.robot)
+        assert reset_mode in ('full', 'snapshot', 'bank')
+        assert reset_mode != 'bank' or state_bank is not None, "The 'bank' reset mode needs a state bank"
+        self.reset_mode = reset_mode
+        self.snapshot = SceneSnapshot(self.physicsClient, [self.robot])
+        self.body_pool = BodyPool(self.physicsClient)
+        self.contacts = ContactCache(self.physicsClient)
+        self.state_bank = StateBank.load(state_bank) if state_bank is not None else None
+        self.scene_built = False
         self.control_method = 'joint'
 
         # custom sliders to tune parameters (name of the parameter,range,initial value)
-        self.xin = p.addUserDebugParameter("x", -0.224, 0.224, 0)
-        self.yin = p.addUserDebugParameter("y", -0.224, 0.224, 0)
-        self.zin = p.addUserDebugParameter("z", 0, 1., 0.5)
-        self.rollId = p.addUserDebugParameter("roll", -3.14, 3.14, 0)
-        self.pitchId = p.addUserDebugParameter("pitch", -3.14, 3.14, np.pi/2)
-        self.yawId = p.addUserDebugParameter("yaw", -np.pi/2, np.pi/2, np.pi/2)
-        self.gripper_opening_length_control = p.addUserDebugParameter("gripper_opening_length", 0, 0.085, 0.04)
+        self.xin = p.addUserDebugParameter("x", -0.224, 0.224, 0, physicsClientId=self.physicsClient)
+        self.yin = p.addUserDebugParameter("y", -0.224, 0.224, 0, physicsClientId=self.physicsClient)
+        self.zin = p.addUserDebugParameter("z", 0, 1., 0.5, physicsClientId=self.physicsClient)
+        self.rollId = p.addUserDebugParameter("roll", -3.14, 3.14, 0, physicsClientId=self.physicsClient)
+        self.pitchId = p.addUserDebugParameter("pitch", -3.14, 3.14, np.pi/2, physicsClientId=self.physicsClient)
+        self.yawId = p.addUserDebugParameter("yaw", -np.pi/2, np.pi/2, np.pi/2, physicsClientId=self.physicsClient)
+        self.gripper_opening_length_control = p.addUserDebugParameter("gripper_opening_length", 0, 0.085, 0.04, physicsClientId=self.physicsClient)
 
         self.cubes = []
 
@@ -70,6 +89,10 @@ class CubesGrasp(Env):
         # The end-effector position and quaternion (x, y, z, qx, qy, qz, qw) and gripper opening length in[0,1]
         # And the target cube position and quaternion (x, y, z, qx, qy, qz, qw)
         self.observation_space = Box(low=np.array([0]*2 + [-1.0]*3 + [-1]*4 + [0] + [-1.0]*3 + [-1.0]*4), high=np.array([1]*2 + [1.0]*3 + [1.0]*4 + [1] + [1.0]*3 + [1.0]*4), dtype=np.float64)
+        # With `obs_buffer` the observations are written in place into a reusable float32 buffer, see `urgym.base.observation`
+        self.obs_buffer = obs_buffer
+        self.observation_buffer = ObservationBuffer(self.OBSERVATION_LAYOUT, np.float32 if obs_buffer else np.float64)
+        self.observation_space = self.observation_buffer.space(self.observation_space)
         # Actions: joint_states, gripper action (open/close)
         self.action_space = Box(low=np.array([-math.pi]*6 + [0]), high=np.array([+math.pi]*6 + [1]), dtype=np.float32)
 
@@ -77,36 +100,28 @@ class CubesGrasp(Env):
         """
         Hook p.stepSimulation()
         """
-        p.stepSimulation()
+        p.stepSimulation(physicsClientId=self.physicsClient)
         if self.vis:
-            time.sleep(self.SIMULATION_STEP_DELAY)
+            time.sleep(self.SIMULATION_STEP_DELAY * self.sim_substeps)
 
     def read_debug_parameter(self):
         # read the value of task parameter
-        x = p.readUserDebugParameter(self.xin)
-        y = p.readUserDebugParameter(self.yin)
-        z = p.readUserDebugParameter(self.zin)
-        roll = p.readUserDebugParameter(self.rollId)
-        pitch = p.readUserDebugParameter(self.pitchId)
-        yaw = p.readUserDebugParameter(self.yawId)
-        gripper_opening_length = p.readUserDebugParameter(self.gripper_opening_length_control)
+        x = p.readUserDebugParameter(self.xin, physicsClientId=self.physicsClient)
+        y = p.readUserDebugParameter(self.yin, physicsClientId=self.physicsClient)
+        z = p.readUserDebugParameter(self.zin, physicsClientId=self.physicsClient)
+        roll = p.readUserDebugParameter(self.rollId, physicsClientId=self.physicsClient)
+        pitch = p.readUserDebugParameter(self.pitchId, physicsClientId=self.physicsClient)
+        yaw = p.readUserDebugParameter(self.yawId, physicsClientId=self.physicsClient)
+        gripper_opening_length = p.readUserDebugParameter(self.gripper_opening_length_control, physicsClientId=self.physicsClient)
 
         return x, y, z, roll, pitch, yaw, gripper_opening_length
 
     def wait_simulation_steps(self, sim_steps):
-        for _ in range(sim_steps):
+        for _ in range(math.ceil(sim_steps / self.sim_substeps)):
             self.step_simulation()
 
     def wait_until_stable(self, sim_steps=480):
-        pos = self.robot.get_joint_obs()['positions']
-        for _ in range(sim_steps):
-            self.step_simulation()
-            new_pos = self.robot.get_joint_obs()['positions']
-            if np.sum(np.abs(np.array(pos)-np.array(new_pos))) < 5e-3: # Threshold based on experience
-                return True
-            pos = new_pos
-        print("Warning: The robot configuration did not stabilize")
-        return False
+        return self.settle_detector.wait(sim_steps)
 
 
     def step(self, action):
@@ -132,6 +147,9 @@ class CubesGrasp(Env):
             self.robot.close_gripper() 
             self.wait_until_stable()
 
+        # A single contact snapshot for all the predicates of this step
+        self.contacts.update()
+
         reward += self.update_reward()
         info = {'is_success': False}
         terminated = False
@@ -178,7 +196,32 @@ class CubesGrasp(Env):
             reward += 0.1"""
 
         return reward
-    
+
+    def subgoal_reward_batch(self, approached, grasped, distances, gripper_opening_lengths, object_grasped, object_heights):
+        """
+        Vectorized reward of the subgoals of `step`, for rescoring stored transitions.
+
+        Parameters:
+        - approached, grasped: Boolean arrays of shape (...), the subgoals achieved before the steps
+        - distances: Array of shape (...), the distances from the gripper center to the target after the steps
+        - gripper_opening_lengths: Array of shape (...), the gripper opening lengths after the steps
+        - object_grasped: Boolean array of shape (...), whether both fingers touched the target after the steps
+        - object_heights: Array of shape (...), the heights of the target after the steps
+
+        Returns:
+        The rewards and the successes, as arrays of shape (...)
+        """
+        approached = np.asarray(approached, dtype=bool)
+        grasped = np.asarray(grasped, dtype=bool)
+        object_grasped = np.asarray(object_grasped, dtype=bool)
+        distances = np.asarray(distances, dtype=np.float64)
+        now_approached = (distances < 0.05) & (np.asarray(gripper_opening_lengths) > 0.50)
+        raised = object_grasped & (np.asarray(object_heights) > self.OBJECT_RAISE_HEIGHT)
+        successes = approached & grasped & raised
+        approach_rewards = geometric_distance_reward_batch(distances, 0.5, 2) / 4 + np.where(now_approached, 5.0, 0.0)
+        rewards = np.select([~approached, ~grasped, successes], [approach_rewards, 5.0 * object_grasped, 10.0], default=0.0)
+        return rewards - 0.1, successes # Step penalty
+
     def distance_to_target(self, target_id):
         gripper_center = self.get_gripper_geometrical_center()
         target_pos = list(self.get_cube_pose(target_id)[:3])
@@ -195,81 +238,70 @@ class CubesGrasp(Env):
     def object_grasped(self, object_id):
         gripper_link_indices_left = [11,12,13]
         gripper_link_indices_right = [16,17,18]
-        # Get contact points between the robot and the object
-        contact_points = p.getContactPoints(bodyA=self.robot.id, bodyB=object_id)
-        
-        # Initialize a set to keep track of which fingers are touching the object
-        touching_fingers = set()
-        
-        # Iterate over the contact points to check if the specified fingers are touching the object
-        for point in contact_points:
-            link_index = point[3]
-            if link_index in gripper_link_indices_left or link_index in gripper_link_indices_right:
-                touching_fingers.add(link_index)
-                
-            # If any part of both fingers are touching simultaneously, return True
-            if any(link_index in touching_fingers for link_index in gripper_link_indices_left) and any(link_index in touching_fingers for link_index in gripper_link_indices_right):
-                return True
-        
-        # If not all specified fingers are touching, return False
-        return False
+        # Links of the robot in contact with the object
+        touching_links = self.contacts.touching_links(self.robot.id, object_id)
+
+        # If any part of both fingers are touching simultaneously, return True
+        return bool(np.isin(gripper_link_indices_left, touching_links).any() and np.isin(gripper_link_indices_right, touching_links).any())
 
 
     def object_raised(self, object_id):
-        position,_ = p.getBasePositionAndOrientation(object_id)
+        position,_ = p.getBasePositionAndOrientation(object_id, physicsClientId=self.physicsClient)
         if self.object_grasped(object_id) and position[2] > self.OBJECT_RAISE_HEIGHT: # If the object is raised
             return True
         return False
     
     def on_top(self, lower_cube_id, upper_cube_id):
-        lower_cube_pos, _ = p.getBasePositionAndOrientation(lower_cube_id)
-        upper_cube_pos, _ = p.getBasePositionAndOrientation(upper_cube_id)
-        contact_points = p.getContactPoints(lower_cube_id, upper_cube_id)
+        lower_cube_pos, _ = p.getBasePositionAndOrientation(lower_cube_id, physicsClientId=self.physicsClient)
+        upper_cube_pos, _ = p.getBasePositionAndOrientation(upper_cube_id, physicsClientId=self.physicsClient)
         # Check if the upper cube is placed on top of the lower cube
-        if upper_cube_pos[2] > lower_cube_pos[2] and contact_points:
+        if upper_cube_pos[2] > lower_cube_pos[2] and self.contacts.touching(lower_cube_id, upper_cube_id):
             print(f"Cube {upper_cube_id} is placed on top of cube {lower_cube_id} and in contact")
             return True
         return False
 
     def touched_with_fingers(self, object_id):
-        contact_points = p.getContactPoints(object_id, self.robot.id)
-        fingers_indices = list(range(9, 19))
-        contact_with_links = any(
-            point[4] in fingers_indices or  point[3] in fingers_indices
-            for point in contact_points
-        )
-        if contact_with_links:
-            return True
-        return False
+        fingers_indices = np.arange(9, 19)
+        return self.contacts.touching(self.robot.id, object_id, links=fingers_indices)
 
     def get_observation(self):
         obs_robot = dict()
 
         if isinstance(self.camera, Camera):
-            rgb, depth, seg = self.camera.shot()
+            rgb, depth, seg = self.camera.shot(self.physicsClient)
             obs_robot.update(dict(rgb=rgb, depth=depth, seg=seg))
         else:
             assert self.camera is None
 
-        obs_robot.update(self.robot.get_joint_obs())
-
         """approached = self.object_approached(self.target_id)
         grasped = self.object_grasped(self.target_id)
         obs = np.array([int(s) for s in [approached, grasped]]) # Boolean to int (0,1)"""
-        obs = np.array([int(s) for s in list(self.subgoals_achieved.values())]) # Boolean to int (0,1)
-        obs = np.append(obs, obs_robot["ee_pos"])
-        obs = np.append(obs, self.get_gripper_opening_length())
-        obs = np.append(obs, self.get_cube_pose(self.target_id))
-        return obs
+        self.observation_buffer['subgoals_achieved'] = list(self.subgoals_achieved.values()) # Boolean to (0,1)
+        self.observation_buffer['ee_pose'] = self.robot.get_ee_pose()
+        self.observation_buffer['gripper_opening_length'] = self.get_gripper_opening_length()
+        self.observation_buffer['cube_pose'] = self.get_cube_pose(self.target_id)
+        return self.observation_buffer.array if self.obs_buffer else self.observation_buffer.array.copy()
 
     def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None):
         super().reset(seed=seed)
+        # Drawn before the first reset builds the scene, which also draws from np_random, so that a reset with a
+        # given seed restores the same state in a fresh worker and in one that has already reset
+        bank_state = self.state_bank.sample(self.np_random) if self.reset_mode == 'bank' else None
+        if self.reset_mode == 'snapshot' and self.snapshot.captured:
+            self.restore_snapshot()
+            self.subgoals_achieved = {'approached': False, 'grasped': False}
+            return self.get_observation(), {}
+        if self.reset_mode == 'bank' and self.scene_built:
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
+            self.subgoals_achieved = {'approached': False, 'grasped': False}
+            return self.get_observation(), {}
+
         self.robot.reset()
         self.create_cubes()
 
         self.target_id = self.cubes[0]
 
-        #print_link_names_and_indices(self.robot.id)
+        #print_link_names_and_indices(self.robot.id, self.physicsClient)
 
         # Position the end effector above the cube
         """new_pose = list(self.get_cube_pose(self.target_id))
@@ -281,8 +313,16 @@ class CubesGrasp(Env):
         self.robot.open_gripper()"""
 
         self.robot.move_ee(self.robot.get_ee_pose(), 'end')
+        if self.reset_mode == 'snapshot':
+            # The scene right after the cube is created
+            self.snapshot.capture()
         self.wait_until_stable()
 
+        self.scene_built = True
+        if self.reset_mode == 'bank':
+            # The scene is only built on the first reset, its state is then replaced by one of the bank
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
+
         self.subgoals_achieved = {'approached': False, 'grasped': False}
 
         return self.get_observation(), {}
@@ -291,35 +331,54 @@ class CubesGrasp(Env):
         p.disconnect(self.physicsClient)
 
     def create_cube(self, x: float, y: float, z: float, color:list=None):
-        id = p.loadURDF("cube.urdf", [x, y, z], p.getQuaternionFromEuler([0, 0, 0]), useFixedBase=False, globalScaling = 0.04)
+        orientation = p.getQuaternionFromEuler([0, 0, 0])
+        id = self.body_pool.acquire('cube', [x, y, z], orientation,
+                                    lambda: p.loadURDF("cube.urdf", [x, y, z], orientation, useFixedBase=False, globalScaling = 0.04, physicsClientId=self.physicsClient))
         if color != None:
-            p.changeVisualShape(id, -1, rgbaColor=color)
+            p.changeVisualShape(id, -1, rgbaColor=color, physicsClientId=self.physicsClient)
         self.cubes.append(id)
 
-    def create_cubes(self):
-        for id in self.cubes:
-            p.removeBody(id)
-        self.cubes = []
-        #self.create_cube(0.0, -0.7, 0.1)
+    def get_scene_bodies(self):
+        """
+        Returns the IDs of the bodies whose state is stored in the state banks, always in the same order
+        """
+        return self.cubes
 
+    def restore_snapshot(self):
+        """
+        Restores the scene right after the cube is created, with a new random cube position
+        """
+        self.snapshot.restore()
+        x, y = self.get_cube_spawn_position()
+        reset_body(self.target_id, [x, y, 0.1], p.getQuaternionFromEuler([0, 0, 0]), self.physicsClient)
+        self.wait_until_stable()
+
+    def get_cube_spawn_position(self):
         # Generate a cube within the area delimited by a minimum and maximum radius
         rmin = 0.5
         rmax = 0.8
         # Generate a random radius between r1 and r2
-        r = random.uniform(rmin, rmax)
+        r = self.np_random.uniform(rmin, rmax)
         # Generate a random angle in fron of the arm
-        theta = random.uniform(-math.pi, 0)
+        theta = self.np_random.uniform(-math.pi, 0)
         # Convert polar coordinates to Cartesian coordinates
         x = r * math.cos(theta)
         y = r * math.sin(theta)
-        
+        return x, y
+
+    def create_cubes(self):
+        self.body_pool.release('cube')
+        self.cubes = []
+        #self.create_cube(0.0, -0.7, 0.1)
+
+        x, y = self.get_cube_spawn_position()
         self.create_cube(x, y, 0.1, [1,0,0,1])
         #self.create_cube(0.0, -0.2, 0.1, [1,0,0,1])
         #self.create_cube(0.1, -0.1, 0.1, [0,0,1,1])
         #self.create_cube(0.1, -0.2, 0.1, [0,1,0,1])
 
     def get_cube_pose(self, cube_id):
-        position, orientation = p.getBasePositionAndOrientation(cube_id)
+        position, orientation = p.getBasePositionAndOrientation(cube_id, physicsClientId=self.physicsClient)
         pose = position + orientation
 
         return pose
@@ -333,8 +392,8 @@ class CubesGrasp(Env):
         """
         gripper_link_indices = [11, 16]
         # Get the positions of the gripper links
-        link_state_1 = p.getLinkState(self.robot.id, gripper_link_indices[0])
-        link_state_2 = p.getLinkState(self.robot.id, gripper_link_indices[1])
+        link_state_1 = p.getLinkState(self.robot.id, gripper_link_indices[0], physicsClientId=self.physicsClient)
+        link_state_2 = p.getLinkState(self.robot.id, gripper_link_indices[1], physicsClientId=self.physicsClient)
 
         # Extract the positions of the two gripper links
         pos1 = np.array(link_state_1[4])  # World position of the first link
@@ -379,7 +438,7 @@ class CubesGrasp(Env):
 
         # Iterate through each link index in the gripper
         for link_index in gripper_link_indices:
-            aabb_min, aabb_max = p.getAABB(self.robot.id, link_index)
+            aabb_min, aabb_max = p.getAABB(self.robot.id, link_index, physicsClientId=self.physicsClient)
             
             # Update the overall AABB
             for i in range(3):
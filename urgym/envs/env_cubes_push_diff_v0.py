@@ -2,7 +2,6 @@ import time
 import math
 import numpy as np
 from typing import NoReturn, Optional
-import random
 import os
 
 from gymnasium import Env
@@ -10,8 +9,16 @@ from gymnasium.spaces import Box
 
 import pybullet as p
 import pybullet_data
-from urgym.base.utilities import rotate_quaternion, geometric_distance_reward
+from urgym.base.utilities import rotate_quaternion, geometric_distance_reward, geometric_distance_reward_batch
 from urgym.base.robot import UR5Robotiq85
+from urgym.base.settle import SettleDetector, configure_substeps
+from urgym.base.control import move_ee_at_constant_speed
+from urgym.base.snapshot import SceneSnapshot, reset_body
+from urgym.base.pool import BodyPool
+from urgym.base.state_bank import StateBank
+from urgym.base.contacts import ContactCache
+from urgym.base.shapes import ShapeCache
+from urgym.base.observation import ObservationBuffer
 
 class CubesPush(Env):
     """
@@ -38,14 +45,24 @@ class CubesPush(Env):
     """
 
     SIMULATION_STEP_DELAY = 1 / 240.
+    # 'cartesian_velocity' control: each step lasts CONTROL_TICKS commands of at least CONTROL_TICK_SUBSTEPS substeps (0.1 s at 40 Hz)
+    CONTROL_TICKS = 4
+    CONTROL_TICK_SUBSTEPS = 6
+    OBSERVATION_LAYOUT = [('ee_position', 3), ('cube1_diff', 3), ('cube2_diff', 3)]
 
-    def __init__(self, camera=None, reward_type='dense',  render_mode='human') -> None:
+    def __init__(self, camera=None, reward_type='dense',  render_mode='human', sim_substeps: int = 1, reset_mode: str = 'full', state_bank: Optional[str] = None, obs_buffer: bool = False, ik_solver: str = 'pybullet', control_method: str = 'end') -> None:
         """
         Initialize the CubesPush environment.
 
         Parameters:
         - reward_type (str): The type of reward to use. Options are 'dense' and 'sparse'. Default is 'dense'.
         - render_mode (str): The rendering mode. Options are 'human' and 'non-human'. Default is 'human'.
+        - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+        - reset_mode (str): 'full' rebuilds and settles the scene on every reset, 'snapshot' restores an in-memory snapshot of the scene taken on the first reset and only randomizes the object poses, 'bank' teleports the scene into a random precomputed state of `state_bank`. Default is 'full'.
+        - state_bank (str): Path of the `.npy` state bank used by the 'bank' reset mode, see `urgym.generate_state_bank`. Default is None.
+        - obs_buffer (bool): Whether to write the observations in place into a reusable float32 buffer, which is returned on every step instead of a new float64 array, see `urgym.base.observation`. Default is False.
+        - ik_solver (str): The IK solver of the end-effector control, 'pybullet' (iterative) or 'analytic' (closed-form UR5 IK, deterministic). Default is 'pybullet'.
+        - control_method (str): 'end' moves the end effector to the target of each action through IK and waits until the arm is stable, 'cartesian_velocity' moves it at constant speed through the arm Jacobian for a fixed number of substeps per step. Default is 'end'.
         """
 
         self.reward_type = reward_type
@@ -58,30 +75,50 @@ class CubesPush(Env):
         # Set observation and action spaces
         # Observations: the end-effector position and position (x, y, z) of the two cubes
         self.observation_space = Box(low=np.array([-1.0]*3 + [-1.0]*6), high=np.array([1.0]*3 + [1.0]*6), dtype=np.float64)
+        self.obs_buffer = obs_buffer
+        self.observation_buffer = ObservationBuffer(self.OBSERVATION_LAYOUT, np.float32 if obs_buffer else np.float64)
+        self.observation_space = self.observation_buffer.space(self.observation_space)
         # Actions: (dx, dy, dz) for end-effector displacement 
         self.action_space = Box(low=np.array([-0.1]*3), high=np.array([+0.1]*3), dtype=np.float32)
 
         # Define environment        
         self.physicsClient = p.connect(p.GUI if self.visualize else p.DIRECT)
-        p.setAdditionalSearchPath(pybullet_data.getDataPath())
-        p.setGravity(0, 0, -9.8)
+        self.shape_cache = ShapeCache.for_client(self.physicsClient)
+        self.sim_substeps = sim_substeps
+        if sim_substeps > 1:
+            configure_substeps(self.physicsClient, sim_substeps)
+        p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physicsClient)
+        p.setGravity(0, 0, -9.8, physicsClientId=self.physicsClient)
 
         # Reorient the debug camera
-        p.resetDebugVisualizerCamera(cameraDistance=1.8, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.2,0])
+        p.resetDebugVisualizerCamera(cameraDistance=1.8, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.2,0], physicsClientId=self.physicsClient)
 
         # Hide right and left menus
-        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0)
+        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0, physicsClientId=self.physicsClient)
 
         # Robot will be centered at the origin (0,0,0), the plane and the table will be below z=0
         table_dimensions = [1.0, 2.0, 0.5]
-        self.planeID = p.loadURDF("plane.urdf", [0, 0, -table_dimensions[2]])
+        self.planeID = p.loadURDF("plane.urdf", [0, 0, -table_dimensions[2]], physicsClientId=self.physicsClient)
         self.table_id = self.create_table_block(table_dimensions, [0, 0, -table_dimensions[2]/2], color=[0.5, 0.5, 0.5, 1])
 
-        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0))
+        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0), self.physicsClient)
 
         self.robot.load()
         self.robot.step_simulation = self.step_simulation # type: ignore
-        self.control_method = 'end'
+        self.robot.sim_substeps = sim_substeps
+        self.robot.ik_solver = ik_solver
+        self.settle_detector = SettleDetector(self.robot)
+        assert reset_mode in ('full', 'snapshot', 'bank')
+        assert reset_mode != 'bank' or state_bank is not None, "The 'bank' reset mode needs a state bank"
+        self.reset_mode = reset_mode
+        self.snapshot = SceneSnapshot(self.physicsClient, [self.robot])
+        self.body_pool = BodyPool(self.physicsClient)
+        self.contacts = ContactCache(self.physicsClient)
+        self.step_contacts = {}
+        self.state_bank = StateBank.load(state_bank) if state_bank is not None else None
+        self.scene_built = False
+        assert control_method in ('end', 'cartesian_velocity')
+        self.control_method = control_method
 
         self.cubes = []
         self.positive_reward_radius = 0.1
@@ -93,24 +130,16 @@ class CubesPush(Env):
         """
         Hook p.stepSimulation()
         """
-        p.stepSimulation()
+        p.stepSimulation(physicsClientId=self.physicsClient)
         if self.visualize:
-            time.sleep(self.SIMULATION_STEP_DELAY)
+            time.sleep(self.SIMULATION_STEP_DELAY * self.sim_substeps)
 
     def wait_simulation_steps(self, sim_steps):
-        for _ in range(sim_steps):
+        for _ in range(math.ceil(sim_steps / self.sim_substeps)):
             self.step_simulation()
 
     def wait_until_stable(self, sim_steps=480):
-        pos = self.robot.get_joint_obs()['positions']
-        for _ in range(sim_steps):
-            self.step_simulation()
-            new_pos = self.robot.get_joint_obs()['positions']
-            if np.sum(np.abs(np.array(pos)-np.array(new_pos))) < 5e-3: # Threshold based on experience
-                return True
-            pos = new_pos
-        print("Warning: The robot configuration did not stabilize")
-        return False
+        return self.settle_detector.wait(sim_steps)
 
     def step(self, action):
         """
@@ -120,18 +149,26 @@ class CubesPush(Env):
         reward = 0
         
         # Differential version
-        ee_pose = list(self.robot.get_ee_pose())
-        ee_pose[:3] += action
-        ee_pose[3:] = self.vertical_quaternion # to keep the end effector vertical at all times
-        self.robot.move_ee(ee_pose, self.control_method)
+        if self.control_method == 'cartesian_velocity':
+            self.move_ee_at_constant_speed(action)
+        else:
+            ee_pose = list(self.robot.get_ee_pose())
+            ee_pose[:3] += action
+            ee_pose[3:] = self.vertical_quaternion # to keep the end effector vertical at all times
+            self.robot.move_ee(ee_pose, self.control_method)
 
-        self.wait_until_stable()
+            self.wait_until_stable()
+
+        # A single contact snapshot for all the predicates of this step
+        self.contacts.update()
+        # The contact terms of the reward, kept for the info of the goal-conditioned versions
+        self.step_contacts = {'touched': self.touched_with_fingers(self.cubes[1]), 'table_collision': self.is_table_collision()}
                 
-        if self.is_table_collision():
+        if self.step_contacts['table_collision']:
             reward -= 0.01
             success = False
             terminated = False
-        elif self.touched_with_fingers(self.cubes[1]):
+        elif self.step_contacts['touched']:
             reward, success = self.update_reward()
             reward += 0.1 # Reward for touching the cube
             print("Touched!")
@@ -153,6 +190,13 @@ class CubesPush(Env):
 
         return self.get_observation(), reward, terminated, truncated, info
 
+    def move_ee_at_constant_speed(self, displacement):
+        """
+        Moves the end effector by `displacement` during a fixed number of control ticks, keeping it vertical, and stops it
+        """
+        move_ee_at_constant_speed(self.robot, self.settle_detector, displacement, self.vertical_quaternion,
+                                  self.CONTROL_TICKS, self.CONTROL_TICK_SUBSTEPS)
+
     def update_reward(self) -> tuple[float, bool]:
         reward = 0
 
@@ -172,26 +216,51 @@ class CubesPush(Env):
             sucess = False
 
         return reward, sucess
-    
+
+    def update_reward_batch(self, cube1_positions, cube2_positions):
+        """
+        Vectorized `update_reward` for arrays of cube positions of shape (..., 3).
+
+        Returns:
+        The rewards and the successes, as arrays of shape (...)
+        """
+        distances = np.linalg.norm(np.asarray(cube1_positions) - np.asarray(cube2_positions), axis=-1)
+        rewards = np.zeros(distances.shape)
+        if self.reward_type == 'dense':
+            rewards += geometric_distance_reward_batch(distances, self.positive_reward_radius, 0.5) / 10
+        successes = distances < 0.05
+        rewards += np.where(successes, 10.0, 0.0)
+        return rewards, successes
+
+    def step_reward_batch(self, cube1_positions, cube2_positions, touched, table_collisions):
+        """
+        Vectorized reward of `step`, for rescoring stored transitions.
+
+        Parameters:
+        - cube1_positions, cube2_positions: Arrays of shape (..., 3), the positions of the cubes after the steps
+        - touched: Boolean array of shape (...), whether the fingers touched the cube to push
+        - table_collisions: Boolean array of shape (...), whether the robot collided with the table
+
+        Returns:
+        The rewards and the successes, as arrays of shape (...)
+        """
+        touched = np.asarray(touched, dtype=bool)
+        table_collisions = np.asarray(table_collisions, dtype=bool)
+        rewards, successes = self.update_reward_batch(cube1_positions, cube2_positions)
+        rewards = np.where(table_collisions, -0.01, np.where(touched, rewards + 0.1, 0.0))
+        successes = successes & touched & ~table_collisions
+        return rewards - 0.1, successes # Step penalty
+
     def is_table_collision(self):
-        contact_points = p.getContactPoints(bodyA=self.robot.id, bodyB=self.table_id)
-        if contact_points:
-            for point in contact_points:
-                if point[3] != 0: # 0 is the base link, is always touching the table
-                    print("Collision with the table!")
-                    return True
+        # 0 is the base link, is always touching the table
+        if np.any(self.contacts.touching_links(self.robot.id, self.table_id) != 0):
+            print("Collision with the table!")
+            return True
         return False
 
     def touched_with_fingers(self, object_id):
-        contact_points = p.getContactPoints(object_id, self.robot.id)
-        fingers_indices = list(range(9, 19))
-        contact_with_links = any(
-            point[4] in fingers_indices or  point[3] in fingers_indices
-            for point in contact_points
-        )
-        if contact_with_links:
-            return True
-        return False
+        fingers_indices = np.arange(9, 19)
+        return self.contacts.touching(self.robot.id, object_id, links=fingers_indices)
 
     def are_cubes_close(self, cube1_id, cube2_id, threshold=0.05):
         cube1_pos = self.get_cube_pose(cube1_id)[:3]
@@ -200,19 +269,24 @@ class CubesPush(Env):
         return distance < threshold
     
     def get_observation(self):
-        obs = dict()
-        obs.update(self.robot.get_joint_obs())
-
-        obs = np.array(obs["ee_pos"])[:3]
-        cube1_position = self.get_cube_pose(self.cubes[0])[:3]
-        cube2_position = self.get_cube_pose(self.cubes[1])[:3]
-        cube1_diff = np.array(cube1_position) - np.array(obs)
-        cube2_diff = np.array(cube2_position) - np.array(obs)
-        obs = np.append(obs, [cube1_diff, cube2_diff])
-        return obs
+        ee_position = self.robot.get_ee_pose()[:3]
+        self.observation_buffer['ee_position'] = ee_position
+        np.subtract(self.get_cube_pose(self.cubes[0])[:3], ee_position, out=self.observation_buffer['cube1_diff'])
+        np.subtract(self.get_cube_pose(self.cubes[1])[:3], ee_position, out=self.observation_buffer['cube2_diff'])
+        return self.observation_buffer.array if self.obs_buffer else self.observation_buffer.array.copy()
 
     def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None):
         super().reset(seed=seed)
+        # Drawn before the first reset builds the scene, which also draws from np_random, so that a reset with a
+        # given seed restores the same state in a fresh worker and in one that has already reset
+        bank_state = self.state_bank.sample(self.np_random) if self.reset_mode == 'bank' else None
+        if self.reset_mode == 'snapshot' and self.snapshot.captured:
+            self.restore_snapshot()
+            return self.get_observation(), {}
+        if self.reset_mode == 'bank' and self.scene_built:
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
+            return self.get_observation(), {}
+
         self.robot.reset()
         self.create_cubes()
 
@@ -225,35 +299,69 @@ class CubesPush(Env):
         self.robot.move_ee(new_pose, 'end')
         self.robot.close_gripper()
         self.wait_until_stable()
+        if self.reset_mode == 'snapshot':
+            # The settled scene, the end effector is moved along with the second cube on restore
+            self.snapshot.capture()
+
+        self.scene_built = True
+        if self.reset_mode == 'bank':
+            # The scene is only built on the first reset, its state is then replaced by one of the bank
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
 
         return self.get_observation(), {}
 
     def close(self):
+        ShapeCache.release(self.physicsClient)
         p.disconnect(self.physicsClient)
 
     def create_cube(self, x: float, y: float, z: float, color:list=[1,1,1,1]):
-        id = p.loadURDF("cube.urdf", [x, y, z], p.getQuaternionFromEuler([0, 0, 0]), useFixedBase=False, globalScaling = 0.04)
-        p.changeVisualShape(id, -1, rgbaColor=color)
+        orientation = p.getQuaternionFromEuler([0, 0, 0])
+        id = self.body_pool.acquire('cube', [x, y, z], orientation,
+                                    lambda: p.loadURDF("cube.urdf", [x, y, z], orientation, useFixedBase=False, globalScaling = 0.04, physicsClientId=self.physicsClient))
+        p.changeVisualShape(id, -1, rgbaColor=color, physicsClientId=self.physicsClient)
         self.cubes.append(id)
 
+    def get_scene_bodies(self):
+        """
+        Returns the IDs of the bodies whose state is stored in the state banks, always in the same order
+        """
+        return self.cubes
+
+    def restore_snapshot(self):
+        """
+        Restores the settled scene of the first reset, with the second cube at a new random position.
+        The arm is placed directly at the joint positions that put the end effector above the cube.
+        """
+        self.snapshot.restore()
+
+        # Move the second cube, keeping its settled height and orientation
+        x = self.np_random.uniform(-0.1, +0.1)
+        position, orientation = p.getBasePositionAndOrientation(self.cubes[1], physicsClientId=self.physicsClient)
+        reset_body(self.cubes[1], [x, position[1], position[2]], orientation, self.physicsClient)
+
+        # Position the end effector above the cube, as seen from the spawn position of the cube
+        new_pose = [x, -0.7, 0.1 + 0.2] + list(self.vertical_quaternion)
+        self.robot.move_ee(new_pose, 'end')
+        self.robot.teleport_arm(self.robot.arm_target_positions)
+        self.wait_until_stable()
+
     def create_cubes(self):
-        for id in self.cubes:
-            p.removeBody(id)
+        self.body_pool.release('cube')
         self.cubes = []
 
         # Create target cube
         self.create_cube(0.0, -0.5, 0.1)
         # Create second cube
-        x = random.uniform(-0.1, +0.1)
+        x = self.np_random.uniform(-0.1, +0.1)
         self.create_cube(x, -0.7, 0.1, [1,0,0,1])
 
     def get_cube_pose(self, cube_id):
-        position, orientation = p.getBasePositionAndOrientation(cube_id)
+        position, orientation = p.getBasePositionAndOrientation(cube_id, physicsClientId=self.physicsClient)
         pose = position + orientation
         return pose
     
     def draw_circle_area(self, radius=0.1, center_x=0.0, center_y=-0.5, segments=100, color=[0, 1.0, 0, 0.4]):
-        visual_shape_id = p.createVisualShape(
+        visual_shape_id = self.shape_cache.visual_shape(
             shapeType=p.GEOM_CYLINDER,
             radius=radius,
             length=0.001,  # Very thin to act as a visual aid
@@ -261,7 +369,8 @@ class CubesPush(Env):
         )
         p.createMultiBody(
             baseVisualShapeIndex=visual_shape_id,
-            basePosition=[center_x, center_y, 0.0001]  # Slightly above the ground to avoid z-fighting
+            basePosition=[center_x, center_y, 0.0001],  # Slightly above the ground to avoid z-fighting
+            physicsClientId=self.physicsClient
         )
 
     def create_table_block(self, size, position, color=[1, 0, 0, 1]):
@@ -276,23 +385,23 @@ class CubesPush(Env):
         Returns:
         - block_body_id: The ID of the created block.
         """
-        block_visual_shape_id = p.createVisualShape(shapeType=p.GEOM_BOX,
+        block_visual_shape_id = self.shape_cache.visual_shape(shapeType=p.GEOM_BOX,
                                                     rgbaColor=color,
                                                     halfExtents=[size[0]/2, size[1]/2, size[2]/2])
-        block_collision_shape_id = p.createCollisionShape(shapeType=p.GEOM_BOX,
+        block_collision_shape_id = self.shape_cache.collision_shape(shapeType=p.GEOM_BOX,
                                                         halfExtents=[size[0]/2, size[1]/2, size[2]/2])
         block_body_id = p.createMultiBody(baseMass=0,
                                         baseCollisionShapeIndex=block_collision_shape_id,
                                         baseVisualShapeIndex=block_visual_shape_id,
-                                        basePosition=position)  
+                                        basePosition=position, physicsClientId=self.physicsClient)  
         
         # Load the texture
         script_dir = os.path.dirname(__file__)
         texture_path = os.path.join(script_dir, "../meshes/textures/steel.jpg")
  
-        texture_id = p.loadTexture(texture_path)
+        texture_id = self.shape_cache.texture(texture_path)
 
         # Apply the texture to the block
-        p.changeVisualShape(block_body_id, -1, textureUniqueId=texture_id)
+        p.changeVisualShape(block_body_id, -1, textureUniqueId=texture_id, physicsClientId=self.physicsClient)
 
         return block_body_id
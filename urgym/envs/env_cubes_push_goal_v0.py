@@ -0,0 +1,47 @@
+from urgym.base.goal import GoalConditionedMixin, info_array
+from urgym.envs import env_cubes_push_v0, env_cubes_push_diff_v0
+
+
+class CubesPushGoalMixin(GoalConditionedMixin):
+    """
+    Goal-conditioned CubesPush, for hindsight experience replay.
+
+    The achieved goal is the position of the cube to push and the desired goal is the position of the target cube.
+    The info of each step tells whether the fingers touched the cube to push ('touched') and whether the robot
+    collided with the table ('table_collision'), the terms of the reward that do not depend on the goals.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.setup_goal_spaces()
+
+    def get_achieved_goal(self):
+        return self.get_cube_pose(self.cubes[1])[:3]
+
+    def get_desired_goal(self):
+        return self.get_cube_pose(self.cubes[0])[:3]
+
+    def get_goal_info(self):
+        # Computed by the step of the environment, from the contacts of this step
+        return dict(self.step_contacts)
+
+    def _step_reward_batch(self, achieved_goal, desired_goal, info):
+        return self.step_reward_batch(desired_goal, achieved_goal, info_array(info, 'touched', bool),
+                                      info_array(info, 'table_collision', bool))
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        return self._step_reward_batch(achieved_goal, desired_goal, info)[0]
+
+    def compute_terminated(self, achieved_goal, desired_goal, info):
+        return self._step_reward_batch(achieved_goal, desired_goal, info)[1]
+
+class CubesPushGoal(CubesPushGoalMixin, env_cubes_push_v0.CubesPush):
+    """
+    Goal-conditioned version of URGym/CubesPush-v0, see `CubesPushGoalMixin`.
+    """
+
+
+class CubesPushDiffGoal(CubesPushGoalMixin, env_cubes_push_diff_v0.CubesPush):
+    """
+    Goal-conditioned version of URGym/CubesPushDiff-v0, see `CubesPushGoalMixin`.
+    """
@@ -0,0 +1,135 @@
+import math
+import numpy as np
+
+from gymnasium.spaces import Box
+
+import pybullet as p
+from urgym.base.utilities import rotate_quaternion, geometric_distance_reward
+from urgym.base.tiled import TiledEnv
+
+class CubesPushTiled(TiledEnv):
+    """
+    Batched version of CubesPush: N robots, each one with its own table and cubes, share a single PyBullet world.
+
+    `step(actions)` takes an array of shape (N, 3) and returns stacked observations of shape (N, 9),
+    with the same layout, rewards and terminations as URGym/CubesPush-v0. Positions in the observations
+    are relative to the origin of each tile.
+    """
+
+    def __init__(self, num_envs: int, reward_type='dense', max_episode_steps=50, render_mode=None, sim_substeps=1) -> None:
+        """
+        Initialize the tiled CubesPush environment.
+
+        Parameters:
+        - num_envs (int): The number of robots/scenes.
+        - reward_type (str): The type of reward to use. Options are 'dense' and 'sparse'. Default is 'dense'.
+        - max_episode_steps (int): Steps after which a scene episode is truncated. Default is 50.
+        - render_mode (str): The rendering mode. Options are 'human' and 'non-human'. Default is None.
+        - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+        """
+        self.reward_type = reward_type
+        self.positive_reward_radius = 0.1
+
+        # Observations: the end-effector position and position (x, y, z) of the two cubes
+        observation_space = Box(low=np.array([-1.0]*3 + [-1.0]*6), high=np.array([1.0]*3 + [1.0]*6), dtype=np.float64)
+        # Actions: (dx, dy, dz) for end-effector displacement
+        action_space = Box(low=np.array([-0.1]*3), high=np.array([+0.1]*3), dtype=np.float32)
+
+        super().__init__(num_envs, observation_space, action_space, max_episode_steps, render_mode, sim_substeps)
+
+    def create_tile_scene(self, tile):
+        tile.cubes = []
+        # Draw a green circle around the target cube
+        visual_shape_id = self.shape_cache.visual_shape(shapeType=p.GEOM_CYLINDER, radius=self.positive_reward_radius, length=0.001,
+                                              rgbaColor=[0, 1.0, 0, 0.4])
+        p.createMultiBody(baseVisualShapeIndex=visual_shape_id, basePosition=tile.to_world([0.0, -0.5, 0.0001]),
+                          physicsClientId=self.physicsClient)
+
+    def reset_tiles(self, tiles):
+        for tile in tiles:
+            tile.robot.reset()
+            self.create_cubes(tile)
+
+            # Position the end effector above the cube
+            new_pose = list(self.get_cube_pose(tile.cubes[1]))
+            new_pose[2] += 0.2 # A little bit higher
+            new_pose[3:] = rotate_quaternion(new_pose[3:], math.pi/2, [0, 1, 0]) # Reorient the end effector
+            tile.vertical_quaternion = new_pose[3:]
+
+            tile.robot.move_ee(new_pose, 'end')
+            tile.robot.close_gripper()
+        self.wait_until_stable(tiles)
+
+    def apply_action(self, tile, action):
+        ee_pose = list(tile.robot.get_ee_pose())
+        ee_pose[:3] += action
+        ee_pose[3:] = tile.vertical_quaternion # to keep the end effector vertical at all times
+        tile.robot.move_ee(ee_pose, 'end')
+
+    def evaluate_tile(self, tile):
+        reward = 0
+
+        if self.is_table_collision(tile):
+            reward -= 0.01
+            success = False
+        elif self.touched_with_fingers(tile, tile.cubes[1]):
+            reward, success = self.update_reward(tile)
+            reward += 0.1 # Reward for touching the cube
+        else:
+            success = False
+
+        reward -= 0.1 # Step penalty
+
+        return reward, success, {"is_success": success}
+
+    def update_reward(self, tile) -> tuple[float, bool]:
+        reward = 0
+
+        cube1_pos = np.array(self.get_cube_pose(tile.cubes[0])[:3])
+        cube2_pos = np.array(self.get_cube_pose(tile.cubes[1])[:3])
+        distance = float(np.linalg.norm(cube1_pos - cube2_pos))
+
+        if self.reward_type == 'dense':
+            # Dense reward: the distance between the cubes
+            reward += geometric_distance_reward(distance, self.positive_reward_radius, 0.5) / 10
+
+        # Sparse reward: if the distance between the cubes is less than 0.05
+        if distance < 0.05:
+            reward += 10
+            success = True
+        else:
+            success = False
+
+        return reward, success
+
+    def is_table_collision(self, tile):
+        # 0 is the base link, is always touching the table
+        return bool(np.any(self.contacts.touching_links(tile.robot.id, tile.table_id) != 0))
+
+    def get_tile_observation(self, tile):
+        ee_position = tile.to_tile(tile.robot.get_ee_pose()[:3])
+        cube1_position = tile.to_tile(self.get_cube_pose(tile.cubes[0])[:3])
+        cube2_position = tile.to_tile(self.get_cube_pose(tile.cubes[1])[:3])
+        return np.concatenate([ee_position, cube1_position, cube2_position])
+
+    def create_cube(self, tile, x: float, y: float, z: float, color:list=[1,1,1,1]):
+        position, orientation = tile.to_world([x, y, z]), p.getQuaternionFromEuler([0, 0, 0])
+        id = tile.body_pool.acquire('cube', position, orientation, lambda: self.add_to_tile(tile,
+            p.loadURDF("cube.urdf", position, orientation, useFixedBase=False, globalScaling = 0.04, physicsClientId=self.physicsClient)))
+        p.changeVisualShape(id, -1, rgbaColor=color, physicsClientId=self.physicsClient)
+        tile.cubes.append(id)
+
+    def create_cubes(self, tile):
+        tile.body_pool.release('cube')
+        tile.cubes = []
+
+        # Create target cube
+        self.create_cube(tile, 0.0, -0.5, 0.1)
+        # Create second cube
+        x = self.random.uniform(-0.1, +0.1)
+        self.create_cube(tile, x, -0.7, 0.1, [1,0,0,1])
+
+    def get_cube_pose(self, cube_id):
+        position, orientation = p.getBasePositionAndOrientation(cube_id, physicsClientId=self.physicsClient)
+        pose = position + orientation
+        return pose
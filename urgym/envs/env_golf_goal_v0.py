@@ -0,0 +1,50 @@
+from urgym.base.goal import GoalConditionedMixin, info_array
+from urgym.envs import env_golf_v0, env_golf_joints_v0
+
+
+class GolfGoalMixin(GoalConditionedMixin):
+    """
+    Goal-conditioned Golf, for hindsight experience replay.
+
+    The achieved goal is the position of the ball and the desired goal is the position of the hole. The info of each
+    step holds the terms of the reward that do not depend on the goals: the position of the base of the stick
+    ('stick_position'), whether the fingers still hold the stick ('stick_in_fingers'), whether the stick touched
+    the ball ('touched') and whether the robot or the stick collided with the pitch ('floor_collision').
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.setup_goal_spaces()
+
+    def get_achieved_goal(self):
+        return self.get_ball_position()
+
+    def get_desired_goal(self):
+        return self.get_hole_position()
+
+    def get_goal_info(self):
+        # The contact terms are computed by the step of the environment, from the contacts of this step
+        return {'stick_position': tuple(self.get_stick_base_position()), **self.step_contacts}
+
+    def _step_reward_batch(self, achieved_goal, desired_goal, info):
+        return self.step_reward_batch(info_array(info, 'stick_position', float), achieved_goal, desired_goal,
+                                      info_array(info, 'stick_in_fingers', bool), info_array(info, 'touched', bool),
+                                      info_array(info, 'floor_collision', bool))
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        return self._step_reward_batch(achieved_goal, desired_goal, info)[0]
+
+    def compute_terminated(self, achieved_goal, desired_goal, info):
+        return self._step_reward_batch(achieved_goal, desired_goal, info)[2]
+
+
+class GolfGoal(GolfGoalMixin, env_golf_v0.Golf):
+    """
+    Goal-conditioned version of URGym/Golf-v0, see `GolfGoalMixin`.
+    """
+
+
+class GolfJointsGoal(GolfGoalMixin, env_golf_joints_v0.Golf):
+    """
+    Goal-conditioned version of URGym/GolfJoints-v0, see `GolfGoalMixin`.
+    """
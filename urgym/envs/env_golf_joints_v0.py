@@ -2,7 +2,6 @@ import time
 import math
 import numpy as np
 from typing import NoReturn, Optional
-import random
 import os
 from copy import deepcopy
 
@@ -11,8 +10,15 @@ from gymnasium.spaces import Box
 
 import pybullet as p
 import pybullet_data
-from urgym.base.utilities import rotate_quaternion, geometric_distance_reward
+from urgym.base.utilities import rotate_quaternion, geometric_distance_reward, geometric_distance_reward_batch
 from urgym.base.robot import UR5Robotiq85
+from urgym.base.settle import SettleDetector, configure_substeps
+from urgym.base.snapshot import SceneSnapshot, reset_body
+from urgym.base.pool import BodyPool
+from urgym.base.state_bank import StateBank
+from urgym.base.contacts import ContactCache
+from urgym.base.shapes import ShapeCache
+from urgym.base.observation import ObservationBuffer
 
 class Golf(Env):
     """
@@ -39,14 +45,20 @@ class Golf(Env):
     """
 
     SIMULATION_STEP_DELAY = 1 / 240.
+    OBSERVATION_LAYOUT = [('joint_positions', 6), ('stick_position', 3), ('relative_ball_stick_position', 3), ('relative_ball_hole_position', 3)]
 
-    def __init__(self, camera=None, reward_type='dense',  render_mode='human') -> None:
+    def __init__(self, camera=None, reward_type='dense',  render_mode='human', sim_substeps: int = 1, reset_mode: str = 'full', state_bank: Optional[str] = None, obs_buffer: bool = False, ik_solver: str = 'pybullet') -> None:
         """
         Initialize the CubesPush environment.
 
         Parameters:
         - reward_type (str): The type of reward to use. Options are 'dense' and 'sparse'. Default is 'dense'.
         - render_mode (str): The rendering mode. Options are 'human' and 'non-human'. Default is 'human'.
+        - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+        - reset_mode (str): 'full' rebuilds and settles the scene on every reset, 'snapshot' restores an in-memory snapshot of the scene taken on the first reset and only randomizes the object poses, 'bank' teleports the scene into a random precomputed state of `state_bank`. Default is 'full'.
+        - state_bank (str): Path of the `.npy` state bank used by the 'bank' reset mode, see `urgym.generate_state_bank`. Default is None.
+        - obs_buffer (bool): Whether to write the observations in place into a reusable float32 buffer, which is returned on every step instead of a new float64 array, see `urgym.base.observation`. Default is False.
+        - ik_solver (str): The IK solver of the end-effector control, 'pybullet' (iterative) or 'analytic' (closed-form UR5 IK, deterministic). Default is 'pybullet'.
         """
 
         self.reward_type = reward_type
@@ -59,29 +71,48 @@ class Golf(Env):
         # Set observation and action spaces
         # Observations: joints, the stick position, position of the ball relative to the stick and position of the ball relative to the hole
         self.observation_space = Box(low=np.array([-2*math.pi]*6 + [-1.0]*3 + [-1.0]*3 + [-1.0]*3), high=np.array([2*math.pi]*6 + [1.0]*3 + [1.0]*3 + [1.0]*3), dtype=np.float64)
+        self.obs_buffer = obs_buffer
+        self.observation_buffer = ObservationBuffer(self.OBSERVATION_LAYOUT, np.float32 if obs_buffer else np.float64)
+        self.observation_space = self.observation_buffer.space(self.observation_space)
         # Actions: 6 for joints displacement 
         self.action_space = Box(low=np.array([-0.1]*6), high=np.array([+0.1]*6), dtype=np.float32)
 
         # Define environment        
         self.physicsClient = p.connect(p.GUI if self.visualize else p.DIRECT)
-        p.setAdditionalSearchPath(pybullet_data.getDataPath())
-        p.setGravity(0, 0, -9.8)
+        self.shape_cache = ShapeCache.for_client(self.physicsClient)
+        self.sim_substeps = sim_substeps
+        if sim_substeps > 1:
+            configure_substeps(self.physicsClient, sim_substeps)
+        p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physicsClient)
+        p.setGravity(0, 0, -9.8, physicsClientId=self.physicsClient)
 
         # Reorient the debug camera
-        p.resetDebugVisualizerCamera(cameraDistance=1.8, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.2,0])
+        p.resetDebugVisualizerCamera(cameraDistance=1.8, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.2,0], physicsClientId=self.physicsClient)
 
         # Hide right and left menus
-        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0)
+        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0, physicsClientId=self.physicsClient)
 
         # Robot will be centered at the origin (0,0,0), the plane and the table will be below z=0
         table_dimensions = [1.0, 2.0, 0.5]
-        self.planeID = p.loadURDF("plane.urdf", [0, 0, -table_dimensions[2]])
+        self.planeID = p.loadURDF("plane.urdf", [0, 0, -table_dimensions[2]], physicsClientId=self.physicsClient)
         self.table_id = self.create_table_block(table_dimensions, [0, 0, -table_dimensions[2]/2], color=[0.5, 0.5, 0.5, 1])
 
-        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0))
+        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0), self.physicsClient)
 
         self.robot.load()
         self.robot.step_simulation = self.step_simulation # type: ignore
+        self.robot.sim_substeps = sim_substeps
+        self.robot.ik_solver = ik_solver
+        self.settle_detector = SettleDetector(self.robot)
+        assert reset_mode in ('full', 'snapshot', 'bank')
+        assert reset_mode != 'bank' or state_bank is not None, "The 'bank' reset mode needs a state bank"
+        self.reset_mode = reset_mode
+        self.snapshot = SceneSnapshot(self.physicsClient, [self.robot])
+        self.body_pool = BodyPool(self.physicsClient)
+        self.contacts = ContactCache(self.physicsClient)
+        self.step_contacts = {}
+        self.state_bank = StateBank.load(state_bank) if state_bank is not None else None
+        self.scene_built = False
         self.control_method = 'joint'
 
         self.pitch_id = self.create_golf_pitch([0, -0.6, 0.02])
@@ -93,24 +124,16 @@ class Golf(Env):
         """
         Hook p.stepSimulation()
         """
-        p.stepSimulation()
+        p.stepSimulation(physicsClientId=self.physicsClient)
         if self.visualize:
-            time.sleep(self.SIMULATION_STEP_DELAY)
+            time.sleep(self.SIMULATION_STEP_DELAY * self.sim_substeps)
 
     def wait_simulation_steps(self, sim_steps):
-        for _ in range(sim_steps):
+        for _ in range(math.ceil(sim_steps / self.sim_substeps)):
             self.step_simulation()
 
     def wait_until_stable(self, sim_steps=480):
-        pos = self.robot.get_joint_obs()['positions']
-        for _ in range(sim_steps):
-            self.step_simulation()
-            new_pos = self.robot.get_joint_obs()['positions']
-            if np.sum(np.abs(np.array(pos)-np.array(new_pos))) < 5e-3: # Threshold based on experience
-                return True
-            pos = new_pos
-        print("Warning: The robot configuration did not stabilize")
-        return False
+        return self.settle_detector.wait(sim_steps)
 
     def step(self, action):
         """
@@ -124,13 +147,19 @@ class Golf(Env):
         self.robot.move_ee(new_joints_positions, self.control_method)
 
         self.wait_until_stable()
+
+        # A single contact snapshot for all the predicates of this step
+        self.contacts.update()
+        # The contact terms of the reward, kept for the info of the goal-conditioned versions
+        self.step_contacts = {'stick_in_fingers': self.stick_in_fingers(), 'touched': self.touched_with_stick(self.ball_id),
+                              'floor_collision': self.is_floor_collision()}
                 
         # Termination conditions
         if self.is_ball_in_hole():
             reward += 10
             success = True
             terminated = True
-        elif not self.stick_in_fingers():
+        elif not self.step_contacts['stick_in_fingers']:
             reward -= 5
             success = False
             terminated = True
@@ -141,7 +170,7 @@ class Golf(Env):
             terminated = True
             print("Ball off pitch!")
         else:
-            if self.is_floor_collision():
+            if self.step_contacts['floor_collision']:
                 reward -= 0.01
                 success = False
                 terminated = False
@@ -155,7 +184,7 @@ class Golf(Env):
 
                 success = False
                 terminated = False
-            if self.touched_with_stick(self.ball_id):
+            if self.step_contacts['touched']:
                 reward += 0.1 # Reward for touching the ball
                 print("Touched!")
                 if self.reward_type == 'dense':
@@ -181,35 +210,15 @@ class Golf(Env):
         return self.get_observation(), reward, terminated, truncated, info
     
     def is_floor_collision(self):
-        # Check the robot
-        contact_points = p.getContactPoints(bodyA=self.robot.id, bodyB=self.pitch_id)
-        if contact_points:
-            #print("Collision with the pitch!")
-            return True
-        # Check the stick
-        contact_points = p.getContactPoints(bodyA=self.stick_id, bodyB=self.pitch_id)
-        if contact_points:
-            #print("Collision with the pitch!")
-            return True
-        
-        return False
+        # Check the robot and the stick
+        return self.contacts.touching(self.robot.id, self.pitch_id) or self.contacts.touching(self.stick_id, self.pitch_id)
 
     def touched_with_stick(self, object_id):
-        contact_points = p.getContactPoints(object_id, self.stick_id)
-        if contact_points:
-            return True
-        return False
+        return self.contacts.touching(object_id, self.stick_id)
 
     def stick_in_fingers(self):
-        contact_points = p.getContactPoints(self.stick_id, self.robot.id)
-        fingers_indices = list(range(9, 19))
-        contact_with_links = any(
-            point[4] in fingers_indices or point[3] in fingers_indices
-            for point in contact_points
-        )
-        if contact_with_links:
-            return True
-        return False
+        fingers_indices = np.arange(9, 19)
+        return self.contacts.touching(self.robot.id, self.stick_id, links=fingers_indices)
 
 
     def is_ball_in_hole(self, threshold=0.05):
@@ -225,26 +234,73 @@ class Golf(Env):
             return True
         return False
 
+    def dense_reward_batch(self, stick_positions, ball_positions, hole_positions, touched, floor_collisions):
+        """
+        Vectorized reward of the steps of `step` that do not end the episode, before the step penalty.
+
+        Parameters:
+        - stick_positions, ball_positions, hole_positions: Arrays of shape (..., 3), the positions after the steps
+        - touched: Boolean array of shape (...), whether the stick touched the ball
+        - floor_collisions: Boolean array of shape (...), whether the robot or the stick collided with the pitch
+
+        Returns:
+        An array of rewards of shape (...)
+        """
+        ball_positions = np.asarray(ball_positions)
+        touched = np.asarray(touched, dtype=bool)
+        rewards = np.where(floor_collisions, -0.01, 0.0)
+        touch_rewards = np.where(touched, 0.1, 0.0) # Reward for touching the ball
+        if self.reward_type == 'dense':
+            # The distance between the ball and stick base, and between the ball and hole once touched
+            stick_distances = np.linalg.norm(np.asarray(stick_positions) - ball_positions, axis=-1)
+            hole_distances = np.linalg.norm(np.asarray(hole_positions) - ball_positions, axis=-1)
+            rewards += geometric_distance_reward_batch(stick_distances, self.positive_reward_radius, 0.5) / 10
+            touch_rewards += np.where(touched, geometric_distance_reward_batch(hole_distances, self.positive_reward_radius, 0.5) / 10, 0.0)
+        return rewards + touch_rewards
+
+    def step_reward_batch(self, stick_positions, ball_positions, hole_positions, stick_in_fingers, touched, floor_collisions):
+        """
+        Vectorized reward of `step`, for rescoring stored transitions. The parameters are those of
+        `dense_reward_batch`, plus `stick_in_fingers`, a boolean array of shape (...) telling whether the fingers
+        still held the stick.
+
+        Returns:
+        The rewards, the successes and the terminations, as arrays of shape (...)
+        """
+        ball_positions = np.asarray(ball_positions)
+        stick_in_fingers = np.asarray(stick_in_fingers, dtype=bool)
+        successes = np.linalg.norm(np.asarray(hole_positions) - ball_positions, axis=-1) < 0.05
+        stick_fell = ~successes & ~stick_in_fingers
+        off_pitch = ~successes & stick_in_fingers & (ball_positions[..., 2] < 0)
+        rewards = np.select([successes, stick_fell, off_pitch], [10.0, -5.0, -10.0],
+                            default=self.dense_reward_batch(stick_positions, ball_positions, hole_positions, touched, floor_collisions))
+        return rewards - 0.1, successes, successes | stick_fell | off_pitch # Step penalty
+
     def get_observation(self):
-        joints = self.robot.get_joint_states()
-        stick_position = np.array(self.get_stick_base_position())
-        ball_position = np.array(self.get_ball_position())
-        relative_ball_hole_position = np.array(self.get_hole_position()) - ball_position
-        relative_ball_stick_position = stick_position - ball_position
-        obs = np.append(joints, [stick_position, relative_ball_stick_position, relative_ball_hole_position])
-        return obs
+        stick_position = self.get_stick_base_position()
+        ball_position = self.get_ball_position()
+        self.observation_buffer['joint_positions'] = self.robot.get_joint_states()
+        self.observation_buffer['stick_position'] = stick_position
+        np.subtract(stick_position, ball_position, out=self.observation_buffer['relative_ball_stick_position'])
+        np.subtract(self.get_hole_position(), ball_position, out=self.observation_buffer['relative_ball_hole_position'])
+        return self.observation_buffer.array if self.obs_buffer else self.observation_buffer.array.copy()
 
     def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None):
         super().reset(seed=seed)
+        # Drawn before the first reset builds the scene, which also draws from np_random, so that a reset with a
+        # given seed restores the same state in a fresh worker and in one that has already reset
+        bank_state = self.state_bank.sample(self.np_random) if self.reset_mode == 'bank' else None
+        if self.reset_mode == 'snapshot' and self.snapshot.captured:
+            self.restore_snapshot()
+            return self.get_observation(), {}
+        if self.reset_mode == 'bank' and self.scene_built:
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
+            return self.get_observation(), {}
+
         self.robot.reset()
 
-        if self.stick_id is not None:
-            p.removeBody(self.stick_id)
-        if self.ball_id is not None:
-            p.removeBody(self.ball_id)
-        if self.pitch_id is not None: # Recreated as it may move due to collision
-            p.removeBody(self.pitch_id)
-            self.pitch_id = self.create_golf_pitch([0, -0.6, 0.02])
+        self.body_pool.release()
+        self.pitch_id = self.create_golf_pitch([0, -0.6, 0.02]) # Placed again as it may move due to collision
 
         new_pose = [0.0, -0.60, 0.40, 0.0, 0.0, -0.70, 0.70]
         self.vertical_quaternion = new_pose[3:]
@@ -261,27 +317,36 @@ class Golf(Env):
         self.ball_id = self.create_ball()
 
         self.robot.close_gripper()
+        if self.reset_mode == 'snapshot':
+            # The scene right before the stick is grasped and the ball falls on the pitch
+            self.snapshot.capture()
         self.wait_until_stable()
 
+        self.scene_built = True
+        if self.reset_mode == 'bank':
+            # The scene is only built on the first reset, its state is then replaced by one of the bank
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
+
         return self.get_observation(), {}
 
     def close(self):
+        ShapeCache.release(self.physicsClient)
         p.disconnect(self.physicsClient)
 
     # Plain stick, does not work very well
     def _create_stick_alt(self, base_position):
         # Create a rectangular collision shape
         dimensions = np.array([0.02, 0.05, 0.2])
-        collision_shape = p.createCollisionShape(shapeType=p.GEOM_BOX, halfExtents=dimensions/2)
+        collision_shape = self.shape_cache.collision_shape(shapeType=p.GEOM_BOX, halfExtents=dimensions/2)
         
         # Create a visual shape (optional, for better visualization)
-        visual_shape = p.createVisualShape(shapeType=p.GEOM_BOX, halfExtents=dimensions/2, rgbaColor=[1, 0.5, 0, 1])
+        visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_BOX, halfExtents=dimensions/2, rgbaColor=[1, 0.5, 0, 1])
         
         # Create the multi-body using the collision shape and visual shape
         base_mass = 1  # mass of the object
-        stick_id = p.createMultiBody(base_mass, collision_shape, visual_shape, base_position, [0, 0, 0, 1])
+        stick_id = p.createMultiBody(base_mass, collision_shape, visual_shape, base_position, [0, 0, 0, 1], physicsClientId=self.physicsClient)
         # Add friction
-        p.changeDynamics(stick_id, -1, lateralFriction=10, restitution=0.1)
+        p.changeDynamics(stick_id, -1, lateralFriction=10, restitution=0.1, physicsClientId=self.physicsClient)
 
         return stick_id
 
@@ -293,23 +358,23 @@ class Golf(Env):
         top_disc_height = 0.01
 
         # Define the shape for the vertical part
-        vertical_part_collision = p.createCollisionShape(p.GEOM_BOX, halfExtents=[d/2 for d in vertical_part_size])
-        vertical_part_visual = p.createVisualShape(p.GEOM_BOX, halfExtents=[d/2 for d in vertical_part_size], rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
+        vertical_part_collision = self.shape_cache.collision_shape(p.GEOM_BOX, halfExtents=[d/2 for d in vertical_part_size])
+        vertical_part_visual = self.shape_cache.visual_shape(p.GEOM_BOX, halfExtents=[d/2 for d in vertical_part_size], rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
 
         # Define the shape for the bottom transversal part
-        transversal_part_collision = p.createCollisionShape(p.GEOM_BOX, halfExtents=[d/2 for d in transversal_part_size])
-        transversal_part_visual = p.createVisualShape(p.GEOM_BOX, halfExtents=[d/2 for d in transversal_part_size], rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
+        transversal_part_collision = self.shape_cache.collision_shape(p.GEOM_BOX, halfExtents=[d/2 for d in transversal_part_size])
+        transversal_part_visual = self.shape_cache.visual_shape(p.GEOM_BOX, halfExtents=[d/2 for d in transversal_part_size], rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
 
         # Define the shape for the top disc part
-        top_disc_collision = p.createCollisionShape(p.GEOM_CYLINDER, radius=top_disc_radius, height=top_disc_height)
-        top_disc_visual = p.createVisualShape(p.GEOM_CYLINDER, radius=top_disc_radius, length=top_disc_height, rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
+        top_disc_collision = self.shape_cache.collision_shape(p.GEOM_CYLINDER, radius=top_disc_radius, height=top_disc_height)
+        top_disc_visual = self.shape_cache.visual_shape(p.GEOM_CYLINDER, radius=top_disc_radius, length=top_disc_height, rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
 
         # Calculate the positions for the bottom transversal part and the top disc part
         bottom_transversal_part_position = [0, 0, -(vertical_part_size[2]/2 + transversal_part_size[2]/2)]
         top_disc_position = [0, 0, vertical_part_size[2]/2 + top_disc_height/2]
 
         # Create the combined multi-body object with the bottom transversal part and the top disc
-        stick_id = p.createMultiBody(
+        stick_id = self.body_pool.acquire('stick', base_position, [0, 0, 0, 1], lambda: p.createMultiBody(
             baseMass=1,
             baseCollisionShapeIndex=vertical_part_collision,
             baseVisualShapeIndex=vertical_part_visual,
@@ -323,41 +388,62 @@ class Golf(Env):
             linkInertialFrameOrientations=[[0, 0, 0, 1], [0, 0, 0, 1]],
             linkParentIndices=[0, 0],
             linkJointTypes=[p.JOINT_FIXED, p.JOINT_FIXED],
-            linkJointAxis=[[0, 0, 0], [0, 0, 0]]
-        )
+            linkJointAxis=[[0, 0, 0], [0, 0, 0]],
+            physicsClientId=self.physicsClient
+        ))
         # Add friction
-        p.changeDynamics(stick_id, -1, lateralFriction=10, restitution=0.1)
+        p.changeDynamics(stick_id, -1, lateralFriction=10, restitution=0.1, physicsClientId=self.physicsClient)
 
         return stick_id
 
 
-    def create_ball(self, radius=0.015):
+    def get_scene_bodies(self):
+        """
+        Returns the IDs of the bodies whose state is stored in the state banks, always in the same order
+        """
+        return [self.pitch_id, self.stick_id, self.ball_id]
+
+    def restore_snapshot(self):
+        """
+        Restores the scene right before the stick is grasped, with a new random ball position.
+        The golf pitch is also brought back to its original position.
+        """
+        self.snapshot.restore()
+        reset_body(self.ball_id, self.get_ball_spawn_position(), [0, 0, 0, 1], self.physicsClient)
+        self.wait_until_stable()
+
+    def get_ball_spawn_position(self):
         # Calculate the ball position (centered on top of the stick)
         ball_position = [0, -0.7, 0.1]
         # Randomize the ball position a little bit
-        ball_position[0] += random.uniform(-0.2, 0.2)
-        ball_position[1] += random.uniform(-0.1, 0.1)
+        ball_position[0] += self.np_random.uniform(-0.2, 0.2)
+        ball_position[1] += self.np_random.uniform(-0.1, 0.1)
+        return ball_position
+
+    def create_ball(self, radius=0.015):
+        ball_position = self.get_ball_spawn_position()
 
         # To test the ball in the hole event
         #ball_position = np.array(self.get_hole_position())
         #ball_position[2] += 0.04
         
         # Create a spherical collision shape
-        collision_shape = p.createCollisionShape(shapeType=p.GEOM_SPHERE, radius=radius)
+        collision_shape = self.shape_cache.collision_shape(shapeType=p.GEOM_SPHERE, radius=radius)
         
         # Create a visual shape (optional, for better visualization)
-        visual_shape = p.createVisualShape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[1, 1, 1, 1])
+        visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[1, 1, 1, 1])
         
         # Create the multi-body using the collision shape and visual shape
-        ball_body_id = p.createMultiBody(0.01, collision_shape, visual_shape, ball_position)
+        ball_body_id = self.body_pool.acquire('ball', ball_position, [0, 0, 0, 1],
+                                              lambda: p.createMultiBody(0.01, collision_shape, visual_shape, ball_position, physicsClientId=self.physicsClient))
 
         # Add friction
-        p.changeDynamics(ball_body_id, -1, rollingFriction=10.0, restitution=0.1)
+        p.changeDynamics(ball_body_id, -1, rollingFriction=10.0, restitution=0.1, physicsClientId=self.physicsClient)
         
         return ball_body_id
 
     def get_stick_pose(self):
-        position, orientation = p.getBasePositionAndOrientation(self.stick_id)
+        position, orientation = p.getBasePositionAndOrientation(self.stick_id, physicsClientId=self.physicsClient)
         pose = position + orientation
         return pose
     
@@ -366,21 +452,21 @@ class Golf(Env):
 
     def get_stick_base_position(self):
         # Get the state of the bottom transversal part (link 0)
-        link_state = p.getLinkState(self.stick_id, 0)
+        link_state = p.getLinkState(self.stick_id, 0, physicsClientId=self.physicsClient)
         # The link position is the center of mass of the link
         link_position = link_state[0]
         return link_position
 
     def get_ball_position(self):
-        position, _ = p.getBasePositionAndOrientation(self.ball_id)
+        position, _ = p.getBasePositionAndOrientation(self.ball_id, physicsClientId=self.physicsClient)
         return position
 
     def get_hole_position(self):
-        position, _ = p.getBasePositionAndOrientation(self.pitch_id)
+        position, _ = p.getBasePositionAndOrientation(self.pitch_id, physicsClientId=self.physicsClient)
         return position
 
     def draw_circle_area(self, radius=0.1, center_x=0.0, center_y=-0.5, segments=100, color=[0, 1.0, 0, 0.4]):
-        visual_shape_id = p.createVisualShape(
+        visual_shape_id = self.shape_cache.visual_shape(
             shapeType=p.GEOM_CYLINDER,
             radius=radius,
             length=0.001,  # Very thin to act as a visual aid
@@ -388,7 +474,8 @@ class Golf(Env):
         )
         p.createMultiBody(
             baseVisualShapeIndex=visual_shape_id,
-            basePosition=[center_x, center_y, 0.0001]  # Slightly above the ground to avoid z-fighting
+            basePosition=[center_x, center_y, 0.0001],  # Slightly above the ground to avoid z-fighting
+            physicsClientId=self.physicsClient
         )
 
     def create_table_block(self, size, position, color=[1, 0, 0, 1]):
@@ -403,24 +490,24 @@ class Golf(Env):
         Returns:
         - block_body_id: The ID of the created block.
         """
-        block_visual_shape_id = p.createVisualShape(shapeType=p.GEOM_BOX,
+        block_visual_shape_id = self.shape_cache.visual_shape(shapeType=p.GEOM_BOX,
                                                     rgbaColor=color,
                                                     halfExtents=[size[0]/2, size[1]/2, size[2]/2])
-        block_collision_shape_id = p.createCollisionShape(shapeType=p.GEOM_BOX,
+        block_collision_shape_id = self.shape_cache.collision_shape(shapeType=p.GEOM_BOX,
                                                         halfExtents=[size[0]/2, size[1]/2, size[2]/2])
         block_body_id = p.createMultiBody(baseMass=0,
                                         baseCollisionShapeIndex=block_collision_shape_id,
                                         baseVisualShapeIndex=block_visual_shape_id,
-                                        basePosition=position)  
+                                        basePosition=position, physicsClientId=self.physicsClient)  
         
         # Load the texture
         script_dir = os.path.dirname(__file__)
         texture_path = os.path.join(script_dir, "../meshes/textures/steel.jpg")
  
-        texture_id = p.loadTexture(texture_path)
+        texture_id = self.shape_cache.texture(texture_path)
 
         # Apply the texture to the block
-        p.changeVisualShape(block_body_id, -1, textureUniqueId=texture_id)
+        p.changeVisualShape(block_body_id, -1, textureUniqueId=texture_id, physicsClientId=self.physicsClient)
 
         return block_body_id
 
@@ -431,16 +518,17 @@ class Golf(Env):
         pitch_path = os.path.join(script_dir, "../meshes/golf_pitch.obj")
 
         # Create collision shape from the mesh
-        collision_shape_id = p.createCollisionShape(shapeType=p.GEOM_MESH, fileName=pitch_path)
+        collision_shape_id = self.shape_cache.collision_shape(shapeType=p.GEOM_MESH, fileName=pitch_path)
 
         # Create visual shape from the mesh
-        visual_shape_id = p.createVisualShape(shapeType=p.GEOM_MESH, fileName=pitch_path, rgbaColor=[0.1, 0.6, 0, 1], specularColor=[0, 0, 0])
+        visual_shape_id = self.shape_cache.visual_shape(shapeType=p.GEOM_MESH, fileName=pitch_path, rgbaColor=[0.1, 0.6, 0, 1], specularColor=[0, 0, 0])
 
         # Create the multi-body with the collision and visual shapes
-        body_id = p.createMultiBody(baseMass=0,
-                                    baseCollisionShapeIndex=collision_shape_id,
-                                    baseVisualShapeIndex=visual_shape_id,
-                                    basePosition=position)  # Adjust the position as needed
+        body_id = self.body_pool.acquire('pitch', position, [0, 0, 0, 1],
+                                         lambda: p.createMultiBody(baseMass=0,
+                                                                   baseCollisionShapeIndex=collision_shape_id,
+                                                                   baseVisualShapeIndex=visual_shape_id,
+                                                                   basePosition=position, physicsClientId=self.physicsClient))  # Adjust the position as needed
                 
         return body_id
     
@@ -458,7 +546,7 @@ class Golf(Env):
 
         # Iterate through each link index in the gripper
         for link_index in gripper_link_indices:
-            aabb_min, aabb_max = p.getAABB(self.robot.id, link_index)
+            aabb_min, aabb_max = p.getAABB(self.robot.id, link_index, physicsClientId=self.physicsClient)
             
             # Update the overall AABB
             for i in range(3):
@@ -0,0 +1,216 @@
+import numpy as np
+import os
+
+from gymnasium.spaces import Box
+
+import pybullet as p
+from urgym.base.utilities import geometric_distance_reward
+from urgym.base.tiled import TiledEnv
+
+class GolfTiled(TiledEnv):
+    """
+    Batched version of Golf: N robots, each one with its own table, golf pitch, stick and ball, share a single PyBullet world.
+
+    `step(actions)` takes an array of shape (N, 3) and returns stacked observations of shape (N, 9),
+    with the same layout, rewards and terminations as URGym/Golf-v0. Positions in the observations
+    are relative to the origin of each tile.
+    """
+
+    def __init__(self, num_envs: int, reward_type='dense', max_episode_steps=100, render_mode=None, sim_substeps=1) -> None:
+        """
+        Initialize the tiled Golf environment.
+
+        Parameters:
+        - num_envs (int): The number of robots/scenes.
+        - reward_type (str): The type of reward to use. Options are 'dense' and 'sparse'. Default is 'dense'.
+        - max_episode_steps (int): Steps after which a scene episode is truncated. Default is 100.
+        - render_mode (str): The rendering mode. Options are 'human' and 'non-human'. Default is None.
+        - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+        """
+        self.reward_type = reward_type
+        self.positive_reward_radius = 0.1
+
+        # Observations: the stick position, position of the ball relative to the stick and position of the ball relative to the hole
+        observation_space = Box(low=np.array([-1.0]*3 + [-1.0]*3 + [-1.0]*3), high=np.array([1.0]*3 + [1.0]*3 + [1.0]*3), dtype=np.float64)
+        # Actions: (dx, dy, dz) for end-effector displacement
+        action_space = Box(low=np.array([-0.1]*3), high=np.array([+0.1]*3), dtype=np.float32)
+
+        super().__init__(num_envs, observation_space, action_space, max_episode_steps, render_mode, sim_substeps)
+
+    def create_tile_scene(self, tile):
+        tile.pitch_id = None
+        tile.stick_id = None
+        tile.ball_id = None
+
+    def reset_tiles(self, tiles):
+        for tile in tiles:
+            tile.robot.reset()
+
+            tile.body_pool.release()
+            # Placed again as it may move due to collision
+            tile.pitch_id = self.create_golf_pitch(tile, [0, -0.6, 0.02])
+
+            new_pose = tile.to_world([0.0, -0.60, 0.40]) + [0.0, 0.0, -0.70, 0.70]
+            tile.vertical_quaternion = new_pose[3:]
+
+            tile.robot.move_ee(new_pose, 'end')
+            tile.robot.open_gripper(20)
+        self.wait_until_stable(tiles)
+
+        for tile in tiles:
+            pose = self.get_gripper_geometrical_center(tile)
+            pose[2] -= 0.05
+            tile.stick_id = self.create_stick(tile, pose)
+            tile.ball_id = self.create_ball(tile)
+
+            tile.robot.close_gripper()
+        self.wait_until_stable(tiles)
+
+    def apply_action(self, tile, action):
+        ee_pose = list(tile.robot.get_ee_pose())
+        ee_pose[:3] += action
+        ee_pose[3:] = tile.vertical_quaternion # to keep the end effector vertical at all times
+        tile.robot.move_ee(ee_pose, 'end')
+
+    def evaluate_tile(self, tile):
+        reward = 0
+        success = False
+
+        # Termination conditions
+        if self.is_ball_in_hole(tile):
+            reward += 10
+            success = True
+            terminated = True
+        elif not self.touched_with_fingers(tile, tile.stick_id):
+            reward -= 5
+            terminated = True
+        elif self.is_ball_off_pitch(tile):
+            reward -= 10
+            terminated = True
+        else:
+            terminated = False
+            if self.is_floor_collision(tile):
+                reward -= 0.01
+            if self.reward_type == 'dense':
+                # Dense reward: the distance between the ball and stick base
+                distance = float(np.linalg.norm(np.array(self.get_stick_base_position(tile)) - np.array(self.get_ball_position(tile))))
+                reward += geometric_distance_reward(distance, self.positive_reward_radius, 0.5) / 10
+            if self.touched_with_stick(tile):
+                reward += 0.1 # Reward for touching the ball
+                if self.reward_type == 'dense':
+                    # Dense reward:  the distance between the ball and hole
+                    distance = float(np.linalg.norm(np.array(self.get_hole_position(tile)) - np.array(self.get_ball_position(tile))))
+                    reward += geometric_distance_reward(distance, self.positive_reward_radius, 0.5) / 10
+
+        reward -= 0.1 # Step penalty
+
+        return reward, terminated, {"is_success": success}
+
+    def is_floor_collision(self, tile):
+        # Check the robot and the stick
+        return self.contacts.touching(tile.robot.id, tile.pitch_id) or self.contacts.touching(tile.stick_id, tile.pitch_id)
+
+    def touched_with_stick(self, tile):
+        return self.contacts.touching(tile.ball_id, tile.stick_id)
+
+    def is_ball_in_hole(self, tile, threshold=0.05):
+        distance = np.linalg.norm(np.array(self.get_hole_position(tile)) - np.array(self.get_ball_position(tile)))
+        return distance < threshold
+
+    def is_ball_off_pitch(self, tile):
+        return self.get_ball_position(tile)[2] < 0
+
+    def get_tile_observation(self, tile):
+        stick_position = tile.to_tile(self.get_stick_base_position(tile))
+        ball_position = tile.to_tile(self.get_ball_position(tile))
+        relative_ball_hole_position = tile.to_tile(self.get_hole_position(tile)) - ball_position
+        relative_ball_stick_position = stick_position - ball_position
+        return np.concatenate([stick_position, relative_ball_stick_position, relative_ball_hole_position])
+
+    def create_stick(self, tile, base_position):
+        # Define dimensions of the parts of the inverted T
+        vertical_part_size = [0.03, 0.03, 0.15]
+        transversal_part_size = [0.1, 0.03, 0.03]
+        top_disc_radius = 0.04
+        top_disc_height = 0.01
+
+        # Define the shape for the vertical part
+        vertical_part_collision = self.shape_cache.collision_shape(p.GEOM_BOX, halfExtents=[d/2 for d in vertical_part_size])
+        vertical_part_visual = self.shape_cache.visual_shape(p.GEOM_BOX, halfExtents=[d/2 for d in vertical_part_size], rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
+
+        # Define the shape for the bottom transversal part
+        transversal_part_collision = self.shape_cache.collision_shape(p.GEOM_BOX, halfExtents=[d/2 for d in transversal_part_size])
+        transversal_part_visual = self.shape_cache.visual_shape(p.GEOM_BOX, halfExtents=[d/2 for d in transversal_part_size], rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
+
+        # Define the shape for the top disc part
+        top_disc_collision = self.shape_cache.collision_shape(p.GEOM_CYLINDER, radius=top_disc_radius, height=top_disc_height)
+        top_disc_visual = self.shape_cache.visual_shape(p.GEOM_CYLINDER, radius=top_disc_radius, length=top_disc_height, rgbaColor=[1, 0.5, 0, 1], specularColor=[0, 0, 0])
+
+        # Calculate the positions for the bottom transversal part and the top disc part
+        bottom_transversal_part_position = [0, 0, -(vertical_part_size[2]/2 + transversal_part_size[2]/2)]
+        top_disc_position = [0, 0, vertical_part_size[2]/2 + top_disc_height/2]
+
+        # Create the combined multi-body object with the bottom transversal part and the top disc
+        stick_id = tile.body_pool.acquire('stick', base_position, [0, 0, 0, 1], lambda: self.add_to_tile(tile, p.createMultiBody(
+            baseMass=1,
+            baseCollisionShapeIndex=vertical_part_collision,
+            baseVisualShapeIndex=vertical_part_visual,
+            basePosition=base_position,
+            linkMasses=[1, 1],
+            linkCollisionShapeIndices=[transversal_part_collision, top_disc_collision],
+            linkVisualShapeIndices=[transversal_part_visual, top_disc_visual],
+            linkPositions=[bottom_transversal_part_position, top_disc_position],
+            linkOrientations=[[0, 0, 0, 1], [0, 0, 0, 1]],
+            linkInertialFramePositions=[[0, 0, 0], [0, 0, 0]],
+            linkInertialFrameOrientations=[[0, 0, 0, 1], [0, 0, 0, 1]],
+            linkParentIndices=[0, 0],
+            linkJointTypes=[p.JOINT_FIXED, p.JOINT_FIXED],
+            linkJointAxis=[[0, 0, 0], [0, 0, 0]],
+            physicsClientId=self.physicsClient
+        )))
+        # Add friction
+        p.changeDynamics(stick_id, -1, lateralFriction=10, restitution=0.1, physicsClientId=self.physicsClient)
+
+        return stick_id
+
+    def create_ball(self, tile, radius=0.015):
+        ball_position = [0, -0.7, 0.1]
+        # Randomize the ball position a little bit
+        ball_position[0] += self.random.uniform(-0.2, 0.2)
+        ball_position[1] += self.random.uniform(-0.1, 0.1)
+
+        collision_shape = self.shape_cache.collision_shape(shapeType=p.GEOM_SPHERE, radius=radius)
+        visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[1, 1, 1, 1])
+        ball_position = tile.to_world(ball_position)
+        ball_body_id = tile.body_pool.acquire('ball', ball_position, [0, 0, 0, 1], lambda: self.add_to_tile(tile,
+            p.createMultiBody(0.01, collision_shape, visual_shape, ball_position, physicsClientId=self.physicsClient)))
+
+        # Add friction
+        p.changeDynamics(ball_body_id, -1, rollingFriction=10.0, restitution=0.1, physicsClientId=self.physicsClient)
+
+        return ball_body_id
+
+    def create_golf_pitch(self, tile, position):
+        script_dir = os.path.dirname(__file__)
+        pitch_path = os.path.join(script_dir, "../meshes/golf_pitch.obj")
+
+        collision_shape_id = self.shape_cache.collision_shape(shapeType=p.GEOM_MESH, fileName=pitch_path)
+        visual_shape_id = self.shape_cache.visual_shape(shapeType=p.GEOM_MESH, fileName=pitch_path, rgbaColor=[0.1, 0.6, 0, 1], specularColor=[0, 0, 0])
+        position = tile.to_world(position)
+        return tile.body_pool.acquire('pitch', position, [0, 0, 0, 1], lambda: self.add_to_tile(tile,
+            p.createMultiBody(baseMass=0,
+                              baseCollisionShapeIndex=collision_shape_id,
+                              baseVisualShapeIndex=visual_shape_id,
+                              basePosition=position, physicsClientId=self.physicsClient)))
+
+    def get_stick_base_position(self, tile):
+        # The bottom transversal part (link 0), its position is the center of mass of the link
+        return p.getLinkState(tile.stick_id, 0, physicsClientId=self.physicsClient)[0]
+
+    def get_ball_position(self, tile):
+        position, _ = p.getBasePositionAndOrientation(tile.ball_id, physicsClientId=self.physicsClient)
+        return position
+
+    def get_hole_position(self, tile):
+        position, _ = p.getBasePositionAndOrientation(tile.pitch_id, physicsClientId=self.physicsClient)
+        return position
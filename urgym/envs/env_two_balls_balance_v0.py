@@ -2,7 +2,6 @@ import time
 import math
 import numpy as np
 from typing import NoReturn, Optional
-import random
 import os
 from copy import deepcopy
 
@@ -13,6 +12,13 @@ import pybullet as p
 import pybullet_data
 from urgym.base.utilities import rotate_quaternion, geometric_distance_reward, print_link_names_and_indices
 from urgym.base.robot import UR5Robotiq85
+from urgym.base import quaternions
+from urgym.base.settle import SettleDetector, configure_substeps
+from urgym.base.snapshot import SceneSnapshot, reset_body
+from urgym.base.pool import BodyPool
+from urgym.base.state_bank import StateBank
+from urgym.base.shapes import ShapeCache
+from urgym.base.observation import ObservationBuffer
 
 class TwoBallsBalance(Env):
     """
@@ -30,14 +36,20 @@ class TwoBallsBalance(Env):
     """
 
     SIMULATION_STEP_DELAY = 1 / 240.
+    OBSERVATION_LAYOUT = [('paddle_euler', 3), ('relative_ball1_position', 3), ('relative_ball2_position', 3)]
 
-    def __init__(self, camera=None, reward_type='dense',  render_mode='human') -> None:
+    def __init__(self, camera=None, reward_type='dense',  render_mode='human', sim_substeps: int = 1, reset_mode: str = 'full', state_bank: Optional[str] = None, obs_buffer: bool = False, ik_solver: str = 'pybullet') -> None:
         """
         Initialize the environment.
 
         Parameters:
         - reward_type (str): The type of reward to use. Options are 'dense' and 'sparse'. Default is 'dense'.
         - render_mode (str): The rendering mode. Options are 'human' and 'non-human'. Default is 'human'.
+        - sim_substeps (int): Number of 1/240 s substeps run inside PyBullet per p.stepSimulation() call. Default is 1.
+        - reset_mode (str): 'full' rebuilds and settles the scene on every reset, 'snapshot' restores an in-memory snapshot of the scene taken on the first reset and only randomizes the object poses, 'bank' teleports the scene into a random precomputed state of `state_bank`. Default is 'full'.
+        - state_bank (str): Path of the `.npy` state bank used by the 'bank' reset mode, see `urgym.generate_state_bank`. Default is None.
+        - obs_buffer (bool): Whether to write the observations in place into a reusable float32 buffer, which is returned on every step instead of a new float64 array, see `urgym.base.observation`. Default is False.
+        - ik_solver (str): The IK solver of the end-effector control, 'pybullet' (iterative) or 'analytic' (closed-form UR5 IK, deterministic). Default is 'pybullet'.
         """
 
         self.reward_type = reward_type
@@ -50,30 +62,47 @@ class TwoBallsBalance(Env):
         # Set observation and action spaces
         # Observations: the paddle roll, pitch, yaw and the two balls position relative the center of the paddle
         self.observation_space = Box(low=np.array([-math.pi]*3 + [-1.0]*6), high=np.array([math.pi]*3 + [1.0]*6), dtype=np.float64)
+        self.obs_buffer = obs_buffer
+        self.observation_buffer = ObservationBuffer(self.OBSERVATION_LAYOUT, np.float32 if obs_buffer else np.float64)
+        self.observation_space = self.observation_buffer.space(self.observation_space)
         # Actions: (dx, dy, dz) for end-effector euler displacement 
         self.action_space = Box(low=np.array([-0.1]*3), high=np.array([+0.1]*3), dtype=np.float32)
 
         # Define environment        
         self.physicsClient = p.connect(p.GUI if self.visualize else p.DIRECT)
-        p.setAdditionalSearchPath(pybullet_data.getDataPath())
-        p.setGravity(0, 0, -9.8)
+        self.shape_cache = ShapeCache.for_client(self.physicsClient)
+        self.sim_substeps = sim_substeps
+        if sim_substeps > 1:
+            configure_substeps(self.physicsClient, sim_substeps)
+        p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physicsClient)
+        p.setGravity(0, 0, -9.8, physicsClientId=self.physicsClient)
 
         # Reorient the debug camera
-        #p.resetDebugVisualizerCamera(cameraDistance=1.8, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.2,0])
-        p.resetDebugVisualizerCamera(cameraDistance=1.3, cameraYaw=27, cameraPitch=-33, cameraTargetPosition=[-0.2,-0.2,0.2])
+        #p.resetDebugVisualizerCamera(cameraDistance=1.8, cameraYaw=50, cameraPitch=-25, cameraTargetPosition=[-0.5,+0.2,0], physicsClientId=self.physicsClient)
+        p.resetDebugVisualizerCamera(cameraDistance=1.3, cameraYaw=27, cameraPitch=-33, cameraTargetPosition=[-0.2,-0.2,0.2], physicsClientId=self.physicsClient)
 
         # Hide right and left menus
-        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0)
+        p.configureDebugVisualizer(p.COV_ENABLE_GUI,0, physicsClientId=self.physicsClient)
 
         # Robot will be centered at the origin (0,0,0), the plane and the table will be below z=0
         table_dimensions = [1.0, 2.0, 0.5]
-        self.planeID = p.loadURDF("plane.urdf", [0, 0, -table_dimensions[2]])
+        self.planeID = p.loadURDF("plane.urdf", [0, 0, -table_dimensions[2]], physicsClientId=self.physicsClient)
         self.table_id = self.create_table_block(table_dimensions, [0, 0, -table_dimensions[2]/2], color=[0.5, 0.5, 0.5, 1])
 
-        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0))
+        self.robot = UR5Robotiq85((0, 0, 0), (0, 0, 0), self.physicsClient)
 
         self.robot.load()
         self.robot.step_simulation = self.step_simulation # type: ignore
+        self.robot.sim_substeps = sim_substeps
+        self.robot.ik_solver = ik_solver
+        self.settle_detector = SettleDetector(self.robot)
+        assert reset_mode in ('full', 'snapshot', 'bank')
+        assert reset_mode != 'bank' or state_bank is not None, "The 'bank' reset mode needs a state bank"
+        self.reset_mode = reset_mode
+        self.snapshot = SceneSnapshot(self.physicsClient, [self.robot])
+        self.body_pool = BodyPool(self.physicsClient)
+        self.state_bank = StateBank.load(state_bank) if state_bank is not None else None
+        self.scene_built = False
         self.control_method = 'end'
 
         self.paddle_id = None
@@ -84,24 +113,16 @@ class TwoBallsBalance(Env):
         """
         Hook p.stepSimulation()
         """
-        p.stepSimulation()
+        p.stepSimulation(physicsClientId=self.physicsClient)
         if self.visualize:
-            time.sleep(self.SIMULATION_STEP_DELAY)
+            time.sleep(self.SIMULATION_STEP_DELAY * self.sim_substeps)
 
     def wait_simulation_steps(self, sim_steps):
-        for _ in range(sim_steps):
+        for _ in range(math.ceil(sim_steps / self.sim_substeps)):
             self.step_simulation()
 
     def wait_until_stable(self, sim_steps=480):
-        pos = self.robot.get_joint_obs()['positions']
-        for _ in range(sim_steps):
-            self.step_simulation()
-            new_pos = self.robot.get_joint_obs()['positions']
-            if np.sum(np.abs(np.array(pos)-np.array(new_pos))) < 5e-3: # Threshold based on experience
-                return True
-            pos = new_pos
-        print("Warning: The robot configuration did not stabilize")
-        return False
+        return self.settle_detector.wait(sim_steps)
 
     def step(self, action):
         """
@@ -111,11 +132,10 @@ class TwoBallsBalance(Env):
         reward = 0
         
         # Differential version
-        ee_pose = list(self.robot.get_ee_pose())
-        euler = p.getEulerFromQuaternion(ee_pose[3:])
+        ee_pose = self.robot.get_ee_pose()
+        euler = quaternions.to_euler(ee_pose[3:])
         euler += action
-        quaternion = p.getQuaternionFromEuler(euler)
-        ee_pose[3:] = quaternion
+        ee_pose[3:] = quaternions.from_euler(euler)
         self.robot.move_ee(ee_pose, self.control_method)
 
         self.wait_until_stable()
@@ -137,23 +157,27 @@ class TwoBallsBalance(Env):
 
     
     def get_observation(self):
-        quaternion = np.array(self.get_paddle_pose()[3:])
-        euler = p.getEulerFromQuaternion(quaternion) # To roll, pitch, yaw
-        relative_ball1_position = np.array(self.get_paddle_pose()[:3]) - np.array(self.get_ball_position(self.ball1_id))
-        relative_ball2_position = np.array(self.get_paddle_pose()[:3]) - np.array(self.get_ball_position(self.ball2_id))
-        obs = np.append(euler, [relative_ball1_position, relative_ball2_position])
-        return obs
+        paddle_pose = self.get_paddle_pose()
+        self.observation_buffer['paddle_euler'] = p.getEulerFromQuaternion(paddle_pose[3:]) # To roll, pitch, yaw
+        np.subtract(paddle_pose[:3], self.get_ball_position(self.ball1_id), out=self.observation_buffer['relative_ball1_position'])
+        np.subtract(paddle_pose[:3], self.get_ball_position(self.ball2_id), out=self.observation_buffer['relative_ball2_position'])
+        return self.observation_buffer.array if self.obs_buffer else self.observation_buffer.array.copy()
 
     def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None):
         super().reset(seed=seed)
+        # Drawn before the first reset builds the scene, which also draws from np_random, so that a reset with a
+        # given seed restores the same state in a fresh worker and in one that has already reset
+        bank_state = self.state_bank.sample(self.np_random) if self.reset_mode == 'bank' else None
+        if self.reset_mode == 'snapshot' and self.snapshot.captured:
+            self.restore_snapshot()
+            return self.get_observation(), {}
+        if self.reset_mode == 'bank' and self.scene_built:
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
+            return self.get_observation(), {}
+
         self.robot.reset()
 
-        if self.paddle_id is not None:
-            p.removeBody(self.paddle_id)
-        if self.ball1_id is not None:
-            p.removeBody(self.ball1_id)
-        if self.ball2_id is not None:
-            p.removeBody(self.ball2_id)
+        self.body_pool.release()
 
         new_pose = [0.0, -0.60, 0.60, 0.50, -0.50, -0.50, 0.50]
 
@@ -169,58 +193,91 @@ class TwoBallsBalance(Env):
         self.ball1_id, self.ball2_id = self.create_balls()
 
         self.robot.close_gripper()
+        if self.reset_mode == 'snapshot':
+            # The scene right before the balls fall on the paddle
+            self.snapshot.capture()
         self.wait_until_stable()
 
+        self.scene_built = True
+        if self.reset_mode == 'bank':
+            # The scene is only built on the first reset, its state is then replaced by one of the bank
+            self.state_bank.restore(bank_state, self.robot, self.get_scene_bodies())
+
         return self.get_observation(), {}
 
     def close(self):
+        ShapeCache.release(self.physicsClient)
         p.disconnect(self.physicsClient)
 
     def create_balance_paddle(self, base_position):
         # Create a rectangular collision shape
-        collision_shape = p.createCollisionShape(shapeType=p.GEOM_BOX, halfExtents=[0.05, 0.1, 0.005])
+        collision_shape = self.shape_cache.collision_shape(shapeType=p.GEOM_BOX, halfExtents=[0.05, 0.1, 0.005])
         
         # Create a visual shape (optional, for better visualization)
-        visual_shape = p.createVisualShape(shapeType=p.GEOM_BOX, halfExtents=[0.05, 0.1, 0.005], rgbaColor=[1, 0.5, 0, 1])
+        visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_BOX, halfExtents=[0.05, 0.1, 0.005], rgbaColor=[1, 0.5, 0, 1])
         
         # Create the multi-body using the collision shape and visual shape
         base_mass = 0.1  # mass of the object
-        self.paddle_id = p.createMultiBody(base_mass, collision_shape, visual_shape, base_position, [0, 0, 0, 1])
+        self.paddle_id = self.body_pool.acquire('paddle', base_position, [0, 0, 0, 1],
+                                                lambda: p.createMultiBody(base_mass, collision_shape, visual_shape, base_position, [0, 0, 0, 1], physicsClientId=self.physicsClient))
 
-    def create_balls(self, radius=0.015):
+    def get_scene_bodies(self):
+        """
+        Returns the IDs of the bodies whose state is stored in the state banks, always in the same order
+        """
+        return [self.paddle_id, self.ball1_id, self.ball2_id]
+
+    def restore_snapshot(self):
+        """
+        Restores the scene right before the balls fall on the paddle, with new random ball positions
+        """
+        self.snapshot.restore()
+        ball1_position, ball2_position, paddle_orientation = self.get_balls_spawn_poses()
+        reset_body(self.ball1_id, ball1_position, paddle_orientation, self.physicsClient)
+        reset_body(self.ball2_id, ball2_position, paddle_orientation, self.physicsClient)
+        self.wait_until_stable()
+
+    def get_balls_spawn_poses(self, radius=0.015):
         # Get the position and orientation of the paddle
-        paddle_position, paddle_orientation = p.getBasePositionAndOrientation(self.paddle_id)
+        paddle_position, paddle_orientation = p.getBasePositionAndOrientation(self.paddle_id, physicsClientId=self.physicsClient)
         
         # Calculate the ball position (centered on top of the paddle)
         ball1_position = [paddle_position[0], paddle_position[1], paddle_position[2] + 0.2 + radius]
         ball2_position = [paddle_position[0], paddle_position[1], paddle_position[2] + 0.2 - radius]
         # Randomize the balls position a little bit
-        ball1_position[0] += random.uniform(-0.03, 0.03)
-        ball1_position[1] += random.uniform(-0.08, -0.045) # Front part of the paddle
+        ball1_position[0] += self.np_random.uniform(-0.03, 0.03)
+        ball1_position[1] += self.np_random.uniform(-0.08, -0.045) # Front part of the paddle
         # Randomize the balls position a little bit
-        ball2_position[0] += random.uniform(-0.03, 0.03)
-        ball2_position[1] += random.uniform(-0.015, 0.02) # Rear part of the paddle
+        ball2_position[0] += self.np_random.uniform(-0.03, 0.03)
+        ball2_position[1] += self.np_random.uniform(-0.015, 0.02) # Rear part of the paddle
+
+        return ball1_position, ball2_position, paddle_orientation
+
+    def create_balls(self, radius=0.015):
+        ball1_position, ball2_position, paddle_orientation = self.get_balls_spawn_poses(radius)
 
         # Create a spherical collision shape
-        collision_shape = p.createCollisionShape(shapeType=p.GEOM_SPHERE, radius=radius)
+        collision_shape = self.shape_cache.collision_shape(shapeType=p.GEOM_SPHERE, radius=radius)
         
         # Create a visual shape (optional, for better visualization)
-        ball1_visual_shape = p.createVisualShape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[1, 1, 1, 1])
-        ball2_visual_shape = p.createVisualShape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[0, 0, 0, 1.0])
+        ball1_visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[1, 1, 1, 1])
+        ball2_visual_shape = self.shape_cache.visual_shape(shapeType=p.GEOM_SPHERE, radius=radius, rgbaColor=[0, 0, 0, 1.0])
         
         # Create the multi-body using the collision shape and visual shape
-        ball1_body_id = p.createMultiBody(0.01, collision_shape, ball1_visual_shape, ball1_position, paddle_orientation)
-        ball2_body_id = p.createMultiBody(0.01, collision_shape, ball2_visual_shape, ball2_position, paddle_orientation)
+        ball1_body_id = self.body_pool.acquire('ball1', ball1_position, paddle_orientation,
+                                               lambda: p.createMultiBody(0.01, collision_shape, ball1_visual_shape, ball1_position, paddle_orientation, physicsClientId=self.physicsClient))
+        ball2_body_id = self.body_pool.acquire('ball2', ball2_position, paddle_orientation,
+                                               lambda: p.createMultiBody(0.01, collision_shape, ball2_visual_shape, ball2_position, paddle_orientation, physicsClientId=self.physicsClient))
         
         return ball1_body_id, ball2_body_id
 
     def get_paddle_pose(self):
-        position, orientation = p.getBasePositionAndOrientation(self.paddle_id)
+        position, orientation = p.getBasePositionAndOrientation(self.paddle_id, physicsClientId=self.physicsClient)
         pose = position + orientation
         return pose
     
     def get_ball_position(self, ball_id):
-        position, _ = p.getBasePositionAndOrientation(ball_id)
+        position, _ = p.getBasePositionAndOrientation(ball_id, physicsClientId=self.physicsClient)
         return position
 
     def create_table_block(self, size, position, color=[1, 0, 0, 1]):
@@ -235,24 +292,24 @@ class TwoBallsBalance(Env):
         Returns:
         - block_body_id: The ID of the created block.
         """
-        block_visual_shape_id = p.createVisualShape(shapeType=p.GEOM_BOX,
+        block_visual_shape_id = self.shape_cache.visual_shape(shapeType=p.GEOM_BOX,
                                                     rgbaColor=color,
                                                     halfExtents=[size[0]/2, size[1]/2, size[2]/2])
-        block_collision_shape_id = p.createCollisionShape(shapeType=p.GEOM_BOX,
+        block_collision_shape_id = self.shape_cache.collision_shape(shapeType=p.GEOM_BOX,
                                                         halfExtents=[size[0]/2, size[1]/2, size[2]/2])
         block_body_id = p.createMultiBody(baseMass=0,
                                         baseCollisionShapeIndex=block_collision_shape_id,
                                         baseVisualShapeIndex=block_visual_shape_id,
-                                        basePosition=position)  
+                                        basePosition=position, physicsClientId=self.physicsClient)  
         
         # Load the texture
         script_dir = os.path.dirname(__file__)
         texture_path = os.path.join(script_dir, "../meshes/textures/steel.jpg")
  
-        texture_id = p.loadTexture(texture_path)
+        texture_id = self.shape_cache.texture(texture_path)
 
         # Apply the texture to the block
-        p.changeVisualShape(block_body_id, -1, textureUniqueId=texture_id)
+        p.changeVisualShape(block_body_id, -1, textureUniqueId=texture_id, physicsClientId=self.physicsClient)
 
         return block_body_id
 
@@ -270,7 +327,7 @@ class TwoBallsBalance(Env):
 
         # Iterate through each link index in the gripper
         for link_index in gripper_link_indices:
-            aabb_min, aabb_max = p.getAABB(self.robot.id, link_index)
+            aabb_min, aabb_max = p.getAABB(self.robot.id, link_index, physicsClientId=self.physicsClient)
             
             # Update the overall AABB
             for i in range(3):
@@ -0,0 +1,171 @@
+"""
+Evaluates the reference SAC policies of `policies_final` on vectorized URGym environments.
+
+Each checkpoint is run deterministically over `SharedMemoryVectorEnv` workers reset with fixed seeds, and the
+success rate, the returns, the throughput (environment steps per second, policy inference included) and the
+settle substeps per step are written as JSON, to check the performance changes of the simulation against the
+reference policies:
+
+    python -m urgym.evaluate policies_final --episodes 50 --num-envs 8 --output evaluation.json
+
+Loading the checkpoints requires stable-baselines3, or only torch with `--backend numpy`, which runs the actors
+with `urgym.numpy_actor`.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from urgym.numpy_actor import NumpyActor
+from urgym.vector import SharedMemoryVectorEnv
+
+
+# The environment of each checkpoint directory of policies_final
+CHECKPOINT_ENVS = {
+    'cubes_push_v0': 'URGym/CubesPush-v0',
+    'golf_v0': 'URGym/Golf-v0',
+    'golf_joints_v0': 'URGym/GolfJoints-v0',
+}
+CHECKPOINT_FILE = 'SAC_policy.zip'
+
+
+def load_sb3_policy(path, device='cpu'):
+    """
+    Loads a stable-baselines3 SAC checkpoint.
+
+    Returns:
+    A function mapping a batch of observations to the batch of deterministic actions
+    """
+    try:
+        from stable_baselines3 import SAC
+    except ImportError as e:
+        raise ImportError("Loading the SAC checkpoints requires stable-baselines3: pip install stable-baselines3") from e
+    model = SAC.load(path, device=device)
+    return lambda observations: model.predict(observations, deterministic=True)[0]
+
+
+def load_numpy_policy(path):
+    """
+    Loads the actor of a SAC checkpoint, or an actor exported by `urgym.numpy_actor`, as a `NumpyActor`.
+    """
+    return NumpyActor.from_checkpoint(path) if path.endswith('.zip') else NumpyActor(path)
+
+
+POLICY_LOADERS = {'sb3': load_sb3_policy, 'numpy': load_numpy_policy}
+
+
+def evaluate_policy(policy, env_id, num_episodes=50, num_envs=4, seed=0, env_kwargs=None):
+    """
+    Runs a policy on `num_envs` vectorized environments until `num_episodes` episodes are completed.
+
+    The environments are reset with the seeds seed, seed + 1, ..., and each one runs a fixed share of the
+    episodes, the later ones following from the random state of its first reset, so the results only depend
+    on the seed and the number of environments. The environments that completed their share keep stepping
+    with the others, their steps are included in the throughput but not in the results.
+
+    Parameters:
+    - policy: Function mapping a batch of observations to a batch of actions
+    - env_id: The id of the environment
+    - num_episodes: The number of episodes to evaluate
+    - num_envs: The number of environments (worker processes)
+    - seed: The seed of the reset of the first environment
+    - env_kwargs: Additional keyword arguments for `gym.make`
+
+    Returns:
+    A dict with the results
+    """
+    quotas = np.array([len(chunk) for chunk in np.array_split(np.arange(num_episodes), num_envs)])
+    completed = np.zeros(num_envs, dtype=np.int64)
+    episode_returns = np.zeros(num_envs)
+    episode_lengths = np.zeros(num_envs, dtype=np.int64)
+    returns, lengths, successes = [], [], []
+    steps = 0
+    inference_seconds = 0.0
+
+    envs = SharedMemoryVectorEnv(env_id, num_envs, **(env_kwargs or {}))
+    try:
+        observations, _ = envs.reset(seed=seed)
+        substeps = sum(envs.call('settle_detector.total_substeps'))
+        start = time.perf_counter()
+        while (completed < quotas).any():
+            inference_start = time.perf_counter()
+            actions = policy(observations)
+            inference_seconds += time.perf_counter() - inference_start
+            observations, rewards, terminateds, truncateds, infos = envs.step(actions)
+            steps += num_envs
+            episode_returns += rewards
+            episode_lengths += 1
+            for index in np.flatnonzero(terminateds | truncateds):
+                if completed[index] < quotas[index]:
+                    returns.append(float(episode_returns[index]))
+                    lengths.append(int(episode_lengths[index]))
+                    successes.append(bool(infos['final_info'][index].get('is_success', False)))
+                    completed[index] += 1
+                episode_returns[index] = 0.0
+                episode_lengths[index] = 0
+        seconds = time.perf_counter() - start
+        # Including the substeps of the automatic resets
+        substeps = sum(envs.call('settle_detector.total_substeps')) - substeps
+    finally:
+        envs.close()
+
+    return {
+        'env_id': env_id,
+        'episodes': num_episodes,
+        'num_envs': num_envs,
+        'seed': seed,
+        'success_rate': float(np.mean(successes)),
+        'mean_return': float(np.mean(returns)),
+        'std_return': float(np.std(returns)),
+        'mean_length': float(np.mean(lengths)),
+        'steps': steps,
+        'seconds': seconds,
+        'steps_per_second': steps / seconds,
+        'inference_seconds': inference_seconds,
+        'substeps_per_step': substeps / steps,
+    }
+
+
+def evaluate_checkpoints(policies_dir, names=None, num_episodes=50, num_envs=4, seed=0, env_kwargs=None, load_policy=load_sb3_policy):
+    """
+    Evaluates the checkpoints `policies_dir/<name>/SAC_policy.zip` of the given names (all the ones of
+    CHECKPOINT_ENVS if None) with `evaluate_policy`.
+
+    Returns:
+    A dict with the results of each name
+    """
+    results = {}
+    for name in (names if names is not None else CHECKPOINT_ENVS):
+        assert name in CHECKPOINT_ENVS, f"Unknown checkpoint {name}, available: {', '.join(CHECKPOINT_ENVS)}"
+        path = os.path.join(policies_dir, name, CHECKPOINT_FILE)
+        results[name] = evaluate_policy(load_policy(path), CHECKPOINT_ENVS[name], num_episodes, num_envs, seed, env_kwargs)
+        results[name]['checkpoint'] = path
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the reference SAC policies on vectorized URGym environments")
+    parser.add_argument('policies_dir', nargs='?', default='policies_final', help="Directory with one subdirectory per checkpoint")
+    parser.add_argument('--policies', nargs='+', choices=list(CHECKPOINT_ENVS), help="Checkpoints to evaluate, all of them by default")
+    parser.add_argument('--episodes', type=int, default=50, help="Number of episodes per checkpoint")
+    parser.add_argument('--num-envs', type=int, default=4, help="Number of vectorized environments (worker processes)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first environment, the following ones use consecutive seeds")
+    parser.add_argument('--sim-substeps', type=int, default=1, help="Physics substeps per p.stepSimulation() call of the environments")
+    parser.add_argument('--backend', choices=list(POLICY_LOADERS), default='sb3', help="Run the policies with stable-baselines3 or with the NumPy actors")
+    parser.add_argument('--output', help="Path of the JSON file to write, the results are printed if not given")
+    args = parser.parse_args()
+
+    results = evaluate_checkpoints(args.policies_dir, args.policies, args.episodes, args.num_envs, args.seed,
+                                   dict(sim_substeps=args.sim_substeps), POLICY_LOADERS[args.backend])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    for name, result in results.items():
+        print(f"{name}: success rate {result['success_rate']:.1%}, return {result['mean_return']:.2f} +- {result['std_return']:.2f}, "
+              f"{result['steps_per_second']:.1f} steps/s, {result['substeps_per_step']:.1f} substeps/step")
+
+
+if __name__ == '__main__':
+    main()
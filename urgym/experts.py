@@ -0,0 +1,270 @@
+"""
+Scripted expert policies of the URGym environments, to generate demonstrations (see `urgym.generate_demos`).
+
+The experts are analytic controllers that read the scene with the pose getters of the environment instead of
+its observations, so the same expert drives the flat and the goal-conditioned variants of an environment:
+
+    env = gym.make('URGym/CubesPush-v0', render_mode=None)
+    expert = make_expert(env)
+    observation, info = env.reset()
+    expert.reset()
+    while True:
+        observation, reward, terminated, truncated, info = env.step(expert(observation))
+        ...
+"""
+import math
+
+import numpy as np
+
+from urgym.base import quaternions
+from urgym.base.utilities import rotate_quaternion
+
+
+class ScriptedPolicy(object):
+    """
+    Base class of the scripted experts, called with the observation of each step and returning the next action.
+    """
+
+    def __init__(self, env):
+        """
+        Arguments:
+            env: The environment to control, possibly wrapped
+        """
+        self.env = env.unwrapped
+
+    def reset(self):
+        """
+        Clears the state kept between the steps of an episode, to be called after each reset of the environment.
+        """
+
+    def __call__(self, observation=None):
+        raise NotImplementedError
+
+
+class CubesPushExpert(ScriptedPolicy):
+    """
+    Pushes the second cube towards the first one with the fingertips: the end effector goes above a point behind
+    the cube on the line between the cubes, moves down next to the table and pushes along that line. It goes up
+    again whenever the cube leaves that line.
+    """
+
+    FINGERTIP_HEIGHT = 0.163 # Height of the end effector above the fingertips
+    STANDOFF = 0.065 # Distance from the cube to the point behind it, wider than the fingers
+    CONTACT = 0.04 # Distance from the cube to the end effector when pushing
+    CLEARANCE = 0.04 # Height above the cube to move around it
+
+    def __call__(self, observation=None):
+        env = self.env
+        ee = np.array(env.robot.get_ee_pose()[:3])
+        cube1 = np.array(env.get_cube_pose(env.cubes[0])[:3])
+        cube2 = np.array(env.get_cube_pose(env.cubes[1])[:3])
+        direction = cube1[:2] - cube2[:2]
+        distance = np.linalg.norm(direction)
+        direction /= max(distance, 1e-9)
+
+        behind = cube2[:2] - direction * self.STANDOFF
+        low = cube2[2] + self.FINGERTIP_HEIGHT - 0.01
+        high = cube2[2] + self.FINGERTIP_HEIGHT + self.CLEARANCE
+        error = behind - ee[:2]
+        along = np.dot(error, direction)
+        lateral = np.linalg.norm(error - direction * along)
+        if lateral < 0.02 and along < 0.015 and ee[2] < low + 0.015:
+            # Behind the cube and low enough: push, at most 5 cm further than the contact
+            xy = cube2[:2] - direction * (self.CONTACT - 0.005) + direction * np.clip(distance - 0.04, 0.0, 0.05)
+            target = [xy[0], xy[1], low]
+        elif np.linalg.norm(error) < 0.01:
+            target = [behind[0], behind[1], low]
+        elif ee[2] < high - 0.01 and np.linalg.norm(error) > 0.02:
+            target = [ee[0], ee[1], high + 0.01]
+        else:
+            target = [behind[0], behind[1], high]
+        return np.clip(np.array(target) - ee, -0.1, 0.1).astype(np.float32)
+
+
+class CubesGraspExpert(ScriptedPolicy):
+    """
+    Grasps the target cube from above, with the gripper aligned with the faces of the cube, and lifts it. The
+    joint positions of each pose come from the analytic IK of the robot, or from PyBullet when it has no solution.
+    """
+
+    GRASP_HEIGHT = 0.15 # Height of the end effector above the cube to grasp it
+    APPROACH_HEIGHT = 0.1 # Height above the grasp pose to move the open gripper over the cube
+    LIFT_HEIGHT = 0.45 # Height of the end effector once the cube is grasped
+    VERTICAL = np.array(rotate_quaternion([0, 0, 0, 1], math.pi / 2, [0, 1, 0])) # Gripper pointing downwards
+
+    def __call__(self, observation=None):
+        env = self.env
+        cube = np.array(env.get_cube_pose(env.target_id))
+        ee = np.array(env.robot.get_ee_pose()[:3])
+        # The cube is symmetric, the closest of the 4 yaws of its faces is used
+        yaw = (quaternions.to_euler(cube[3:])[2] + math.pi / 4) % (math.pi / 2) - math.pi / 4
+        orientation = quaternions.multiply(quaternions.from_axis_angle([0, 0, 1], yaw), self.VERTICAL)
+
+        if env.subgoals_achieved['grasped']:
+            target, gripper = [ee[0], ee[1], self.LIFT_HEIGHT], 1.0
+        elif env.subgoals_achieved['approached']:
+            target, gripper = [cube[0], cube[1], cube[2] + self.GRASP_HEIGHT], 1.0
+        elif np.linalg.norm(ee[:2] - cube[:2]) > 0.01 or env.get_gripper_opening_length() < 0.5:
+            target, gripper = [cube[0], cube[1], cube[2] + self.GRASP_HEIGHT + self.APPROACH_HEIGHT], 0.0
+        else:
+            target, gripper = [cube[0], cube[1], cube[2] + self.GRASP_HEIGHT], 0.0
+
+        pose = np.concatenate([target, orientation])
+        joints = env.robot.calculate_analytic_ik(pose)
+        if joints is None:
+            joints = env.robot.calculate_ik(pose)
+        return np.append(np.asarray(joints[:6]), gripper).astype(np.float32)
+
+
+class GolfExpert(ScriptedPolicy):
+    """
+    Pushes the ball towards the hole with the bar of the stick, like `CubesPushExpert`: the stick goes behind the
+    ball on the line between the ball and the hole, around the ball if needed, moves down next to the pitch and
+    pushes along that line. The stick is never lifted again, the arm barely follows upward displacements while
+    it holds the stick.
+
+    The arm settles short of the commanded displacements, so the expert estimates that drift from the previous
+    steps and adds it to its commands.
+    """
+
+    PITCH_HEIGHT = 0.047 # Height of the surface of the pitch
+    BALL_RADIUS = 0.015
+    BAR_HALF_EXTENTS = (0.05, 0.015) # Half extents (x, y) of the bar at the bottom of the stick
+    PUSH_HEIGHT = 0.035 # Height of the stick base above the pitch when pushing
+    STANDOFF = 0.03 # Distance from the contact point to the point behind the ball
+    PUSH_DISTANCE = 0.03 # Maximum distance of each push
+    DESCENT = 0.02 # Maximum descent of each step
+    CLEARANCE = 0.09 # Distance from the ball to move around it
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.reset()
+
+    def reset(self):
+        self.last = None # The end effector position and the action of the previous step
+        self.drift = np.zeros(3)
+
+    def __call__(self, observation=None):
+        env = self.env
+        base = np.array(env.get_stick_base_position())
+        ball = np.array(env.get_ball_position())
+        hole = np.array(env.get_hole_position())
+        direction = hole[:2] - ball[:2]
+        distance = np.linalg.norm(direction)
+        direction /= max(distance, 1e-9)
+
+        # Distance from the center of the bar to the center of the ball when they touch along `direction`
+        contact = self.BALL_RADIUS + self.BAR_HALF_EXTENTS[0] * abs(direction[0]) + self.BAR_HALF_EXTENTS[1] * abs(direction[1])
+        behind = ball[:2] - direction * (contact + self.STANDOFF)
+        low = self.PITCH_HEIGHT + self.PUSH_HEIGHT
+        error = behind - base[:2]
+        along = np.dot(error, direction)
+        lateral = np.linalg.norm(error - direction * along)
+        relative = base[:2] - ball[:2]
+        if lateral < 0.015 and along < 0.015 and base[2] < low + 0.015:
+            xy = ball[:2] - direction * (contact - 0.005) + direction * min(distance, self.PUSH_DISTANCE)
+            target = [xy[0], xy[1], low]
+        elif np.linalg.norm(error) < 0.015:
+            target = [behind[0], behind[1], max(low, base[2] - self.DESCENT)]
+        elif np.dot(relative, direction) > -0.01 and np.linalg.norm(relative) < 1.5 * self.CLEARANCE:
+            # Beside or in front of the ball: go around it, on its side where the stick already is
+            side = np.array([-direction[1], direction[0]])
+            side = side if np.dot(relative, side) >= 0 else -side
+            waypoint = ball[:2] + side * self.CLEARANCE - direction * self.STANDOFF
+            target = [waypoint[0], waypoint[1], base[2]]
+        else:
+            target = [behind[0], behind[1], base[2]]
+        return self.command(np.array(target) - base)
+
+    def command(self, displacement):
+        """
+        Returns the action that moves the stick by `displacement`.
+        """
+        return self.compensate(displacement).astype(np.float32)
+
+    def compensate(self, displacement):
+        """
+        Returns the displacement of the end effector to command for the stick to move by `displacement`.
+        """
+        ee = np.array(self.env.robot.get_ee_pose()[:3])
+        if self.last is not None:
+            self.drift = 0.5 * self.drift + 0.5 * (ee - self.last[0] - self.last[1])
+        commanded = np.clip(displacement - self.drift, -0.1, 0.1)
+        self.last = (ee, commanded)
+        return commanded
+
+
+class GolfJointsExpert(GolfExpert):
+    """
+    `GolfExpert` for the joint displacement actions of GolfJoints: the displaced pose of the end effector is
+    converted to joint positions with the IK of the robot.
+    """
+
+    def command(self, displacement):
+        robot = self.env.robot
+        pose = np.array(robot.get_ee_pose(), dtype=np.float64)
+        pose[:3] += self.compensate(displacement)
+        pose[3:] = self.env.vertical_quaternion
+        joints = np.asarray(robot.calculate_ik(pose)[:6])
+        return np.clip(joints - np.array(robot.get_joint_states()), -0.1, 0.1).astype(np.float32)
+
+
+class BallBalanceExpert(ScriptedPolicy):
+    """
+    Proportional-derivative controller of the tilt of the paddle: the paddle normal is tilted towards the
+    opposite of the position and velocity of the ball relative to the paddle center, so that the ball rolls back
+    to the center. The velocity is the displacement of the ball since the previous step.
+    """
+
+    POSITION_GAIN = 2.0
+    VELOCITY_GAIN = 4.0
+    MAX_TILT = 0.15 # Maximum horizontal component of the paddle normal
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.reset()
+
+    def reset(self):
+        self.last_offset = None
+
+    def __call__(self, observation=None):
+        env = self.env
+        paddle = np.array(env.get_paddle_pose())
+        offset = np.array(env.get_ball_position()) - paddle[:3]
+        velocity = np.zeros(3) if self.last_offset is None else offset - self.last_offset
+        self.last_offset = offset
+
+        tilt = -self.POSITION_GAIN * offset[:2] - self.VELOCITY_GAIN * velocity[:2]
+        tilt *= min(1.0, self.MAX_TILT / max(np.linalg.norm(tilt), 1e-9))
+        normal = quaternions.rotate(paddle[3:], [0.0, 0.0, 1.0])
+        target = np.array([tilt[0], tilt[1], 1.0])
+        target /= np.linalg.norm(target)
+        # The smallest rotation from the current normal to the target one, applied to the end effector holding the paddle
+        rotation = quaternions.from_axis_angle(np.cross(normal, target), np.arccos(np.clip(np.dot(normal, target), -1.0, 1.0)))
+        orientation = np.array(env.robot.get_ee_pose()[3:])
+        action = quaternions.to_euler(quaternions.multiply(rotation, orientation)) - quaternions.to_euler(orientation)
+        action = (action + math.pi) % (2 * math.pi) - math.pi
+        return np.clip(action, -0.1, 0.1).astype(np.float32)
+
+
+EXPERTS = {
+    'URGym/CubesPush-v0': CubesPushExpert,
+    'URGym/CubesPushDiff-v0': CubesPushExpert,
+    'URGym/CubesPushGoal-v0': CubesPushExpert,
+    'URGym/CubesPushDiffGoal-v0': CubesPushExpert,
+    'URGym/CubesGrasp-v0': CubesGraspExpert,
+    'URGym/Golf-v0': GolfExpert,
+    'URGym/GolfGoal-v0': GolfExpert,
+    'URGym/GolfJoints-v0': GolfJointsExpert,
+    'URGym/GolfJointsGoal-v0': GolfJointsExpert,
+    'URGym/BallBalance-v0': BallBalanceExpert,
+}
+
+
+def make_expert(env, env_id=None):
+    """
+    Returns the scripted expert of an environment, found by its id (the id of its spec if None).
+    """
+    env_id = env_id if env_id is not None else env.spec.id
+    assert env_id in EXPERTS, f"No scripted expert for {env_id}, available: {', '.join(EXPERTS)}"
+    return EXPERTS[env_id](env)
@@ -0,0 +1,92 @@
+"""
+Generates demonstrations of an URGym environment with its scripted expert (see `urgym.experts`).
+
+The episodes are split among worker processes, each with its own environment, and each worker streams its
+episodes to its own recording `output/worker_XXX` (see `urgym.recording`), readable with
+`urgym.dataset.TrajectoryDataset`:
+
+    python -m urgym.generate_demos URGym/CubesPush-v0 cubes_push_demos --episodes 10000 --workers 8
+
+    dataset = TrajectoryDataset('cubes_push_demos/worker_000')
+"""
+import argparse
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import gymnasium as gym
+
+import urgym.envs  # Registers the URGym ids, also in spawned workers
+from urgym.experts import make_expert
+from urgym.recording import EpisodeRecorder
+
+
+def generate_demos(env_id, path, seeds, env_kwargs=None, chunk_size=65536, compress=True):
+    """
+    Records one episode of the scripted expert per seed.
+
+    Parameters:
+    - env_id: The id of the environment
+    - path: The directory of the recording
+    - seeds: The seeds of the resets
+    - env_kwargs: Additional keyword arguments for `gym.make`
+    - chunk_size, compress: The options of the `EpisodeRecorder`
+
+    Returns:
+    A tuple (number of steps, number of successful episodes, sum of the returns)
+    """
+    env = EpisodeRecorder(gym.make(env_id, render_mode=None, **(env_kwargs or {})), path, chunk_size, compress)
+    expert = make_expert(env, env_id)
+    steps, successes, returns = 0, 0, 0.0
+    for seed in seeds:
+        observation, info = env.reset(seed=seed)
+        expert.reset()
+        terminated = truncated = False
+        while not (terminated or truncated):
+            observation, reward, terminated, truncated, info = env.step(expert(observation))
+            steps += 1
+            returns += float(reward)
+        successes += bool(info.get('is_success', False))
+    env.close()
+    return steps, successes, returns
+
+
+def generate_demos_parallel(env_id, output, num_episodes, workers=1, seed=0, env_kwargs=None, chunk_size=65536, compress=True):
+    """
+    Records `num_episodes` episodes of the scripted expert, splitting them among `workers` processes which
+    write the recordings `output/worker_XXX`.
+    """
+    seeds = np.arange(seed, seed + num_episodes)
+    jobs = [(env_id, os.path.join(output, f"worker_{i:03d}"), chunk.tolist(), env_kwargs, chunk_size, compress)
+            for i, chunk in enumerate(np.array_split(seeds, workers)) if len(chunk)]
+    if workers > 1:
+        with mp.Pool(workers) as pool:
+            results = pool.starmap(generate_demos, jobs)
+    else:
+        results = [generate_demos(*job) for job in jobs]
+    return tuple(sum(values) for values in zip(*results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate demonstrations of an URGym environment with its scripted expert")
+    parser.add_argument('env_id', help="Environment id, e.g. URGym/CubesPush-v0")
+    parser.add_argument('output', help="Directory of the recordings, one per worker")
+    parser.add_argument('--episodes', type=int, default=100, help="Number of episodes to record")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first reset, the following ones use consecutive seeds")
+    parser.add_argument('--sim-substeps', type=int, default=1, help="Physics substeps per p.stepSimulation() call of the environment")
+    parser.add_argument('--chunk-size', type=int, default=65536, help="Number of transitions per chunk of the recordings")
+    parser.add_argument('--no-compress', action='store_true', help="Write uncompressed chunks, which can be memory-mapped when read")
+    args = parser.parse_args()
+
+    start = time.time()
+    steps, successes, returns = generate_demos_parallel(args.env_id, args.output, args.episodes, args.workers, args.seed,
+                                                        dict(sim_substeps=args.sim_substeps), args.chunk_size, not args.no_compress)
+    elapsed = time.time() - start
+    print(f"Recorded {args.episodes} episodes ({steps} steps) of {args.env_id} in {elapsed:.1f} s ({steps / elapsed:.1f} steps/s) to {args.output}")
+    print(f"Success rate: {successes / args.episodes:.1%}, mean return: {returns / args.episodes:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Generates a bank of settled initial states for an URGym environment.
+
+Each state is obtained with a full reset of the environment, so it is exactly what a full reset would have
+produced, and the bank can then be used with `reset_mode='bank'`:
+
+    python -m urgym.generate_state_bank URGym/CubesPush-v0 cubes_push_bank.npy --num-states 5000 --workers 8
+
+    env = gym.make('URGym/CubesPush-v0', reset_mode='bank', state_bank='cubes_push_bank.npy')
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+import numpy as np
+import gymnasium as gym
+
+import urgym.envs  # Registers the URGym ids, also in spawned workers
+from urgym.base.state_bank import StateBank, read_scene_state
+
+
+def generate_states(env_id, seeds, env_kwargs=None):
+    """
+    Generates one settled initial state per seed.
+
+    Parameters:
+    - env_id: The id of the environment
+    - seeds: The seeds of the resets
+    - env_kwargs: Additional keyword arguments for `gym.make`
+
+    Returns:
+    A structured array with one state per seed
+    """
+    env = gym.make(env_id, render_mode=None, reset_mode='full', **(env_kwargs or {}))
+    states = []
+    for seed in seeds:
+        env.reset(seed=seed)
+        states.append(read_scene_state(env.unwrapped.robot, env.unwrapped.get_scene_bodies()))
+    env.close()
+    return np.stack(states)
+
+
+def generate_state_bank(env_id, num_states, workers=1, seed=0, env_kwargs=None):
+    """
+    Generates a bank of `num_states` initial states, splitting the resets among `workers` processes.
+    """
+    seeds = np.arange(seed, seed + num_states)
+    chunks = [(env_id, chunk.tolist(), env_kwargs) for chunk in np.array_split(seeds, workers) if len(chunk)]
+    if workers > 1:
+        with mp.Pool(workers) as pool:
+            results = pool.starmap(generate_states, chunks)
+    else:
+        results = [generate_states(*chunk) for chunk in chunks]
+    return StateBank(np.concatenate(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a bank of settled initial states for an URGym environment")
+    parser.add_argument('env_id', help="Environment id, e.g. URGym/CubesPush-v0")
+    parser.add_argument('output', help="Path of the .npy file to create")
+    parser.add_argument('--num-states', type=int, default=1000, help="Number of states to generate")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first reset, the following ones use consecutive seeds")
+    parser.add_argument('--sim-substeps', type=int, default=1, help="Physics substeps per p.stepSimulation() call of the environment")
+    args = parser.parse_args()
+
+    start = time.time()
+    bank = generate_state_bank(args.env_id, args.num_states, args.workers, args.seed, dict(sim_substeps=args.sim_substeps))
+    bank.save(args.output)
+    print(f"Generated {len(bank)} states of {args.env_id} in {time.time() - start:.1f} s, saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
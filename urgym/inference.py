@@ -0,0 +1,324 @@
+"""
+Local batched policy inference for many rollout worker processes.
+
+Instead of every worker running its own copy of the policy on batches of one observation, the workers send
+their observations to an `InferenceServer`, which runs the policy once on all the observations received within
+`max_wait` seconds (at most `max_batch` of them) and sends the actions back. The observations and actions are
+exchanged through preallocated shared-memory buffers with one row per client, like in
+`urgym.vector.SharedMemoryVectorEnv`, and a request is only a flag set in shared memory and the release of a
+semaphore, so nothing is pickled or sent through pipes:
+
+    server = InferenceServer(NumpyActor('cubes_push_actor.npz'), env.observation_space, env.action_space, num_clients=64)
+    server.start()
+    # Worker process i, e.g. started with mp.Process(target=rollouts, args=(server.client(i),))
+    action = client(observation)
+    ...
+    server.close()
+
+`run_episodes_parallel` runs episodes of an environment in worker processes with the policy of a server, e.g. the
+actor of a checkpoint of `policies_final`:
+
+    python -m urgym.inference policies_final/cubes_push_v0/SAC_policy.zip URGym/CubesPush-v0 --episodes 100 --workers 8
+"""
+import argparse
+import multiprocessing as mp
+import queue
+import threading
+import time
+import traceback
+from typing import Optional
+
+import numpy as np
+import gymnasium as gym
+from gymnasium.spaces import Box
+
+import urgym.envs  # Registers the URGym ids, also in spawned workers
+from urgym.vector import create_shared_buffer, shared_buffer_to_array
+
+
+# Values of the shared status of a server
+RUNNING, CLOSING, FAILED = 0, 1, 2
+
+
+class InferenceClient(object):
+    """
+    Handle of a rollout worker to request actions from an `InferenceServer`, callable like a policy on a single
+    observation. It is passed to the worker process when the process is created.
+    """
+
+    def __init__(self, index, buffers, observation_space, action_space, num_clients, requests, ready, status):
+        self.index = index
+        self.buffers = buffers
+        self.observation_space = observation_space
+        self.action_space = action_space
+        self.num_clients = num_clients
+        self.requests = requests
+        self.ready = ready
+        self.status = status
+        self.arrays = None
+
+    def __getstate__(self):
+        # The NumPy views are created again over the shared buffers in the worker process
+        state = self.__dict__.copy()
+        state['arrays'] = None
+        return state
+
+    def __call__(self, observation):
+        """
+        Returns the action of the policy of the server for `observation`, waiting for the batch that includes it.
+        """
+        if self.arrays is None:
+            self.arrays = (shared_buffer_to_array(self.buffers['observations'], self.observation_space, self.num_clients),
+                           shared_buffer_to_array(self.buffers['actions'], self.action_space, self.num_clients),
+                           np.frombuffer(self.buffers['pending'], dtype=np.int8))
+        observations, actions, pending = self.arrays
+        if self.status.value == FAILED:
+            raise RuntimeError("The inference server failed, see the error raised by its close()")
+        observations[self.index] = observation
+        pending[self.index] = 1
+        self.requests.release()
+        self.ready.acquire()
+        if self.status.value == FAILED:
+            raise RuntimeError("The inference server failed, see the error raised by its close()")
+        return actions[self.index].copy()
+
+
+class InferenceServer(object):
+    """
+    Runs a policy on the batches of observations of the `InferenceClient`s of up to `num_clients` worker
+    processes, in a thread of the process that creates it.
+
+    A batch starts with the first pending request and is run as soon as it holds `max_batch` observations or
+    `max_wait` seconds after it started, so a larger `max_wait` gives larger batches at the cost of latency.
+    """
+
+    def __init__(self, policy, observation_space, action_space, num_clients: int, max_batch: Optional[int] = None, max_wait: float = 0.001, context: Optional[str] = None) -> None:
+        """
+        Parameters:
+        - policy: Function mapping a batch of observations of shape (N, *observation_space.shape) to a batch of actions, e.g. a `NumpyActor`
+        - observation_space, action_space: The Box spaces of the environment
+        - num_clients (int): The number of clients, i.e. of worker processes.
+        - max_batch (int): The maximum number of observations of each call to the policy. Default is `num_clients`.
+        - max_wait (float): The maximum time in seconds between the first request of a batch and the call to the policy. Default is 1 ms.
+        - context (str): The multiprocessing start method of the worker processes. Default is the platform default.
+        """
+        assert isinstance(observation_space, Box) and isinstance(action_space, Box), "Only Box spaces are supported"
+        self.policy = policy
+        self.observation_space = observation_space
+        self.action_space = action_space
+        self.num_clients = num_clients
+        self.max_batch = max_batch if max_batch is not None else num_clients
+        self.max_wait = max_wait
+        assert self.max_batch >= 1
+
+        ctx = mp.get_context(context)
+        self.buffers = dict(observations=create_shared_buffer(observation_space, num_clients, ctx),
+                            actions=create_shared_buffer(action_space, num_clients, ctx),
+                            pending=ctx.RawArray('b', num_clients))
+        self.observations = shared_buffer_to_array(self.buffers['observations'], observation_space, num_clients)
+        self.actions = shared_buffer_to_array(self.buffers['actions'], action_space, num_clients)
+        # Flags of the clients waiting for an action, each one followed by a release of `requests`
+        self.pending = np.frombuffer(self.buffers['pending'], dtype=np.int8)
+        self.requests = ctx.Semaphore(0)
+        self.ready = [ctx.Semaphore(0) for _ in range(num_clients)]
+        self.status = ctx.RawValue('b', RUNNING)
+
+        self.thread = None
+        self.error = None
+        self.num_batches = 0
+        self.num_requests = 0
+        self.policy_seconds = 0.0
+
+    def client(self, index):
+        """
+        Returns the client of the worker `index`, in [0, num_clients).
+        """
+        assert 0 <= index < self.num_clients
+        return InferenceClient(index, self.buffers, self.observation_space, self.action_space, self.num_clients,
+                               self.requests, self.ready[index], self.status)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, name="URGymInferenceServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def collect_batch(self):
+        """
+        Returns the indices of the clients of the next batch, or None when the server is closed.
+        """
+        if self.status.value == CLOSING and not self.pending.any():
+            return None
+        self.requests.acquire()
+        received = 1
+        deadline = time.perf_counter() + self.max_wait
+        while received < self.max_batch and self.status.value != CLOSING:
+            timeout = deadline - time.perf_counter()
+            if not self.requests.acquire(timeout=max(timeout, 0.0)):
+                break
+            received += 1
+        batch = np.flatnonzero(self.pending)[:self.max_batch]
+        if self.status.value != CLOSING:
+            # Flags may be set by clients whose releases were not acquired yet, they are served in this batch
+            # and their releases, which immediately follow the flags, are acquired now
+            for _ in range(len(batch) - received):
+                self.requests.acquire()
+        self.pending[batch] = 0
+        return batch
+
+    def serve(self):
+        while True:
+            batch = self.collect_batch()
+            if batch is None:
+                return
+            if not len(batch):
+                # The release of `close`, with no pending request left
+                continue
+            start = time.perf_counter()
+            try:
+                self.actions[batch] = self.policy(self.observations[batch])
+            except Exception as e:
+                self.error = e
+                self.status.value = FAILED
+            self.policy_seconds += time.perf_counter() - start
+            self.num_batches += 1
+            self.num_requests += len(batch)
+            for index in batch:
+                self.ready[index].release()
+            if self.error is not None:
+                return
+
+    def stats(self):
+        """
+        Returns a dict with the number of batches and requests served, the mean batch size and the time spent in the policy.
+        """
+        return {'batches': self.num_batches, 'requests': self.num_requests,
+                'mean_batch_size': self.num_requests / max(self.num_batches, 1), 'policy_seconds': self.policy_seconds}
+
+    def close(self):
+        """
+        Stops the server once the pending requests are served, and raises the error of the policy if it failed.
+        The clients must not send requests anymore.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.status.value = CLOSING
+            self.requests.release()
+            self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise RuntimeError("The policy of the inference server failed") from self.error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def run_episodes(client, env_id, seeds, env_kwargs=None, results=None):
+    """
+    Runs one episode per seed with the actions of an `InferenceClient`.
+
+    Parameters:
+    - client: The `InferenceClient` of the worker
+    - env_id: The id of the environment
+    - seeds: The seeds of the resets
+    - env_kwargs: Additional keyword arguments for `gym.make`
+    - results: Queue where the result is put when run in a worker process. If the episodes raise, the traceback is
+      put instead, so that the parent process does not wait forever for the result
+
+    Returns:
+    A tuple (number of steps, number of successful episodes, sum of the returns)
+    """
+    try:
+        env = gym.make(env_id, render_mode=None, **(env_kwargs or {}))
+        steps, successes, returns = 0, 0, 0.0
+        for seed in seeds:
+            observation, info = env.reset(seed=seed)
+            terminated = truncated = False
+            while not (terminated or truncated):
+                observation, reward, terminated, truncated, info = env.step(client(observation))
+                steps += 1
+                returns += float(reward)
+            successes += bool(info.get('is_success', False))
+        env.close()
+    except Exception:
+        if results is None:
+            raise
+        # The traceback as a string, the exception itself may not be picklable
+        results.put(traceback.format_exc())
+        return None
+    if results is not None:
+        results.put((steps, successes, returns))
+    return steps, successes, returns
+
+
+def run_episodes_parallel(policy, env_id, num_episodes, workers=1, seed=0, env_kwargs=None, max_batch=None, max_wait=0.001):
+    """
+    Runs `num_episodes` episodes split among `workers` processes, with the actions of `policy` computed by an
+    `InferenceServer` on the batches of observations of the workers.
+
+    Returns:
+    A tuple (number of steps, number of successful episodes, sum of the returns, stats of the server)
+    """
+    env = gym.make(env_id, render_mode=None, **(env_kwargs or {}))
+    observation_space, action_space = env.observation_space, env.action_space
+    env.close()
+
+    chunks = [chunk.tolist() for chunk in np.array_split(np.arange(seed, seed + num_episodes), workers) if len(chunk)]
+    server = InferenceServer(policy, observation_space, action_space, len(chunks), max_batch, max_wait)
+    results = mp.Queue()
+    processes = [mp.Process(target=run_episodes, args=(server.client(i), env_id, chunk, env_kwargs, results), daemon=True)
+                 for i, chunk in enumerate(chunks)]
+    with server:
+        for process in processes:
+            process.start()
+        try:
+            totals = []
+            while len(totals) < len(processes):
+                try:
+                    result = results.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker killed before putting its result, e.g. by a crash of the simulation
+                    crashed = [process for process in processes if process.exitcode not in (None, 0)]
+                    if crashed:
+                        raise RuntimeError(f"A worker process exited with code {crashed[0].exitcode}")
+                    continue
+                if isinstance(result, str):
+                    raise RuntimeError(f"A worker process failed:\n{result}")
+                totals.append(result)
+        except BaseException:
+            # The other workers may wait forever for actions of a failed server
+            for process in processes:
+                process.terminate()
+            raise
+        finally:
+            for process in processes:
+                process.join()
+    return tuple(sum(values) for values in zip(*totals)) + (server.stats(),)
+
+
+def main():
+    from urgym.evaluate import load_numpy_policy
+
+    parser = argparse.ArgumentParser(description="Run episodes of an URGym environment in worker processes with a batched policy")
+    parser.add_argument('policy', help="SAC checkpoint, e.g. policies_final/cubes_push_v0/SAC_policy.zip, or actor exported by urgym.numpy_actor")
+    parser.add_argument('env_id', help="Environment id, e.g. URGym/CubesPush-v0")
+    parser.add_argument('--episodes', type=int, default=100, help="Number of episodes")
+    parser.add_argument('--workers', type=int, default=mp.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first reset, the following ones use consecutive seeds")
+    parser.add_argument('--sim-substeps', type=int, default=1, help="Physics substeps per p.stepSimulation() call of the environments")
+    parser.add_argument('--max-batch', type=int, help="Maximum number of observations per call to the policy, the number of workers by default")
+    parser.add_argument('--max-wait', type=float, default=0.001, help="Maximum time in seconds between the first request of a batch and the call to the policy")
+    args = parser.parse_args()
+
+    start = time.time()
+    steps, successes, returns, stats = run_episodes_parallel(load_numpy_policy(args.policy), args.env_id, args.episodes, args.workers, args.seed,
+                                                             dict(sim_substeps=args.sim_substeps), args.max_batch, args.max_wait)
+    elapsed = time.time() - start
+    print(f"Ran {args.episodes} episodes ({steps} steps) of {args.env_id} in {elapsed:.1f} s ({steps / elapsed:.1f} steps/s)")
+    print(f"Success rate: {successes / args.episodes:.1%}, mean return: {returns / args.episodes:.2f}, "
+          f"mean batch size: {stats['mean_batch_size']:.1f}, policy time: {stats['policy_seconds']:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
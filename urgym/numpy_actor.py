@@ -0,0 +1,129 @@
+"""
+Torch-free inference of the SAC actors of stable-baselines3 checkpoints (e.g. `policies_final/*/SAC_policy.zip`).
+
+`export_sb3_actor` converts the actor MLP of a checkpoint to a plain .npz weights file, reading the checkpoint
+archive directly (torch is needed to read its weights, stable-baselines3 is not). `NumpyActor` loads that file
+and computes the deterministic actions of batches of observations with NumPy only, so rollout workers do not
+need to import torch:
+
+    python -m urgym.numpy_actor policies_final/cubes_push_v0/SAC_policy.zip cubes_push_actor.npz
+
+    actor = NumpyActor('cubes_push_actor.npz')
+    actions = actor(observations)  # (N, action_dim) for observations of shape (N, observation_dim)
+"""
+import argparse
+import io
+import json
+import zipfile
+
+import numpy as np
+
+
+def parse_space_bounds(space_data, key):
+    # Box bounds are stored as the string of the array, e.g. '[-0.1 -0.1 -0.1]'
+    return np.array(space_data[key].strip('[]').split(), dtype=np.float64)
+
+
+def read_sb3_actor(checkpoint):
+    """
+    Reads the actor weights of a stable-baselines3 SAC checkpoint, with the default ReLU activations.
+
+    Returns:
+    A dict of arrays in the format of the files of `export_sb3_actor`
+    """
+    import torch
+
+    with zipfile.ZipFile(checkpoint) as archive:
+        data = json.loads(archive.read('data'))
+        state_dict = torch.load(io.BytesIO(archive.read('policy.pth')), map_location='cpu')
+    policy_kwargs = {key: value for key, value in data['policy_kwargs'].items() if key != ':serialized:'}
+    assert 'activation_fn' not in policy_kwargs, "Only the default ReLU activations are supported"
+    weights = {key[len('actor.'):]: value.detach().cpu().numpy() for key, value in state_dict.items() if key.startswith('actor.')}
+
+    layers = sorted(int(key.split('.')[1]) for key in weights if key.startswith('latent_pi.') and key.endswith('.weight'))
+    actor = {}
+    for i, layer in enumerate(layers):
+        actor[f'weight_{i}'] = weights[f'latent_pi.{layer}.weight'].T
+        actor[f'bias_{i}'] = weights[f'latent_pi.{layer}.bias']
+    # With gSDE the mean is followed by a hard tanh clipping it to [-clip_mean, clip_mean]
+    use_sde = 'mu.0.weight' in weights
+    mu = 'mu.0' if use_sde else 'mu'
+    actor['weight_mu'] = weights[mu + '.weight'].T
+    actor['bias_mu'] = weights[mu + '.bias']
+    actor['clip_mean'] = np.array(policy_kwargs.get('clip_mean', 2.0) if use_sde else 0.0)
+    actor['action_low'] = parse_space_bounds(data['action_space'], 'low')
+    actor['action_high'] = parse_space_bounds(data['action_space'], 'high')
+    return actor
+
+
+def export_sb3_actor(checkpoint, output):
+    """
+    Writes the actor of a stable-baselines3 SAC checkpoint to a .npz file loadable by `NumpyActor`.
+    """
+    np.savez(output, **read_sb3_actor(checkpoint))
+
+
+class NumpyActor(object):
+    """
+    Deterministic SAC actor: MLP with ReLU activations, squashed with tanh and rescaled to the action space.
+    """
+
+    def __init__(self, weights, dtype=np.float32):
+        """
+        Arguments:
+            weights: String, the path of a file written by `export_sb3_actor`, or a dict of its arrays
+            dtype: The dtype of the computations, float32 like the torch actors by default
+        """
+        if isinstance(weights, str):
+            with np.load(weights) as data:
+                weights = dict(data)
+        self.dtype = np.dtype(dtype)
+        num_layers = sum(1 for key in weights if key.startswith('weight_')) - 1
+        self.layers = [(weights[f'weight_{i}'].astype(self.dtype), weights[f'bias_{i}'].astype(self.dtype)) for i in range(num_layers)]
+        self.weight_mu = weights['weight_mu'].astype(self.dtype)
+        self.bias_mu = weights['bias_mu'].astype(self.dtype)
+        self.clip_mean = float(weights['clip_mean'])
+        self.action_low = np.asarray(weights['action_low'], dtype=np.float32)
+        self.action_high = np.asarray(weights['action_high'], dtype=np.float32)
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, dtype=np.float32):
+        """
+        Loads the actor of a stable-baselines3 SAC checkpoint directly (torch is needed to read it).
+        """
+        return cls(read_sb3_actor(checkpoint), dtype)
+
+    def __call__(self, observations):
+        """
+        Returns the actions of an observation of shape (observation_dim,) or of a batch of shape (N, observation_dim).
+        """
+        hidden = np.asarray(observations, dtype=self.dtype)
+        for weight, bias in self.layers:
+            hidden = hidden @ weight
+            hidden += bias
+            np.maximum(hidden, 0, out=hidden)
+        mean = hidden @ self.weight_mu + self.bias_mu
+        if self.clip_mean > 0:
+            np.clip(mean, -self.clip_mean, self.clip_mean, out=mean)
+        # Rescaled from [-1, 1] to the bounds of the action space
+        return (self.action_low + 0.5 * (np.tanh(mean) + 1.0) * (self.action_high - self.action_low)).astype(np.float32)
+
+    def predict(self, observations, state=None, episode_start=None, deterministic=True):
+        """
+        Same signature as the `predict` of stable-baselines3 models, to use the actor in their place.
+        """
+        return self(observations), state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the actor of a stable-baselines3 SAC checkpoint to a NumPy weights file")
+    parser.add_argument('checkpoint', help="Path of the checkpoint, e.g. policies_final/cubes_push_v0/SAC_policy.zip")
+    parser.add_argument('output', help="Path of the .npz file to create")
+    args = parser.parse_args()
+
+    export_sb3_actor(args.checkpoint, args.output)
+    print(f"Exported the actor of {args.checkpoint} to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Streaming recorder of URGym episodes to chunked, columnar files.
+
+`EpisodeRecorder` wraps an environment and appends every transition to fixed-size in-memory column buffers,
+which are written to disk as soon as they are full, so the memory used does not grow with the number of
+recorded transitions. A recording is a directory with:
+
+    metadata.json                   The columns of each table and the list of their chunks, rewritten after each chunk
+    transitions_000000.npz          One chunk of the transitions table, one array per column
+    episodes_000000.npz             One chunk of the episodes table
+    ...
+
+With `compress=False` each chunk is instead a directory with one `.npy` file per column, which can be
+memory-mapped when the recording is read. The transitions table holds, for each step, the episode and step
+indices, the observation and the simulation state before the action, the action, the reward, the termination
+flags and the numeric entries of the info. The episodes table holds, for each episode, its first row in the
+transitions table, its length, its return and the observation and simulation state after its last step.
+
+    env = EpisodeRecorder(gym.make('URGym/CubesPush-v0'), 'cubes_push_data')
+    ...
+    env.close()  # Writes the last, partial chunks
+"""
+import json
+import os
+
+import numpy as np
+import gymnasium as gym
+from gymnasium.spaces import Box, Dict
+
+from urgym.base.state_bank import read_scene_state
+
+
+METADATA_FILE = 'metadata.json'
+FORMAT_VERSION = 1
+
+
+def flatten_space(space, prefix):
+    """
+    Returns the columns of the values of a Box or Dict space, as a dict of name -> (dtype, shape). The entries of
+    Dict spaces become the columns `prefix.key`.
+    """
+    if isinstance(space, Dict):
+        columns = {}
+        for key, subspace in space.spaces.items():
+            columns.update(flatten_space(subspace, f"{prefix}.{key}"))
+        return columns
+    if not isinstance(space, Box):
+        raise TypeError(f"Only Box and Dict spaces can be recorded, got {space}")
+    return {prefix: (np.dtype(space.dtype), space.shape)}
+
+
+def flatten_value(value, prefix, out):
+    """
+    Adds the columns of a value of a space flattened by `flatten_space` to the dict `out`.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten_value(item, f"{prefix}.{key}", out)
+    else:
+        out[prefix] = value
+    return out
+
+
+def flatten_state(state, prefix, out):
+    """
+    Adds the fields of a scene state of `read_scene_state` to the dict `out`, as the columns `prefix.field`.
+    """
+    for field in state.dtype.names:
+        out[f"{prefix}.{field}"] = state[field]
+    return out
+
+
+def state_columns(state, prefix):
+    return {f"{prefix}.{field}": (state.dtype[field].base, state.dtype[field].shape) for field in state.dtype.names}
+
+
+def info_columns(info):
+    """
+    Returns the columns of the numeric entries of an info dict (numbers, booleans and arrays of them), the other
+    entries are not recorded.
+    """
+    columns = {}
+    for key, value in info.items():
+        value = np.asarray(value)
+        if value.dtype.kind in 'biuf':
+            columns[f"info.{key}"] = (value.dtype, value.shape)
+    return columns
+
+
+class ChunkedTable(object):
+    """
+    Table of fixed-shape columns appended row by row and written to disk in chunks of `chunk_size` rows.
+    """
+
+    def __init__(self, path, name, columns, chunk_size, compress):
+        """
+        Arguments:
+            path: String, the directory of the recording
+            name: String, the name of the table, the prefix of its chunk files
+            columns: Dict of column name -> (dtype, shape) of one row
+            chunk_size: Int, the number of rows of each chunk
+            compress: Boolean, whether to write compressed .npz chunks instead of directories of .npy files
+
+        Attributes:
+            buffers: Dict, the preallocated buffer of each column for the current chunk
+            size: Int, the number of rows in the buffers
+            chunks: List of dicts with the file name and the number of rows of each written chunk
+        """
+        self.path = path
+        self.name = name
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.buffers = {column: np.zeros((chunk_size,) + tuple(shape), dtype=dtype) for column, (dtype, shape) in columns.items()}
+        self.size = 0
+        self.chunks = []
+
+    def __len__(self):
+        return sum(chunk['length'] for chunk in self.chunks) + self.size
+
+    def append(self, row):
+        """
+        Appends a row, a dict with a value for each column. Missing columns are left at zero.
+        """
+        for column, buffer in self.buffers.items():
+            if column in row:
+                buffer[self.size] = row[column]
+            else:
+                buffer[self.size] = 0
+        self.size += 1
+        if self.size == self.chunk_size:
+            return self.flush()
+        return False
+
+    def flush(self):
+        """
+        Writes the rows in the buffers as a new chunk. Returns True if a chunk was written.
+        """
+        if self.size == 0:
+            return False
+        file = f"{self.name}_{len(self.chunks):06d}"
+        data = {column: buffer[:self.size] for column, buffer in self.buffers.items()}
+        if self.compress:
+            np.savez_compressed(os.path.join(self.path, file + '.npz'), **data)
+        else:
+            os.makedirs(os.path.join(self.path, file))
+            for column, values in data.items():
+                np.save(os.path.join(self.path, file, column + '.npy'), values)
+        self.chunks.append({'file': file, 'length': self.size})
+        self.size = 0
+        return True
+
+    def metadata(self):
+        return {'columns': {column: {'dtype': dtype.str, 'shape': list(shape)} for column, (dtype, shape) in self.columns.items()},
+                'chunks': self.chunks}
+
+
+class EpisodeRecorder(gym.Wrapper):
+    """
+    Wrapper that streams the transitions and episodes of an environment to a recording directory, see the
+    module documentation for the format.
+    """
+
+    def __init__(self, env, path, chunk_size: int = 65536, compress: bool = True, record_state: bool = True) -> None:
+        """
+        Parameters:
+        - env: The environment to record, with a Box or Dict observation space and a Box action space
+        - path (str): The directory of the recording, created if needed. It must not contain a recording already.
+        - chunk_size (int): Number of transitions kept in memory before writing a chunk. Default is 65536.
+        - compress (bool): Whether to write compressed .npz chunks, or uncompressed .npy files that can be memory-mapped. Default is True.
+        - record_state (bool): Whether to record the full simulation state (joints, last commands and poses and velocities of the scene bodies). Default is True.
+        """
+        super().__init__(env)
+        assert not os.path.exists(os.path.join(path, METADATA_FILE)), f"{path} already contains a recording"
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.record_state = record_state
+        if record_state:
+            assert hasattr(env.unwrapped, 'get_scene_bodies'), "The environment does not support recording its simulation state"
+
+        self.observation_columns = flatten_space(env.observation_space, 'observation')
+        self.action_columns = flatten_space(env.action_space, 'action')
+        # The tables are created at the first step, once the entries of the infos are known
+        self.transitions = None
+        self.episodes = None
+
+        self.episode = -1
+        self.episode_start = 0
+        self.episode_steps = 0
+        self.episode_return = 0.0
+        self.last_flags = (False, False)
+        self.current = None # The columns of the observation and state before the next action
+
+    def read_state(self):
+        env = self.env.unwrapped
+        return read_scene_state(env.robot, env.get_scene_bodies())
+
+    def current_columns(self, observation):
+        # Copied, the observation may be an in-place buffer that the next step overwrites
+        columns = flatten_value(observation, 'observation', {})
+        columns = {column: np.array(value) for column, value in columns.items()}
+        if self.record_state:
+            flatten_state(self.read_state(), 'state', columns)
+        return columns
+
+    def create_tables(self, info):
+        columns = {'episode': (np.dtype(np.int64), ()), 'step': (np.dtype(np.int32), ())}
+        columns.update(self.observation_columns)
+        episode_columns = {'episode': (np.dtype(np.int64), ()), 'start': (np.dtype(np.int64), ()), 'length': (np.dtype(np.int64), ()),
+                           'return': (np.dtype(np.float64), ()), 'terminated': (np.dtype(np.bool_), ()), 'truncated': (np.dtype(np.bool_), ())}
+        episode_columns.update({'final_' + column: spec for column, spec in self.observation_columns.items()})
+        if self.record_state:
+            state = self.read_state()
+            columns.update(state_columns(state, 'state'))
+            episode_columns.update(state_columns(state, 'final_state'))
+        columns.update(self.action_columns)
+        columns.update({'reward': (np.dtype(np.float64), ()), 'terminated': (np.dtype(np.bool_), ()), 'truncated': (np.dtype(np.bool_), ())})
+        columns.update(info_columns(info))
+        self.transitions = ChunkedTable(self.path, 'transitions', columns, self.chunk_size, self.compress)
+        self.episodes = ChunkedTable(self.path, 'episodes', episode_columns, self.chunk_size, self.compress)
+
+    def reset(self, **kwargs):
+        self.end_episode()
+        observation, info = self.env.reset(**kwargs)
+        self.episode += 1
+        self.episode_start = len(self.transitions) if self.transitions is not None else 0
+        self.episode_steps = 0
+        self.episode_return = 0.0
+        self.last_flags = (False, False)
+        self.current = self.current_columns(observation)
+        return observation, info
+
+    def step(self, action):
+        assert self.current is not None, "The environment must be reset before stepping"
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        if self.transitions is None:
+            self.create_tables(info)
+
+        row = self.current
+        row['episode'] = self.episode
+        row['step'] = self.episode_steps
+        flatten_value(action, 'action', row)
+        row['reward'] = reward
+        row['terminated'] = terminated
+        row['truncated'] = truncated
+        for key, value in info.items():
+            row[f"info.{key}"] = value
+        if self.transitions.append(row):
+            self.write_metadata()
+
+        self.episode_steps += 1
+        self.episode_return += float(reward)
+        self.last_flags = (bool(terminated), bool(truncated))
+        self.current = self.current_columns(observation)
+        return observation, reward, terminated, truncated, info
+
+    def end_episode(self):
+        """
+        Appends the current episode to the episodes table, if it has any step.
+        """
+        if self.episode_steps == 0:
+            return
+        row = {'final_' + column: value for column, value in self.current.items()}
+        row.update({'episode': self.episode, 'start': self.episode_start, 'length': self.episode_steps, 'return': self.episode_return,
+                    'terminated': self.last_flags[0], 'truncated': self.last_flags[1]})
+        if self.episodes.append(row):
+            self.write_metadata()
+        self.episode_steps = 0
+
+    def flush(self):
+        """
+        Writes the buffered transitions and episodes to disk, as new (possibly partial) chunks.
+        """
+        if self.transitions is None:
+            return
+        self.transitions.flush()
+        self.episodes.flush()
+        self.write_metadata()
+
+    def write_metadata(self):
+        metadata = {'version': FORMAT_VERSION,
+                    'env_id': self.env.spec.id if self.env.spec is not None else None,
+                    'compressed': self.compress,
+                    'tables': {'transitions': self.transitions.metadata(), 'episodes': self.episodes.metadata()}}
+        # Replaced atomically, so the recording stays readable if the process is interrupted
+        temporary_path = os.path.join(self.path, METADATA_FILE + '.tmp')
+        with open(temporary_path, 'w') as f:
+            json.dump(metadata, f, indent=1)
+        os.replace(temporary_path, os.path.join(self.path, METADATA_FILE))
+
+    def close(self):
+        if self.transitions is not None:
+            self.end_episode()
+            self.flush()
+        return super().close()
@@ -0,0 +1,266 @@
+"""
+Vectorized URGym environments running in worker processes.
+
+Each worker owns one environment created with `gymnasium.make` from any of the ids registered
+in `urgym.envs`. Observations, actions, rewards and termination flags are exchanged through
+preallocated shared-memory NumPy buffers, so the pipes only carry the commands and the
+(small) info dictionaries.
+"""
+import multiprocessing as mp
+from copy import deepcopy
+from typing import Optional, Union
+
+import numpy as np
+import gymnasium as gym
+from gymnasium.spaces import Box, Dict
+from gymnasium.vector import VectorEnv
+
+import urgym.envs  # Registers the URGym ids, also in spawned workers
+
+
+def create_shared_buffer(space, num_envs: int, ctx):
+    """
+    Allocates a raw shared-memory buffer able to hold one value of `space` per environment.
+
+    Parameters:
+    - space: A Box space or a Dict space of Box spaces
+    - num_envs: The number of environments
+    - ctx: The multiprocessing context used to allocate the buffer
+
+    Returns:
+    A RawArray, or a dict of RawArrays for Dict spaces
+    """
+    if isinstance(space, Dict):
+        return {key: create_shared_buffer(subspace, num_envs, ctx) for key, subspace in space.spaces.items()}
+    if not isinstance(space, Box):
+        raise TypeError(f"Shared-memory buffers only support Box and Dict spaces, got {space}")
+    nbytes = num_envs * int(np.prod(space.shape)) * np.dtype(space.dtype).itemsize
+    return ctx.RawArray('b', nbytes)
+
+
+def shared_buffer_to_array(buffer, space, num_envs: int):
+    """
+    Returns a NumPy view of shape (num_envs, *space.shape) over a buffer created by `create_shared_buffer`.
+    """
+    if isinstance(space, Dict):
+        return {key: shared_buffer_to_array(buffer[key], subspace, num_envs) for key, subspace in space.spaces.items()}
+    return np.frombuffer(buffer, dtype=space.dtype).reshape((num_envs,) + space.shape)
+
+
+def _write_to_array(array, index, value):
+    if isinstance(array, dict):
+        for key in array:
+            _write_to_array(array[key], index, value[key])
+    else:
+        array[index] = value
+
+
+def _worker(index, env_id, env_kwargs, pipe, parent_pipe, buffers, observation_space, action_space, num_envs):
+    parent_pipe.close()
+    env = gym.make(env_id, **env_kwargs)
+
+    observations = shared_buffer_to_array(buffers['observations'], observation_space, num_envs)
+    actions = shared_buffer_to_array(buffers['actions'], action_space, num_envs)
+    rewards = np.frombuffer(buffers['rewards'], dtype=np.float64)
+    terminateds = np.frombuffer(buffers['terminateds'], dtype=np.bool_)
+    truncateds = np.frombuffer(buffers['truncateds'], dtype=np.bool_)
+
+    # Environments with in place observations write them straight into their row of the shared buffer
+    if getattr(env.unwrapped, 'obs_buffer', False):
+        # The flat observation is the 'observation' entry of goal-conditioned environments
+        flat_observations = observations['observation'] if isinstance(observations, dict) else observations
+        env.unwrapped.observation_buffer.bind(flat_observations[index])
+
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == 'reset':
+                seed, options = data
+                observation, info = env.reset(seed=seed, options=options)
+                _write_to_array(observations, index, observation)
+                pipe.send((info, True))
+            elif command == 'step':
+                observation, reward, terminated, truncated, info = env.step(actions[index])
+                if terminated or truncated:
+                    # The observation may be a buffer overwritten by the reset
+                    final_observation, final_info = deepcopy(observation), info
+                    observation, info = env.reset()
+                    info['final_observation'] = final_observation
+                    info['final_info'] = final_info
+                _write_to_array(observations, index, observation)
+                rewards[index] = reward
+                terminateds[index] = terminated
+                truncateds[index] = truncated
+                pipe.send((info, True))
+            elif command == 'call':
+                name, args, kwargs = data
+                attribute = env.unwrapped
+                for part in name.split('.'): # Dotted names reach nested attributes, e.g. 'settle_detector.total_substeps'
+                    attribute = getattr(attribute, part)
+                if callable(attribute):
+                    attribute = attribute(*args, **kwargs)
+                pipe.send((attribute, True))
+            elif command == 'close':
+                pipe.send((None, True))
+                break
+            else:
+                raise RuntimeError(f"Received unknown command `{command}`")
+    except (KeyboardInterrupt, Exception) as e:
+        pipe.send((f"{type(e).__name__}: {e}", False))
+    finally:
+        env.close()
+
+
+class SharedMemoryVectorEnv(VectorEnv):
+    """
+    Runs `num_envs` copies of a registered URGym environment, each one in its own process.
+
+    Sub-environments are reset automatically at the end of an episode, the final observation
+    and info are then available in `infos['final_observation']` and `infos['final_info']`.
+    """
+
+    def __init__(self, env_id: str, num_envs: int, context: Optional[str] = None, copy: bool = True, daemon: bool = True, **env_kwargs) -> None:
+        """
+        Initialize the vector environment.
+
+        Parameters:
+        - env_id (str): The id of the environment, e.g. 'URGym/CubesPush-v0'.
+        - num_envs (int): The number of worker processes/environments.
+        - context (str): The multiprocessing start method ('fork', 'spawn', 'forkserver'). Default is the platform default.
+        - copy (bool): Whether to return copies of the shared observations or views over them. Default is True.
+        - daemon (bool): Whether the workers are daemonic processes. Default is True.
+        - env_kwargs: Extra arguments for `gymnasium.make`. The render mode is None unless stated otherwise.
+        """
+        env_kwargs.setdefault('render_mode', None)
+        self.env_id = env_id
+        self.copy = copy
+
+        # The spaces are taken from a throwaway instance so buffers can be allocated before the workers start
+        dummy_env = gym.make(env_id, **env_kwargs)
+        single_observation_space = dummy_env.observation_space
+        single_action_space = dummy_env.action_space
+        dummy_env.close()
+        del dummy_env
+
+        super().__init__(num_envs, single_observation_space, single_action_space)
+
+        ctx = mp.get_context(context)
+        self._buffers = dict(
+            observations=create_shared_buffer(single_observation_space, num_envs, ctx),
+            actions=create_shared_buffer(single_action_space, num_envs, ctx),
+            rewards=ctx.RawArray('d', num_envs),
+            terminateds=ctx.RawArray('b', num_envs),
+            truncateds=ctx.RawArray('b', num_envs),
+        )
+        self._observations = shared_buffer_to_array(self._buffers['observations'], single_observation_space, num_envs)
+        self._actions = shared_buffer_to_array(self._buffers['actions'], single_action_space, num_envs)
+        self._rewards = np.frombuffer(self._buffers['rewards'], dtype=np.float64)
+        self._terminateds = np.frombuffer(self._buffers['terminateds'], dtype=np.bool_)
+        self._truncateds = np.frombuffer(self._buffers['truncateds'], dtype=np.bool_)
+
+        self.parent_pipes, self.processes = [], []
+        for index in range(num_envs):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                name=f"URGymWorker-{index}",
+                args=(index, env_id, env_kwargs, child_pipe, parent_pipe, self._buffers,
+                      single_observation_space, single_action_space, num_envs),
+                daemon=daemon,
+            )
+            self.parent_pipes.append(parent_pipe)
+            self.processes.append(process)
+            process.start()
+            child_pipe.close()
+
+        self._waiting = None
+
+    def reset_async(self, seed: Optional[Union[int, list]] = None, options: Optional[dict] = None):
+        self._assert_not_waiting()
+        if seed is None:
+            seed = [None] * self.num_envs
+        elif isinstance(seed, int):
+            seed = [seed + i for i in range(self.num_envs)]
+        assert len(seed) == self.num_envs
+
+        for pipe, single_seed in zip(self.parent_pipes, seed):
+            pipe.send(('reset', (single_seed, options)))
+        self._waiting = 'reset'
+
+    def reset_wait(self, seed: Optional[Union[int, list]] = None, options: Optional[dict] = None):
+        infos = self._receive_infos('reset')
+        return self._get_observations(), infos
+
+    def step_async(self, actions):
+        self._assert_not_waiting()
+        _write_to_array(self._actions, slice(None), actions)
+        for pipe in self.parent_pipes:
+            pipe.send(('step', None))
+        self._waiting = 'step'
+
+    def step_wait(self):
+        infos = self._receive_infos('step')
+        rewards = self._rewards.copy()
+        terminateds = self._terminateds.copy()
+        truncateds = self._truncateds.copy()
+        return self._get_observations(), rewards, terminateds, truncateds, infos
+
+    def call_async(self, name: str, *args, **kwargs):
+        self._assert_not_waiting()
+        for pipe in self.parent_pipes:
+            pipe.send(('call', (name, args, kwargs)))
+        self._waiting = 'call'
+
+    def call_wait(self, timeout=None) -> tuple:
+        results = self._receive('call')
+        return tuple(results)
+
+    def close_extras(self, timeout=None, terminate=False):
+        if terminate:
+            for process in self.processes:
+                if process.is_alive():
+                    process.terminate()
+        else:
+            if self._waiting is not None:
+                self._receive(self._waiting)
+            for pipe in self.parent_pipes:
+                if not pipe.closed:
+                    pipe.send(('close', None))
+            for pipe in self.parent_pipes:
+                if not pipe.closed:
+                    pipe.recv()
+        for pipe in self.parent_pipes:
+            pipe.close()
+        for process in self.processes:
+            process.join(timeout)
+
+    def _get_observations(self):
+        if self.copy:
+            return deepcopy(self._observations)
+        return self._observations
+
+    def _receive_infos(self, command):
+        infos = {}
+        for index, info in enumerate(self._receive(command)):
+            infos = self._add_info(infos, info, index)
+        return infos
+
+    def _receive(self, command):
+        if self._waiting != command:
+            raise RuntimeError(f"Calling `{command}_wait` without any prior call to `{command}_async`.")
+        results, errors = [], []
+        for index, pipe in enumerate(self.parent_pipes):
+            result, success = pipe.recv()
+            if success:
+                results.append(result)
+            else:
+                errors.append(f"Worker {index}: {result}")
+        self._waiting = None
+        if errors:
+            self.close(terminate=True)
+            raise RuntimeError("Error in URGym worker processes:\n" + "\n".join(errors))
+        return results
+
+    def _assert_not_waiting(self):
+        if self._waiting is not None:
+            raise RuntimeError(f"Calling a new command while waiting for a pending call to `{self._waiting}` to complete.")